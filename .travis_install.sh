@@ -1,4 +1,4 @@
-sudo apt-get install python-numpy glpk
+sudo apt-get install python-numpy python-scipy glpk
 pip install --use-mirrors .
 
 if [ x"$FULL_DEPS" == x"true" ]; then
@@ -1,9 +1,8 @@
 import numpy as np
 from commonscripts import update_attributes, pairwise
-from optimization import value, OptimizationObject
+from optimization import value, values_array, OptimizationObject
 from config import user_config
 import re
-from coopr.pyomo import Piecewise
 
 
 class Bid(OptimizationObject):
@@ -33,6 +32,7 @@ class Bid(OptimizationObject):
             self.build_model()
 
     def build_model(self):
+        Piecewise = self._parent_problem()._backend.Piecewise
         if self.bid_points is None:
 
             self.is_pwl = False
@@ -116,6 +116,19 @@ class Bid(OptimizationObject):
 
         return out
 
+    def output_values(self, keys, scenario=None):
+        '''the solved output at the (time) keys, as an array'''
+        status = values_array(self.status_variable(None, scenario), keys)
+        if self.is_linear:
+            out = self.polynomial[1] * \
+                values_array(self.input_variable(None, scenario), keys)
+        else:
+            out = values_array(self.get_variable('cost',
+                time=None, scenario=scenario, indexed=True), keys)
+        if self.constant_term != 0:
+            out = out + status * self.constant_term
+        return out
+
     def output_true(self, input_var, force_linear=False):
         '''true output value of bid'''
         input_val = value(input_var)
@@ -84,7 +84,7 @@ def gen_time_dataframe(generators, times, values=()):
     except AttributeError:
         kwargs['index'] = times
 
-    if values:
+    if len(values):
         values = np.array(values)
         if values.shape != (len(times), len(generators)):
             values = values.T
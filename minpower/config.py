@@ -25,10 +25,19 @@ option_types = dict(
     cost_load_shedding=float,
     cost_wind_shedding=float,
     economic_wind_shed=bool,
+    elastic_shedding=bool,
+    feasibility_screen=bool,
     dispatch_decommit_allowed=bool,
+    uc_formulation=str,
+    cluster_generators=bool,
+    lagrangian=bool,
+    lagrangian_iterations=int,
     solver=str,
     mipgap=float,
     solver_time_limit=float,
+    backend=str,
+    warmstart=bool,
+    solver_session=bool,
     
     reserve_fixed=float,
     reserve_load_fraction=float,
@@ -36,21 +45,35 @@ option_types = dict(
     faststart_resolve=bool,
 
     visualization=bool,
+    solution_quantities=str,
+    output_format=str,
     logging_level=int,
     problem_file=bool,
     output_prefix=bool,
     debugger=bool,
 
     scenarios=int,
+    scenario_reduction=str,
     deterministic_solve=bool,
     perfect_solve=bool,
     scenarios_directory=str,
     cvar_weight=float,
     cvar_confidence_level=float,
+    native_ef=bool,
+    progressive_hedging=bool,
+    ph_iterations=int,
+    ph_rho=float,
         
     
     standalone=bool,
+    standalone_fork=bool,
+    standalone_worker_stages=int,
+    standalone_worker_memory=int,
     pid=str,
+    reuse_model=bool,
+    ptdf=bool,
+    lazy_line_limits=bool,
+    contingency_screening=bool,
     standalone_restart=bool,
 
     wind_forecast_adder=float,
@@ -203,6 +226,16 @@ def setup_parser_args(parser):
         help='the MIP gap solution tolerence')
     add_opt(solver_opt, 'solver_time_limit', 
         help='the MIP solver time limit (in seconds)')
+    add_opt(solver_opt, 'backend',
+        help='the modeling backend: pyomo or matrix ' + \
+        '(a sparse matrix LP/MIP model, for deterministic problems)')
+    add_opt(solver_opt, 'warmstart',
+        help='start the solver from the previous stage solution ' + \
+        'or the current solution (for solvers which accept a MIP start)')
+    add_opt(solver_opt, 'solver_session',
+        help='keep the problem loaded in an in-process GLPK session ' + \
+        'between solves (requires the glpk solver, the matrix backend ' + \
+        'and swiglpk)')
 
         
     reserve = parser.add_argument_group('Reserve',
@@ -230,6 +263,9 @@ def setup_parser_args(parser):
         'options to modify the behavior of a stochastic problem')
     add_opt(stochastic, 'scenarios',
         help='limit the number of scenarios to N')        
+    add_opt(stochastic, 'scenario_reduction',
+        help='how to select the N scenarios: truncate (the first N), ' + \
+        'fast_forward or backward (reduction to the most representative N)')
     add_opt(stochastic, 'faststart_resolve', '-F',
         help="""allow faststart units which are off to be
                 started up during resolve with observed wind values""")
@@ -246,10 +282,69 @@ def setup_parser_args(parser):
         help='weighting term for CVaR. The default 0 -- this corresponds to an expected value objective function')
     add_opt(stochastic, 'cvar_confidence_level',
         help='confidence level term for a CVaR objective formulation')
+    add_opt(stochastic, 'native_ef',
+        help='build the extensive form with one status variable shared ' + \
+        'by all scenarios (instead of copies tied by equality constraints)')
+    add_opt(stochastic, 'progressive_hedging',
+        help='solve each scenario separately (in parallel) by progressive ' + \
+        'hedging, instead of solving the extensive form')
+    add_opt(stochastic, 'ph_iterations',
+        help='the maximum number of progressive hedging iterations')
+    add_opt(stochastic, 'ph_rho',
+        help='the progressive hedging penalty, as a fraction of the ' + \
+        'expected cost (per status variable)')
     
 
     add_opt(parser, 'standalone', '-m', 
         help='Make each multi-day commitment its own subprocess (helps with memory issues).')
+    add_opt(parser, 'standalone_fork',
+        help='solve the standalone stages in worker processes forked from ' + \
+        'the loaded parent process (instead of a new process for each stage)')
+    add_opt(parser, 'standalone_worker_stages',
+        help='the number of stages a forked standalone worker solves ' + \
+        'before it is replaced')
+    add_opt(parser, 'standalone_worker_memory',
+        help='replace the forked standalone worker when its memory use ' + \
+        'passes this limit (MB, 0 for no limit)')
+    add_opt(parser, 'reuse_model',
+        help='build the model once and reuse it for each stage of a rolling UC ' + \
+        '(only the schedules and initial conditions are updated)')
+    add_opt(parser, 'elastic_shedding',
+        help='always create the shedding variables (fixed at zero shedding), ' + \
+        'so that allowing shedding does not rebuild the model')
+    add_opt(parser, 'uc_formulation',
+        help='the unit commitment formulation: status (status variables only) ' + \
+        'or three_binary (with startup and shutdown variables, a tighter relaxation)')
+    add_opt(parser, 'cluster_generators',
+        help='model groups of identical generators (with linear costs) ' + \
+        'as single units with an integer commitment')
+    add_opt(parser, 'lagrangian',
+        help='find the commitment by Lagrangian relaxation (a dynamic ' + \
+        'program for each unit, in parallel), then solve the dispatch')
+    add_opt(parser, 'lagrangian_iterations',
+        help='the number of subgradient iterations for the Lagrangian relaxation')
+    add_opt(parser, 'feasibility_screen',
+        help='check the stage for infeasible times (net load outside of the ' + \
+        'generation limits) before solving and go directly to shedding')
+    add_opt(parser, 'ptdf',
+        help='model the network with power transfer distribution factors ' + \
+        '(no bus angles and a single system power balance)')
+    add_opt(parser, 'lazy_line_limits',
+        help='add line limits only for the overloaded lines and times ' + \
+        '(and re-solve until no lines are overloaded)')
+    add_opt(parser, 'contingency_screening',
+        help='N-1 security: screen the flows after each single line outage ' + \
+        '(using LODFs) and add limits for the overloaded lines')
+    add_opt(parser, 'solution_quantities',
+        help='the solution quantities kept for each stage: all, or a comma ' + \
+        'separated list of outputs, costs, truecost, incremental_cost, ' + \
+        'shedding and prices (the others are only read from the model on ' + \
+        'first use, which is not possible after the stage model changes). ' + \
+        'For standalone runs, all is the stored outputs, costs and shedding')
+    add_opt(parser, 'output_format',
+        help='the results file format: csv (spreadsheets) or npz ' + \
+        '(compressed numpy arrays of the power, status, costs, shedding ' + \
+        'and prices, with a json manifest)')
     add_opt(parser, 'output_prefix', '-p',
         help='Prefix all results files with the process id (for a record of simulataneous solves)')
     add_opt(parser, 'pid', 
@@ -1,12 +1,15 @@
+import numpy as np
 import pandas as pd
 import logging
 from config import user_config
 from commonscripts import update_attributes, bool_to_int, set_trace
 
-from optimization import value, OptimizationObject
+from optimization import value, values_array, OptimizationObject
 from schedule import is_init
 import bidding
 
+from coopr import pyomo
+
 
 class Generator(OptimizationObject):
     """
@@ -35,6 +38,8 @@ class Generator(OptimizationObject):
     :param index: numbering of the generator
     :param bus: bus name that the generator is connected to
     """
+    # the number of identical units modeled (see :class:`Generator_Cluster`)
+    count = 1
 
     def __init__(self, kind='generic',
                  pmin=0, pmax=500,
@@ -75,20 +80,21 @@ class Generator(OptimizationObject):
         self.is_controllable = True
         self.is_stochastic = False
         self.commitment_problem = True
+        self.initial_parameters = False
         self.build_cost_model()
         self.init_optimization()
 
     def power(self, time=None, scenario=None):
         '''real power output at time'''
         if time is not None and is_init(time):
-            return self.initial_power
+            return self.initial_condition('power')
         else:
             return self.get_variable('power', time, scenario=scenario, indexed=True)
 
     def power_available(self, time=None, scenario=None):
         '''power availble (constrained by pmax, ramprate, ...) at time'''
         if time is not None and is_init(time):
-            return self.initial_power
+            return self.initial_condition('power')
 
         var_name = 'power_available' if self.commitment_problem \
             and self.reserve_required else 'power'
@@ -98,20 +104,40 @@ class Generator(OptimizationObject):
         '''on/off status at time'''
         if self.commitment_problem or user_config.dispatch_decommit_allowed:
             if time is not None and is_init(time):
-                return self.initial_status
+                return self.initial_condition('status')
             else:
                 return self.get_variable('status', time, scenario=scenario, indexed=True)
         else:
-            return 1
+            return self.count
+
+    def startup(self, time, scenario=None):
+        '''is the unit started up at time (three binary formulation)'''
+        return self.get_variable('startup', time,
+            scenario=scenario, indexed=True)
+
+    def shutdown(self, time, scenario=None):
+        '''is the unit shut down at time (three binary formulation)'''
+        return self.get_variable('shutdown', time,
+            scenario=scenario, indexed=True)
 
     def status_change(self, t, times):
         '''is the unit changing status between t and t-1'''
         if t > 0:
             previous_status = self.status(times[t - 1])
         else:
-            previous_status = self.initial_status
+            previous_status = self.initial_condition('status')
         return self.status(times[t]) - previous_status
 
+    def initial_condition(self, name):
+        '''
+        initial power or status - a parameter when
+        the model is reused for multiple stages
+        '''
+        if self.initial_parameters:
+            return self.get_parameter('initial_' + name, None, indexed=True)
+        else:
+            return getattr(self, 'initial_' + name)
+
 
     def cost(self, time, scenario=None, evaluate=False):
         '''total cost at time (operating + startup + shutdown)'''
@@ -147,12 +173,33 @@ class Generator(OptimizationObject):
         '''change in cost with change in power at time (based on exact bid polynomial).'''
         return self.bids.output_incremental(self.power(time, scenario)) if value(self.status(time, scenario)) else None
 
+    def bulk_values(self, method, keys, scenario=None):
+        '''
+        The solved power, status, cost or operatingcost at the
+        (time) keys, read from the variables in one pass as an array.
+        '''
+        if method not in ['cost', 'operatingcost']:
+            return values_array(getattr(self, method)(None, scenario), keys)
+        out = self.bids.output_values(keys, scenario)
+        if method == 'cost' and self.commitment_problem:
+            if self.startupcost != 0:
+                out = out + values_array(self.get_variable('startupcost',
+                    time=None, scenario=scenario, indexed=True), keys)
+            if self.shutdowncost != 0:
+                out = out + values_array(self.get_variable('shutdowncost',
+                    time=None, scenario=scenario, indexed=True), keys)
+        return out
+
     def cost_first_stage(self, times):
         return sum(self.cost_startup(time) + self.cost_shutdown(time) for time in times)
 
     def cost_second_stage(self, times):
         return sum(self.operatingcost(time) for time in times)
 
+    def solution_status(self, status):
+        '''the status of the generator in a solution status table'''
+        return status[str(self)]
+
     def getstatus(self, tend, times, status):
         return dict(
             status=value(self.status(tend)),
@@ -162,24 +209,8 @@ class Generator(OptimizationObject):
     def gethrsinstatus(self, times, stat):
         if not self.is_controllable:
             return 0
-
-        end_status = stat.ix[stat.index[-1]]
-
-        if (stat == end_status).all():
-            intervals = len(stat)
-            hrs = intervals * times.intervalhrs
-            if self.initial_status == end_status:
-                hrs += self.initial_status_hours
-        else:
-            noneq = stat[stat != end_status]
-            if len(noneq) == 0:
-                intervals = 0
-            else:
-                intervals = len(stat.ix[noneq.index[-1]:]) - 1
-
-            hrs = intervals * times.intervalhrs
-
-        return hrs
+        return hours_in_status(stat, times,
+            self.initial_status, self.initial_status_hours)
 
     def set_initial_condition(self, power=None, 
         status=True, hoursinstatus=100):
@@ -247,71 +278,161 @@ class Generator(OptimizationObject):
         Also create the :class:`bidding.Bid` objects and their variables.
         '''
         self.commitment_problem = len(times) > 1
-        self.add_variable('power', index=times.set, low=0, high=self.pmax)
+        self.add_variable('power', index=times.set,
+            low=0, high=self.pmax * self.count)
+
+        # initial conditions are parameters if the model will be reused
+        self.initial_parameters = self.commitment_problem and \
+            self._parent_problem().reuse_model
+        if self.initial_parameters:
+            self.add_parameter('initial_power', values=self.initial_power)
+            self.add_parameter('initial_status', values=self.initial_status)
 
         if self.commitment_problem or user_config.dispatch_decommit_allowed:
-            self.add_variable('status', index=times.set, kind='Binary',
-                              fixed_value=1 if self.mustrun else None)
+            self.add_variable('status', index=times.set,
+                              fixed_value=self.count if self.mustrun else None,
+                              **self._commitment_kind())
+
+        formulation = user_config.uc_formulation
+        if formulation not in uc_formulations:
+            raise ValueError(
+                'unknown unit commitment formulation "{}"'.format(formulation))
+        # clusters always use startup and shutdown counts
+        self.three_binary = self.commitment_problem and \
+            (formulation == 'three_binary' or self.count > 1)
+        if self.three_binary:
+            self.add_variable('startup', index=times.set,
+                **self._commitment_kind())
+            self.add_variable('shutdown', index=times.set,
+                **self._commitment_kind())
 
         if self.commitment_problem:
             # power_available exists for easier reserve requirement
             self.reserve_required = self._parent_problem().reserve_required
             if self.reserve_required:
-                self.add_variable(
-                    'power_available', index=times.set, low=0, high=self.pmax)
+                self.add_variable('power_available', index=times.set,
+                    low=0, high=self.pmax * self.count)
             if self.startupcost > 0:
                 self.add_variable('startupcost', index=times.set,
-                                  low=0, high=self.startupcost)
+                                  low=0, high=self.startupcost * self.count)
             if self.shutdowncost > 0:
                 self.add_variable('shutdowncost', index=times.set,
-                                  low=0, high=self.shutdowncost)
+                                  low=0, high=self.shutdowncost * self.count)
 
         self.bids = bidding.Bid(times=times, **self.bid_params)
         return
 
+    def _commitment_kind(self):
+        '''the kind of commitment variables (an integer count for clusters)'''
+        if self.count == 1:
+            return dict(kind='Binary')
+        return dict(kind='Integer', low=0, high=self.count)
+
     def create_objective(self, times):
         return sum(self.cost(time) for time in times)
 
+    def _initial_min_intervals(self, times):
+        '''
+        the number of intervals the unit must remain on (or off)
+        at the start of the times, due to its initial status
+        '''
+        tEnd = len(times)
+        if self.minuptime > 0:
+            up_intervals_remaining = roundoff((self.minuptime - self.initial_status_hours) / times.intervalhrs)
+            min_up_intervals_remaining_init = int(
+                min(tEnd, up_intervals_remaining * (self.initial_status > 0)))
+        else:
+            min_up_intervals_remaining_init = 0
+        if self.mindowntime > 0:
+            down_intervals_remaining = roundoff((self.mindowntime - self.initial_status_hours) / times.intervalhrs)
+            min_down_intervals_remaining_init = int(min(tEnd, down_intervals_remaining * (self.initial_status < self.count)))
+        else:
+            min_down_intervals_remaining_init = 0
+        return max(min_up_intervals_remaining_init, 0), \
+            max(min_down_intervals_remaining_init, 0)
+
+    def power_bounds(self, times):
+        '''
+        Bounds on the power output at each time that hold for any
+        feasible schedule, from the initial status and power,
+        the initial min up/down times and the ramp up limits.
+        :returns: arrays of the lowest and highest possible power
+        '''
+        n = len(times)
+        low = np.zeros(n)
+        high = np.repeat(float(self.pmax * self.count), n)
+        if not self.commitment_problem:
+            if not user_config.dispatch_decommit_allowed:
+                low[:] = self.pmin * self.count
+            return low, high
+
+        min_up_init, min_down_init = self._initial_min_intervals(times)
+        high[:min_down_init] = self.pmax * self.initial_status
+        if self.rampratemax is not None:
+            ramp = max(self.rampratemax, self.startupramplimit) * self.count
+            high = np.minimum(high,
+                self.initial_power + ramp * np.arange(1, n + 1))
+        if self.mustrun:
+            low[:] = self.pmin * self.count
+        else:
+            low[:min_up_init] = self.pmin * self.initial_status
+        return low, high
+
+    def update_stage(self, times):
+        '''
+        set the initial condition parameters of a reused model for a new stage
+        and fix the statuses that are set by the initial min up/down times
+        '''
+        if not self.initial_parameters:
+            return
+        self.initial_condition('power')[None] = self.initial_power
+        self.initial_condition('status')[None] = self.initial_status
+        if self.mustrun:
+            return
+        min_up_init, min_down_init = self._initial_min_intervals(times)
+        for t in range(min_up_init):
+            status = self.status(times[t])
+            status.value = 1
+            status.fixed = True
+        for t in range(min_down_init):
+            status = self.status(times[t])
+            status.value = 0
+            status.fixed = True
+
     def create_constraints(self, times):
         '''create the optimization constraints for a generator over all times'''
-        def roundoff(n):
-            m = int(n)
-            if n != m:  # pragma: no cover
-                raise ValueError('min up/down times must be integer number of intervals, not {}'.format(n))
-            return m
-
         if self.commitment_problem:
             # set initial and final time constraints
             tInitial = times.initialTimestr
-            tEnd = len(times)
-            if self.minuptime > 0:
-                up_intervals_remaining = roundoff((self.minuptime - self.initial_status_hours) / times.intervalhrs)
-                min_up_intervals_remaining_init = int(
-                    min(tEnd, up_intervals_remaining * self.initial_status))
-            else:
+            if self.initial_parameters:
+                # the initial min up/down times are set by fixing the status
+                # (see update_stage) and can change from stage to stage
                 min_up_intervals_remaining_init = 0
-            if self.mindowntime > 0:
-                down_intervals_remaining = roundoff((self.mindowntime - self.initial_status_hours) / times.intervalhrs)
-                min_down_intervals_remaining_init = int(min(tEnd, down_intervals_remaining * (self.initial_status == 0)))
-            else:
                 min_down_intervals_remaining_init = 0
+            else:
+                min_up_intervals_remaining_init, \
+                    min_down_intervals_remaining_init = \
+                    self._initial_min_intervals(times)
             # initial up down time
-            if min_up_intervals_remaining_init > 0:
-                self.add_constraint('minuptime', tInitial, 0 >= sum([(1 - self.status(times[t])) for t in range(min_up_intervals_remaining_init)]))
-            if min_down_intervals_remaining_init > 0:
-                self.add_constraint('mindowntime', tInitial, 0 == sum([self.status(times[t]) for t in range(min_down_intervals_remaining_init)]))
+            self._create_initial_min_constraints(times,
+                min_up_intervals_remaining_init,
+                min_down_intervals_remaining_init)
 
             # initial ramp rate
+            # (always needed if the initial power can change between stages)
+            initial_power = self.initial_condition('power')
             if self.rampratemax is not None:
-                if self.initial_power + self.rampratemax < self.pmax:
-                    E = self.power(
-                        times[0]) - self.initial_power <= self.rampratemax
+                if self.initial_parameters or self.initial_power + \
+                        self.rampratemax * self.count < self.pmax * self.count:
+                    E = self.power(times[0]) - initial_power <= \
+                        self.rampratemax * self.count
                     self.add_constraint('ramp lim high', tInitial, E)
 
             if self.rampratemin is not None:
-                if self.initial_power + self.rampratemin > self.pmin:
-                    E = self.rampratemin <= self.power(
-                        times[0]) - self.initial_power
+                if self.initial_parameters or self.initial_power + \
+                        self.rampratemin * self.count > self.pmin * self.count:
+                    E = self.rampratemin * self.count <= self.power(
+                        times[0]) - initial_power
                     self.add_constraint('ramp lim low', tInitial, E)
 
             # calculate up down intervals
@@ -327,7 +448,7 @@ class Generator(OptimizationObject):
             # ramping power
             if self.rampratemax is not None:
                 def ramp_max(model, t):
-                    tPrev = get_tPrev(t, model, times)
+                    tPrev = times.prev(t)
                     ramp_limit = self.rampratemax * self.status(tPrev)
                     if self.startupramplimit is not None:
                         ramp_limit += self.startupramplimit * (
@@ -349,7 +470,7 @@ class Generator(OptimizationObject):
 
             if self.rampratemin is not None:
                 def ramp_min(model, t):
-                    tPrev = get_tPrev(t, model, times)
+                    tPrev = times.prev(t)
                     ramp_limit = self.rampratemin * self.status(t)
                     # + self.pmax * (1 - self.status(times[t-1]))
                     if self.shutdownramplimit is not None:
@@ -359,55 +480,14 @@ class Generator(OptimizationObject):
                     return ramp_limit <= self.power_available(t) - self.power(tPrev)
                 self.add_constraint_set('ramp limit low', times.set, ramp_min)
 
-            # start up and shut down costs
-            if self.startupcost > 0:
-                def startupcostmin(model, t):
-                    tPrev = get_tPrev(t, model, times)
-                    return self.cost_startup(t) >= self.startupcost * (
-                        self.status(t) - self.status(tPrev))
-                self.add_constraint_set('startup cost min', times.set, startupcostmin)
-
-                # these tightening constraints make stochastic problems take a very long time
-#                def startupcostmax(model, t):
-#                    return self.cost_startup(t) <= self.startupcost * self.status(t)
-#                self.add_constraint_set('startup cost max', times.set, startupcostmax)
-#
-#                def startupcostmax_prev(model, t):
-#                    tPrev = get_tPrev(t, model, times)
-#                    return self.cost_startup(t) <= self.startupcost * (1 - self.status(tPrev))
-#                self.add_constraint_set('startup cost max prev', times.set, startupcostmax_prev)
-
-            if self.shutdowncost > 0:
-                def shutdowncost(model, t):
-                    tPrev = get_tPrev(t, model, times)
-                    return self.cost_shutdown(t) >= self.shutdowncost * -1 * (self.status(t) - self.status(tPrev))
-                self.add_constraint_set('shutdown cost', times.set, shutdowncost)
-
-            # note: costs must be >= constraints
-            # for very large problems with >= constraints,
-            # the solver may not always force the costs down to their minimum
-            # however, the == formulation is incorrect and will not allow
-            # unit shutdowns if the unit has a startup cost
-            # solution is to use the min and max constraints together.
-
-            # TODO: convert these to constraint list form
-            for t, time in enumerate(times):
-
-                # min up time
-                if t >= min_up_intervals_remaining_init and self.minuptime > 0:
-                    no_shut_down = range(t, min(tEnd, t + min_up_intervals))
-                    min_up_intervals_remaining = min(tEnd - t, min_up_intervals)
-                    E = sum([self.status(times[s]) for s in no_shut_down]) >= min_up_intervals_remaining * self.status_change(t, times)
-                    self.add_constraint('min up time', time, E)
-                # min down time
-                if t >= min_down_intervals_remaining_init and self.mindowntime > 0:
-                    no_start_up = range(t, min(tEnd, t + min_down_intervals))
-                    min_down_intervals_remaining = min(
-                        tEnd - t, min_down_intervals)
-                    E = sum([1 - self.status(times[s]) for s in no_start_up]) >= min_down_intervals_remaining * -1 * self.status_change(t, times)
-                    self.add_constraint('min down time', time, E)
-
-
+            if self.three_binary:
+                self._create_three_binary_constraints(times,
+                    min_up_intervals, min_down_intervals)
+            else:
+                self._create_status_constraints(times,
+                    min_up_intervals_remaining_init,
+                    min_down_intervals_remaining_init,
+                    min_up_intervals, min_down_intervals)
 
         # min/max power limits
         # these always apply (even if not a UC problem)
@@ -422,12 +502,170 @@ class Generator(OptimizationObject):
 
         return
 
+    def _create_initial_min_constraints(self, times,
+            min_up_intervals_remaining_init, min_down_intervals_remaining_init):
+        tInitial = times.initialTimestr
+        if min_up_intervals_remaining_init > 0:
+            self.add_constraint('minuptime', tInitial, 0 >= sum([(1 - self.status(times[t])) for t in range(min_up_intervals_remaining_init)]))
+        if min_down_intervals_remaining_init > 0:
+            self.add_constraint('mindowntime', tInitial, 0 == sum([self.status(times[t]) for t in range(min_down_intervals_remaining_init)]))
+
+    def _create_status_constraints(self, times,
+            min_up_intervals_remaining_init, min_down_intervals_remaining_init,
+            min_up_intervals, min_down_intervals):
+        '''
+        The startup, shutdown and min up/down time constraints
+        of the (default) status only formulation.
+        '''
+        tEnd = len(times)
+        # start up and shut down costs
+        if self.startupcost > 0:
+            def startupcostmin(model, t):
+                tPrev = times.prev(t)
+                return self.cost_startup(t) >= self.startupcost * (
+                    self.status(t) - self.status(tPrev))
+            self.add_constraint_set('startup cost min', times.set, startupcostmin)
+
+            # these tightening constraints make stochastic problems take a very long time
+#                def startupcostmax(model, t):
+#                    return self.cost_startup(t) <= self.startupcost * self.status(t)
+#                self.add_constraint_set('startup cost max', times.set, startupcostmax)
+#
+#                def startupcostmax_prev(model, t):
+#                    tPrev = times.prev(t)
+#                    return self.cost_startup(t) <= self.startupcost * (1 - self.status(tPrev))
+#                self.add_constraint_set('startup cost max prev', times.set, startupcostmax_prev)
+
+        if self.shutdowncost > 0:
+            def shutdowncost(model, t):
+                tPrev = times.prev(t)
+                return self.cost_shutdown(t) >= self.shutdowncost * -1 * (self.status(t) - self.status(tPrev))
+            self.add_constraint_set('shutdown cost', times.set, shutdowncost)
+
+        # note: costs must be >= constraints
+        # for very large problems with >= constraints,
+        # the solver may not always force the costs down to their minimum
+        # however, the == formulation is incorrect and will not allow
+        # unit shutdowns if the unit has a startup cost
+        # solution is to use the min and max constraints together.
+
+        labels = times._set
+        positions = dict(zip(labels, range(tEnd)))
+
+        def status_change(time):
+            return self.status(time) - self.status(times.prev(time))
+
+        # min up time
+        if self.minuptime > 0:
+            def min_up_time(model, time):
+                t = positions[time]
+                if t < min_up_intervals_remaining_init:
+                    return pyomo.Constraint.Skip
+                no_shut_down = labels[t:min(tEnd, t + min_up_intervals)]
+                min_up_intervals_remaining = min(tEnd - t, min_up_intervals)
+                return sum([self.status(s) for s in no_shut_down]) >= \
+                    min_up_intervals_remaining * status_change(time)
+            self.add_constraint_set('min up time', times.set, min_up_time)
+
+        # min down time
+        if self.mindowntime > 0:
+            def min_down_time(model, time):
+                t = positions[time]
+                if t < min_down_intervals_remaining_init:
+                    return pyomo.Constraint.Skip
+                no_start_up = labels[t:min(tEnd, t + min_down_intervals)]
+                min_down_intervals_remaining = min(
+                    tEnd - t, min_down_intervals)
+                return sum([1 - self.status(s) for s in no_start_up]) >= \
+                    min_down_intervals_remaining * -1 * status_change(time)
+            self.add_constraint_set('min down time', times.set, min_down_time)
+
+    def _create_three_binary_constraints(self, times,
+            min_up_intervals, min_down_intervals):
+        '''
+        The startup, shutdown and min up/down time constraints of the
+        three binary formulation. The status changes are modeled by
+        explicit startup and shutdown variables. The min up/down times
+        are turn on/off inequalities on those, which have a much
+        tighter LP relaxation than the status window constraints.
+        '''
+        labels = times._set
+        positions = dict(zip(labels, range(len(labels))))
+
+        def status_logic(model, t):
+            return self.status(t) - self.status(times.prev(t)) == \
+                self.startup(t) - self.shutdown(t)
+        self.add_constraint_set('status logic', times.set, status_logic)
+
+        def startup_or_shutdown(model, t):
+            return self.startup(t) + self.shutdown(t) <= self.count
+        self.add_constraint_set('startup or shutdown', times.set,
+            startup_or_shutdown)
+
+        if self.startupcost > 0:
+            def startupcostmin(model, t):
+                return self.cost_startup(t) >= \
+                    self.startupcost * self.startup(t)
+            self.add_constraint_set('startup cost min', times.set,
+                startupcostmin)
+
+        if self.shutdowncost > 0:
+            def shutdowncost(model, t):
+                return self.cost_shutdown(t) >= \
+                    self.shutdowncost * self.shutdown(t)
+            self.add_constraint_set('shutdown cost', times.set, shutdowncost)
+
+        # a unit started up within the last min up time intervals is on
+        if self.minuptime > 0:
+            def turn_on(model, time):
+                t = positions[time]
+                started = labels[max(0, t - min_up_intervals + 1):t + 1]
+                return sum(self.startup(s) for s in started) <= \
+                    self.status(time)
+            self.add_constraint_set('min up time', times.set, turn_on)
+
+        # a unit shut down within the last min down time intervals is off
+        if self.mindowntime > 0:
+            def turn_off(model, time):
+                t = positions[time]
+                stopped = labels[max(0, t - min_down_intervals + 1):t + 1]
+                return sum(self.shutdown(s) for s in stopped) <= \
+                    self.count - self.status(time)
+            self.add_constraint_set('min down time', times.set, turn_off)
+
     def __str__(self):
         return 'g{ind}'.format(ind=self.index)
 
 
-def get_tPrev(t, model, times):
-    return model.times.prev(t) if t != model.times.first() else times.initialTime
+uc_formulations = ['status', 'three_binary']
+
+
+def hours_in_status(stat, times, initial_status, initial_status_hours):
+    '''the hours a unit has been in its final status at the end of times'''
+    end_status = stat.ix[stat.index[-1]]
+
+    if (stat == end_status).all():
+        intervals = len(stat)
+        hrs = intervals * times.intervalhrs
+        if initial_status == end_status:
+            hrs += initial_status_hours
+    else:
+        noneq = stat[stat != end_status]
+        if len(noneq) == 0:
+            intervals = 0
+        else:
+            intervals = len(stat.ix[noneq.index[-1]:]) - 1
+
+        hrs = intervals * times.intervalhrs
+
+    return hrs
+
+
+def roundoff(n):
+    m = int(n)
+    if n != m:  # pragma: no cover
+        raise ValueError('min up/down times must be integer number of intervals, not {}'.format(n))
+    return m
 
 
 class Generator_nonControllable(Generator):
@@ -457,9 +695,10 @@ class Generator_nonControllable(Generator):
         self.init_optimization()
         self.is_stochastic = False
         self.shedding_mode = sheddingallowed and user_config.economic_wind_shed
+        self.elastic = False
 
     def power(self, time, scenario=None):
-        if self.shedding_mode:
+        if self.shedding_mode or self.elastic:
             power = self.get_variable('power_used', time,
                                       scenario=scenario, indexed=True)
         else:
@@ -492,12 +731,24 @@ class Generator_nonControllable(Generator):
             hoursinstatus=0)
 
     def create_variables(self, times):
-        if self.shedding_mode:
+        self.elastic = self._parent_problem().elastic_shedding and \
+            self.sheddingallowed
+        if self.shedding_mode or self.elastic:
             self.create_variables_shedding(times)
         self.add_parameter('power', index=times.set,
-                           values=dict([(t, self.get_scheduled_ouput(t)) for t in times]))
+                           values=self._schedule_values(times))
         self.create_bids(times)
 
+    def update_stage(self, times):
+        '''set the scheduled power parameter for a new stage'''
+        power = self.power_available()
+        for t, val in self._schedule_values(times).iteritems():
+            power[t] = val
+
+    def _schedule_values(self, times):
+        return dict([(t, self.get_scheduled_ouput(times.schedule_label(t)))
+            for t in times])
+
     def create_bids(self, times):
         self.bids = bidding.Bid(
             polynomial=self.cost_coeffs,
@@ -512,10 +763,23 @@ class Generator_nonControllable(Generator):
         self.add_variable('power_used', index=times.set, low=0)
 
     def create_constraints(self, times):
-        if self.shedding_mode:
-            for time in times:
-                self.add_constraint('max_power', time,
-                                    self.power(time) <= self.power_available(time))
+        if self.shedding_mode or self.elastic:
+            def max_power(model, t):
+                return self.power(t) <= self.power_available(t)
+            self.add_constraint_set('max_power', times.set, max_power)
+
+    def set_shedding_bounds(self, times):
+        '''
+        for elastic shedding, fix the power used to the available power,
+        unless the generator is in shedding mode
+        '''
+        for t in times:
+            power = self.get_variable('power_used', t, indexed=True)
+            if self.shedding_mode:
+                power.fixed = False
+            else:
+                power.value = value(self.power_available(t))
+                power.fixed = True
 
     def cost(self, time, scenario=None, evaluate=False):
         return self.operatingcost(time, scenario=scenario, evaluate=evaluate)
@@ -527,6 +791,20 @@ class Generator_nonControllable(Generator):
     def truecost(self, time, scenario=None):
         return self.cost(time)
 
+    def bulk_values(self, method, keys, scenario=None):
+        '''
+        The solved power, status, cost, operatingcost or shed at the
+        (time) keys, read from the variables in one pass as an array.
+        '''
+        if method in ['cost', 'operatingcost', 'shed']:
+            shed = values_array(self.power_available(None, scenario), keys) - \
+                values_array(self.power(None, scenario), keys)
+            if method == 'shed':
+                return shed
+            return self.bids.output_values(keys, scenario) + \
+                user_config.cost_wind_shedding * shed
+        return values_array(getattr(self, method)(None, scenario), keys)
+
     def incrementalcost(self, time, scenario=None):
         return self.bids.output_incremental(self.power(time))
 
@@ -579,10 +857,11 @@ class Generator_Stochastic(Generator_nonControllable):
         self.shutdowncost = 0
         self.fuelcost = float(fuelcost)
         self.shedding_mode = sheddingallowed and user_config.economic_wind_shed
+        self.elastic = False
 
     def power(self, time, scenario=None):
         return self.get_variable(
-            'power_used' if self.shedding_mode else 'power',
+            'power_used' if self.shedding_mode or self.elastic else 'power',
             time=time, scenario=scenario, indexed=True)
 
     def power_available(self, time=None, scenario=None):
@@ -602,7 +881,9 @@ class Generator_Stochastic(Generator_nonControllable):
             times.Start.date()].dropna(how='all').probability
     
     def create_variables(self, times):
-        if self.shedding_mode:
+        self.elastic = self._parent_problem().elastic_shedding and \
+            self.sheddingallowed
+        if self.shedding_mode or self.elastic:
             self.create_variables_shedding(times)
 
         if self.is_stochastic:
@@ -613,7 +894,154 @@ class Generator_Stochastic(Generator_nonControllable):
         else:
             # set to forecast values
             self.add_parameter('power', index=times.set,
-               values=dict([(t, self.get_scheduled_ouput(t)) for t in times]))
+               values=self._schedule_values(times))
 
         self.create_bids(times)
         return
+
+
+class Generator_Cluster(Generator):
+    """
+    A group of identical generators, modeled as a single unit
+    with an integer commitment (the number of units on).
+    The power is the total power of the units. The units
+    must have linear cost curves, so that the cost is exact.
+
+    :param units: list of identical :class:`~generators.Generator` objects
+    """
+    # the parameters which must be the same for all of the units
+    parameters = ['kind', 'bus',
+        'pmin', 'pmax',
+        'minuptime', 'mindowntime',
+        'rampratemax', 'rampratemin',
+        'startupramplimit', 'shutdownramplimit',
+        'costcurveequation', 'heatrateequation', 'fuelcost',
+        'startupcost', 'shutdowncost',
+        'faststart', 'mustrun']
+
+    def __init__(self, units):
+        self.units = units
+        self.count = len(units)
+        unit = units[0]
+        Generator.__init__(self,
+            name='cluster_{}'.format(unit.name), index=unit.index,
+            **dict((p, getattr(unit, p)) for p in self.parameters))
+        self.set_initial_condition(
+            power=sum(u.initial_power for u in units),
+            status=sum(u.initial_status for u in units),
+            hoursinstatus=unit.initial_status_hours)
+
+    def build_cost_model(self):
+        Generator.build_cost_model(self)
+        self.bid_params['max_input'] = self.pmax * self.count
+
+    def set_initial_condition(self, power=None, status=None,
+        hoursinstatus=100, unithours=None):
+        '''
+        the initial status is the number of units on (default all).
+        The first units (as many as the status) are on.
+        :param unithours: each unit's hours in its status
+            (default `hoursinstatus` for all of the units)
+        '''
+        if status is None:
+            status = self.count
+        status = int(round(status))
+        if power is None:
+            power = status * (self.pmax - self.pmin) / 2
+        if pd.isnull(power):
+            raise ValueError('inital power cannot be null')
+        self.initial_status = status
+        self.initial_power = float(power) if status else 0.0
+        self.initial_status_hours = hoursinstatus
+        if unithours is None:
+            unithours = [hoursinstatus] * self.count
+        self.initial_unit_hours = list(unithours)
+
+    def getstatus(self, tend, times, status):
+        final = Generator.getstatus(self, tend, times, status)
+        final['unithours'] = self.getunithours(times, status)
+        return final
+
+    def getunithours(self, times, stat):
+        '''
+        each unit's hours in its final status, where the first units
+        (as many as the cluster's status) are on at each time
+        (as in :meth:`disaggregate`)
+        '''
+        return [hours_in_status((stat > k).astype(int), times,
+            int(self.initial_status > k), hours)
+            for k, hours in enumerate(self.initial_unit_hours)]
+
+    def _initial_unit_intervals(self, times):
+        '''
+        whether each unit is on initially and the number of intervals
+        it must remain on (or off) at the start of the times
+        '''
+        remaining = []
+        for k, hours in enumerate(self.initial_unit_hours):
+            is_on = k < self.initial_status
+            min_hours = self.minuptime if is_on else self.mindowntime
+            if min_hours > 0:
+                intervals = roundoff((min_hours - hours) / times.intervalhrs)
+            else:
+                intervals = 0
+            remaining.append((is_on, int(min(len(times), max(intervals, 0)))))
+        return remaining
+
+    def _initial_min_intervals(self, times):
+        '''
+        the number of intervals all of the units which are on (or off)
+        initially must remain on (or off)
+        '''
+        remaining = self._initial_unit_intervals(times)
+        return min([n for is_on, n in remaining if is_on] or [0]), \
+            min([n for is_on, n in remaining if not is_on] or [0])
+
+    def _create_initial_min_constraints(self, times,
+            min_up_intervals_remaining_init, min_down_intervals_remaining_init):
+        # the units which are on (or off) initially stay on (or off)
+        # until each unit's own min up (or down) time has passed
+        remaining = self._initial_unit_intervals(times)
+        for t in range(len(times)):
+            stay_on = sum(1 for is_on, n in remaining if is_on and n > t)
+            stay_off = sum(1 for is_on, n in remaining if not is_on and n > t)
+            if not (stay_on or stay_off):
+                break
+            if stay_on:
+                self.add_constraint('minuptime', times[t],
+                    self.status(times[t]) >= stay_on)
+            if stay_off:
+                self.add_constraint('mindowntime', times[t],
+                    self.status(times[t]) <= self.count - stay_off)
+
+    def truecost(self, time, scenario=None):
+        # the cost curve is linear, so the bid model is exact
+        return self.operatingcost(time, scenario, evaluate=True)
+
+    def solution_status(self, status):
+        return status[[str(unit) for unit in self.units]].sum(axis=1)
+
+    def disaggregate(self, values, status, kind='total'):
+        '''
+        Split the cluster's solution values between its units.
+        The first units (as many as the status) are on
+        and share any total equally.
+
+        :param values: a Series of the cluster's values over time
+        :param status: a Series of the cluster's (rounded) status
+        :param kind: `status`, `total` (e.g. power or cost) or
+            `intensive` (e.g. incremental cost)
+        :returns: a DataFrame with a column for each unit
+        '''
+        names = [str(unit) for unit in self.units]
+        on = pd.DataFrame(dict((name, status > k)
+            for k, name in enumerate(names)), columns=names)
+        if kind == 'status':
+            return on.astype(int)
+        elif kind == 'intensive':
+            return on.apply(lambda col: values.where(col))
+        per_unit = values / status.where(status > 0)
+        return on.astype(float).mul(per_unit.fillna(0), axis=0)
+
+    def __str__(self):
+        return 'gc{ind}'.format(ind=self.index)
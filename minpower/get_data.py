@@ -16,8 +16,10 @@ from schedule import (just_one_time, get_schedule,
 from commonscripts import (joindir, drop_case_spaces, set_trace)
 
 from powersystems import PowerSystem
-from generators import (Generator,
+from generators import (Generator, Generator_Cluster,
                         Generator_Stochastic, Generator_nonControllable)
+import bidding
+from scenarioreduction import reduce_scenarios
 from config import user_config
 
 import os
@@ -176,6 +178,9 @@ def _parse_raw_data(generators_data, loads_data, lines_data, init_data):
     # get scenario values (if applicable)
     scenario_values = setup_scenarios(generators_data, generators, times)
 
+    if user_config.cluster_generators:
+        generators = cluster_generators(generators, times)
+
     # also return the raw DataFrame objects
     data = dict(
         generators=generators_data,
@@ -239,6 +244,46 @@ def setup_initialcond(data, generators, times):
     return
 
 
+def cluster_generators(generators, times):
+    """
+    Group identical controllable generators (with the same parameters,
+    linear costs and initial conditions) into
+    :class:`~generators.Generator_Cluster` objects.
+    Only unit commitment problems are clustered.
+    """
+    if len(times) <= 1:
+        return generators
+    elif user_config.standalone or user_config.reuse_model or \
+            any(gen.is_stochastic for gen in generators):
+        logging.warning('generators are not clustered for standalone, ' + \
+            'reused model or stochastic problems')
+        return generators
+
+    def can_cluster(gen):
+        return type(gen) == Generator and gen.bid_points is None and \
+            not gen.faststart and bidding.is_linear(gen.cost_coeffs)
+
+    groups = OrderedDict()
+    for gen in generators:
+        if can_cluster(gen):
+            key = tuple(getattr(gen, p) for p in Generator_Cluster.parameters)
+            key += (gen.initial_status, gen.initial_power,
+                gen.initial_status_hours)
+        else:
+            key = id(gen)
+        groups.setdefault(key, []).append(gen)
+
+    clustered = []
+    for units in groups.values():
+        if len(units) > 1:
+            clustered.append(Generator_Cluster(units))
+        else:
+            clustered.extend(units)
+    logging.info('clustered {} generators into {} units'.format(
+        len(generators), len(clustered)))
+    return clustered
+
+
 def build_class_list(data, model, times=None, timeseries=None):
     """
     Create list of class instances from the row of a DataFrame.
@@ -465,8 +510,9 @@ def _parse_scenario_day(filename):
     # select subset of scenarios
     Nscenarios = user_config.scenarios
     if Nscenarios:
-        data = data[data.index < Nscenarios]
-        data['probability'] = data['probability'] / sum(data['probability'])
+        data = reduce_scenarios(data, Nscenarios,
+            method=user_config.scenario_reduction,
+            hours=user_config.hours_commitment + user_config.hours_overlap)
 
     # return the data with probability column first
     return data[data.columns.drop('probability').insert(0, 'probability')]
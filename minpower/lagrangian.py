@@ -0,0 +1,250 @@
+"""
+A Lagrangian relaxation unit commitment engine.
+The system power balance and reserve constraints are relaxed
+with prices (multipliers). Each generator's single unit commitment
+subproblem (min up/down times and bid curve, at those prices)
+is then solved by dynamic programming, in a process pool.
+The prices are updated by subgradient steps.
+
+The resulting commitment is fixed in the power system's model,
+which is then solved as usual (an economic dispatch) to get a
+feasible schedule. Ramping and network limits are only enforced
+by that final dispatch.
+"""
+import logging
+import multiprocessing
+import numpy as np
+
+from config import user_config
+from optimization import value
+from bidding import discretize_range, polynomial_value
+from generators import roundoff
+
+
+def fix_commitment(power_system, times):
+    '''
+    Find a commitment for the controllable generators by Lagrangian
+    relaxation and fix their statuses in the model to it.
+    '''
+    generators = filter(lambda gen: not gen.mustrun,
+        power_system.get_generators_controllable())
+    units = [unit_subproblem(gen, times) for gen in generators]
+    load, reserve, fixed_power = _system_requirements(power_system, times)
+    # the mustrun units are always on, at pmin or above
+    mustrun = filter(lambda gen: gen.mustrun,
+        power_system.get_generators_controllable())
+    fixed_capacity = fixed_power + sum(gen.pmax * gen.count for gen in mustrun)
+    fixed_power = fixed_power + sum(gen.pmin * gen.count for gen in mustrun)
+
+    pool = _make_pool(len(units))
+    try:
+        status = solve_relaxation(units, load - fixed_power,
+            reserve - fixed_capacity, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    status = repair_commitment(units, status, reserve - fixed_capacity)
+    for gen, unit_status in zip(generators, status):
+        for time, stat in zip(times, unit_status):
+            var = gen.status(time)
+            var.value = stat * gen.count
+            var.fixed = True
+    power_system._model.preprocess()
+
+
+def solve_relaxation(units, net_load, reserve, pool=None,
+        iterations=None):
+    '''
+    Maximize the Lagrangian dual by subgradient steps.
+    :param units: list of unit subproblem dicts (see :func:`unit_subproblem`)
+    :param net_load: array of the load to be met by the units
+    :param reserve: array of the available power required of the units
+    :returns: a list of status arrays (one for each unit) from the
+        last iteration where the units meet the net load and reserve
+        (or from the last iteration, if they never do)
+    '''
+    if iterations is None:
+        iterations = user_config.lagrangian_iterations
+    mapper = pool.map if pool is not None else map
+    # start from the average full load cost
+    price_scale = np.mean([unit['costs'][-1] / unit['points'][-1]
+        for unit in units if unit['points'][-1] > 0] or [1.0])
+    prices = np.repeat(price_scale, len(net_load))
+    reserve_prices = np.zeros(len(net_load))
+
+    best_bound = -np.inf
+    feasible = None
+    for k in range(iterations):
+        solutions = mapper(solve_unit,
+            [(unit, prices, reserve_prices) for unit in units])
+        status = [sln[0] for sln in solutions]
+        power = sum(sln[1] for sln in solutions)
+        available = sum(sln[0] * unit['pmax']
+            for sln, unit in zip(solutions, units))
+        bound = sum(sln[2] for sln in solutions) + \
+            np.dot(prices, net_load) + np.dot(reserve_prices, reserve)
+        best_bound = max(best_bound, bound)
+
+        if (available >= net_load).all() and (available >= reserve).all():
+            feasible = status
+
+        # subgradient step, normalized and diminishing
+        step = price_scale / (k + 1)
+        mismatch = net_load - power
+        shortfall = reserve - available
+        prices = prices + step * mismatch / max(np.abs(mismatch).max(), 1.0)
+        reserve_prices = np.maximum(0, reserve_prices +
+            step * shortfall / max(np.abs(shortfall).max(), 1.0))
+
+    logging.info('Lagrangian dual bound: {}'.format(best_bound))
+    return feasible if feasible is not None else status
+
+
+def repair_commitment(units, status, required):
+    '''
+    Commit more units (cheapest full load cost first) at any times
+    where the committed capacity is less than required.
+    A unit is committed by re-solving its subproblem with the unit
+    forced on at that time (and at the times it was already on),
+    so its new schedule keeps to the min up/down times and the
+    initial status. Units which can't be on at that time are skipped.
+    '''
+    status = [s.copy() for s in status]
+    order = sorted(range(len(units)),
+        key=lambda u: units[u]['costs'][-1] / max(units[u]['points'][-1], 1e-6))
+    # at no price, the cheapest schedule that covers the forced times
+    no_prices = np.zeros(len(required))
+    for t in range(len(required)):
+        for u in order:
+            capacity = sum(s[t] * unit['pmax'] for s, unit in zip(status, units))
+            if capacity >= required[t]:
+                break
+            if status[u][t]:
+                continue
+            forced_on = status[u] > 0
+            forced_on[t] = True
+            unit_status, power, objective = solve_unit(
+                (units[u], no_prices, no_prices, forced_on))
+            if np.isfinite(objective):
+                status[u] = unit_status
+    return status
+
+
+def unit_subproblem(gen, times):
+    '''
+    The data for a generator's single unit commitment subproblem
+    (pickleable, for the process pool). A cluster is modeled as
+    one unit with its power and costs scaled by the count.
+    '''
+    intervalhrs = times.intervalhrs
+    up_init, down_init = gen._initial_min_intervals(times)
+    if gen.bid_points is None:
+        points = discretize_range(max(gen.cost_breakpoints, 2),
+            gen.pmin, gen.pmax)
+        costs = [polynomial_value(gen.cost_coeffs, p) for p in points]
+    else:
+        bid_points = gen.bid_points.sort('power')
+        points = sorted(set([gen.pmin, gen.pmax] + [p
+            for p in bid_points.power if gen.pmin <= p <= gen.pmax]))
+        costs = np.interp(points, bid_points.power, bid_points.cost) + \
+            gen.noloadcost
+    count = gen.count
+    return dict(
+        points=np.array(points, dtype=float) * count,
+        costs=np.array(costs, dtype=float) * count,
+        pmax=float(gen.pmax * count),
+        min_up=roundoff(gen.minuptime / intervalhrs),
+        min_down=roundoff(gen.mindowntime / intervalhrs),
+        initial_status=gen.initial_status > 0,
+        initial_remaining=up_init if gen.initial_status > 0 else down_init,
+        startupcost=gen.startupcost * count,
+        shutdowncost=gen.shutdowncost * count,
+        )
+
+
+def solve_unit(args):
+    '''
+    Solve a unit's subproblem at the given prices by dynamic programming.
+    The states are the status and the number of intervals
+    the unit must remain in that status.
+    :param args: tuple of the unit, the prices and the reserve prices,
+        and optionally a boolean array of the times the unit must be on
+    :returns: status array, power array, and the subproblem's
+        objective value (cost less the value of the power and reserve),
+        which is infinite if the unit can't be on at the forced times
+    '''
+    unit, prices, reserve_prices = args[:3]
+    forced_on = args[3] if len(args) > 3 else np.zeros(len(prices), bool)
+    T = len(prices)
+    # the best power (and its cost less its value) at each time, if on
+    profit = unit['costs'][None, :] - np.outer(prices, unit['points'])
+    best = profit.argmin(axis=1)
+    on_power = unit['points'][best]
+    on_cost = profit[np.arange(T), best] - reserve_prices * unit['pmax']
+
+    up, down = unit['min_up'], unit['min_down']
+    # states: on with 0..up intervals remaining, then off with 0..down
+    n_on = max(up, unit['initial_remaining'] * unit['initial_status']) + 1
+    n_off = max(down,
+        unit['initial_remaining'] * (not unit['initial_status'])) + 1
+    start_state = max(up - 1, 0)
+    stop_state = n_on + max(down - 1, 0)
+
+    def transitions(s):
+        if s < n_on:
+            if s > 0:
+                return [(s - 1, 0)]
+            return [(0, 0), (stop_state, unit['shutdowncost'])]
+        r = s - n_on
+        if r > 0:
+            return [(s - 1, 0)]
+        return [(s, 0), (start_state, unit['startupcost'])]
+    moves = [transitions(s) for s in range(n_on + n_off)]
+    is_on = np.arange(n_on + n_off) < n_on
+
+    values = np.repeat(np.inf, n_on + n_off)
+    initial = unit['initial_remaining']
+    values[initial if unit['initial_status'] else n_on + initial] = 0
+    previous = np.zeros((T, n_on + n_off), dtype=int)
+    for t in range(T):
+        new = np.repeat(np.inf, n_on + n_off)
+        for s in np.nonzero(np.isfinite(values))[0]:
+            for s_next, cost in moves[s]:
+                if values[s] + cost < new[s_next]:
+                    new[s_next] = values[s] + cost
+                    previous[t, s_next] = s
+        values = new + np.where(is_on, on_cost[t], 0)
+        if forced_on[t]:
+            values[~is_on] = np.inf
+
+    s = values.argmin()
+    objective = values[s]
+    states = []
+    for t in reversed(range(T)):
+        states.append(s)
+        s = previous[t, s]
+    status = is_on[states[::-1]].astype(int)
+    return status, status * on_power, objective
+
+
+def _system_requirements(power_system, times):
+    '''the load, reserve and non-controllable power at each time'''
+    load = np.array([sum(value(load.scheduled_power(time))
+        for load in power_system.loads()) for time in times])
+    fixed_power = np.array([sum(value(gen.power_available(time))
+        for gen in power_system.get_generators_noncontrollable())
+        for time in times])
+    reserve = np.zeros(len(times))
+    if power_system.reserve_required:
+        reserve = power_system.reserve_fixed + \
+            power_system.reserve_load_fraction * load
+    return load, load + reserve, fixed_power
+
+
+def _make_pool(num_units):
+    processes = min(multiprocessing.cpu_count(), num_units)
+    if processes <= 1:
+        return None
+    return multiprocessing.Pool(processes)
@@ -0,0 +1,709 @@
+"""
+A light, pyomo-like modeling layer for linear and mixed-integer problems.
+
+Variables are columns and constraints are sparse coefficient rows.
+Rows are assembled directly into CSR matrices and
+written to a problem file without building pyomo expression trees
+or symbolic labels. This is the `matrix` optimization backend
+(see :class:`~optimization.OptimizationProblem`). It implements only
+the subset of the :mod:`coopr.pyomo` API that minpower uses.
+
+Parameter values are read when the constraints are created,
+so changing a parameter requires re-creating the constraints that use it.
+"""
+import os
+import re
+import tempfile
+import numpy as np
+import scipy.sparse as sparse
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+from coopr.pyomo import Constraint as _PyomoConstraint
+
+minimize = 1
+maximize = -1
+
+_senses = {'<=': '<=', '>=': '>=', '==': '='}
+
+
+class Domain(object):
+    '''the domain of a variable'''
+    def __init__(self, name, discrete=False, bounds=(None, None)):
+        self.name = name
+        self.discrete = discrete
+        self.bounds = bounds
+
+    def __str__(self):
+        return self.name
+
+Reals = Domain('Reals')
+Boolean = Domain('Boolean', discrete=True, bounds=(0, 1))
+Integers = Domain('Integers', discrete=True)
+
+
+class _Linear(object):
+    '''arithmetic for variables and linear expressions'''
+    def __add__(self, other):
+        return _combine(self, other)
+
+    def __radd__(self, other):
+        return _combine(other, self)
+
+    def __sub__(self, other):
+        return _combine(self, other, -1.0)
+
+    def __rsub__(self, other):
+        return _combine(other, self, -1.0)
+
+    def __mul__(self, other):
+        if isinstance(other, _Linear):
+            raise ValueError('only linear expressions are allowed')
+        return Expression([(other, self)])
+
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        return self * (1.0 / other)
+
+    __truediv__ = __div__
+
+    def __neg__(self):
+        return self * -1.0
+
+    def __pos__(self):
+        return self
+
+    def __le__(self, other):
+        return Relation(_combine(self, other, -1.0), '<=')
+
+    def __ge__(self, other):
+        return Relation(_combine(self, other, -1.0), '>=')
+
+    def __eq__(self, other):
+        return Relation(_combine(self, other, -1.0), '==')
+
+    __hash__ = object.__hash__
+
+
+def _combine(a, b, sign=1.0):
+    terms, constant = [], 0.0
+    for item, scale in ((a, 1.0), (b, sign)):
+        if isinstance(item, _Linear):
+            terms.append((scale, item))
+        else:
+            constant += scale * item
+    return Expression(terms, constant)
+
+
+class Expression(_Linear):
+    '''
+    A linear expression: a sum of scaled variables or sub-expressions
+    plus a constant. Expressions are only flattened into
+    coefficients when a row is created, so sums are cheap to build.
+    '''
+    __slots__ = ('terms', 'constant')
+
+    def __init__(self, terms=(), constant=0.0):
+        self.terms = terms
+        self.constant = constant
+
+    @property
+    def value(self):
+        coefs, constant, variables = linear_terms(self)
+        return constant + sum(
+            coef * variables[col].value for col, coef in coefs.iteritems())
+
+
+class Relation(object):
+    '''an (in)equality: `expr` (sense) 0'''
+    __slots__ = ('expr', 'sense')
+
+    def __init__(self, expr, sense):
+        self.expr = expr
+        self.sense = sense
+
+
+def linear_terms(expr):
+    '''
+    Flatten an expression.
+    :returns: a dict of column coefficients, the constant term,
+        and a dict of the variables, by column
+    '''
+    coefs, variables = {}, {}
+    constant = 0.0
+    stack = [(1.0, expr)]
+    while stack:
+        scale, item = stack.pop()
+        if isinstance(item, VarData):
+            coefs[item.column] = coefs.get(item.column, 0.0) + scale
+            variables[item.column] = item
+        elif isinstance(item, Expression):
+            constant += scale * item.constant
+            for coef, child in item.terms:
+                stack.append((scale * coef, child))
+        else:
+            constant += scale * item
+    return coefs, constant, variables
+
+
+class VarData(_Linear):
+    '''a single variable (a column of the problem)'''
+    kind = 'Var'
+
+    def __init__(self, model, column, name, domain):
+        self._model = model
+        self.column = column
+        self.name = name
+        self.domain = domain
+
+    def _get_value(self):
+        return self._model._values[self.column]
+
+    def _set_value(self, val):
+        self._model._values[self.column] = val
+
+    value = property(_get_value, _set_value)
+
+    def _get_fixed(self):
+        return self._model._fixed[self.column]
+
+    def _set_fixed(self, fixed):
+        self._model._fixed[self.column] = fixed
+
+    fixed = property(_get_fixed, _set_fixed)
+
+    def is_indexed(self):
+        return False
+
+    def reset(self):
+        return
+
+    def __str__(self):
+        return self.name
+
+
+class _Component(object):
+    '''base for the model components'''
+    kind = None
+
+    def construct(self, model):
+        return self
+
+    def remove(self, model):
+        return
+
+    def __str__(self):
+        return str(self.name)
+
+
+class Var(_Component):
+    '''a (possibly indexed) variable'''
+    kind = 'Var'
+
+    def __init__(self, *index, **kwds):
+        self._index = index[0] if index else None
+        self.name = kwds.get('name')
+        self.bounds = kwds.get('bounds', (None, None))
+        self.domain = kwds.get('domain', Reals)
+
+    def construct(self, model):
+        low, high = self.bounds
+        if self._index is None:
+            return model._add_column(self.name, low, high, self.domain)
+        self._data = OrderedDict(
+            (key, model._add_column((self.name, key), low, high, self.domain))
+            for key in self._index)
+        return self
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def iteritems(self):
+        return self._data.iteritems()
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def is_indexed(self):
+        return True
+
+    def reset(self):
+        return
+
+
+class Param(_Component):
+    '''a (possibly indexed) parameter'''
+    kind = 'Param'
+
+    def __init__(self, *index, **kwds):
+        self._index = index[0] if index else None
+        self.name = kwds.get('name')
+        self.default = kwds.get('default')
+        self._data = {}
+
+    def __getitem__(self, key):
+        return self._data.get(key, self.default)
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def iteritems(self):
+        index = [None] if self._index is None else self._index
+        return ((key, self[key]) for key in index)
+
+    @property
+    def value(self):
+        return self[None]
+
+    def is_indexed(self):
+        return self._index is not None
+
+
+class Set(_Component):
+    '''an (ordered) set of items'''
+    kind = 'Set'
+
+    def __init__(self, initialize=(), name=None, ordered=False, **kwds):
+        self.name = name
+        self._items = list(initialize)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def first(self):
+        return self._items[0]
+
+    def last(self):
+        return self._items[-1]
+
+
+class ConstraintData(object):
+    '''a single constraint (a row of the problem)'''
+    def __init__(self, model, row):
+        self._model = model
+        self.row = row
+
+    @property
+    def dual(self):
+        return self._model._duals.get(self.row)
+
+
+class Constraint(_Component):
+    '''a (possibly indexed) constraint'''
+    kind = 'Constraint'
+    Skip = _PyomoConstraint.Skip
+
+    def __init__(self, *index, **kwds):
+        self._index = index[0] if index else None
+        self.name = kwds.get('name')
+        self.rule = kwds.get('rule')
+
+    def construct(self, model):
+        self._data = OrderedDict()
+        if self._index is None:
+            relation = self.rule(model) if callable(self.rule) else self.rule
+            self._add(model, None, relation)
+        else:
+            for key in self._index:
+                self._add(model, key, self.rule(model, key))
+        return self
+
+    def _add(self, model, key, relation):
+        if relation is Constraint.Skip:
+            return
+        elif not isinstance(relation, Relation):
+            # a trivial constraint, like 0 >= 0
+            if bool(relation):
+                return
+            raise ValueError('constraint {} [{}] is infeasible'.format(
+                self.name, key))
+        self._data[key] = model._add_row(relation)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def iteritems(self):
+        return self._data.iteritems()
+
+    def keys(self):
+        return self._data.keys()
+
+    def is_indexed(self):
+        return self._index is not None
+
+    def remove(self, model):
+        model._remove_rows([con.row for con in self._data.values()])
+
+
+class Objective(_Component):
+    '''a linear objective'''
+    kind = 'Objective'
+
+    def __init__(self, name='objective', rule=0, sense=minimize):
+        self.name = name
+        self.rule = rule
+        self.sense = sense
+
+    def construct(self, model):
+        expr = self.rule(model) if callable(self.rule) else self.rule
+        self.expr = expr
+        # set directly (setting a component attribute would add it again)
+        object.__setattr__(model, '_objective', self)
+        return self
+
+    @property
+    def value(self):
+        return Expression([(1.0, self.expr)]).value
+
+    def remove(self, model):
+        model._objective = None
+
+
+class Suffix(_Component):
+    '''an import suffix (only duals are supported)'''
+    kind = 'Suffix'
+    IMPORT = 'import'
+
+    def __init__(self, direction=IMPORT, name=None):
+        self.name = name
+        self.direction = direction
+
+    def construct(self, model):
+        self._model = model
+        return self
+
+    def getValue(self, constraint):
+        if isinstance(constraint, Constraint):
+            # a single (non-indexed) constraint
+            constraint = constraint[None]
+        return constraint.dual
+
+
+class Piecewise(_Component):
+    '''
+    A piecewise linear lower bound on `y_var`, as a function of `x_var`.
+    Convex functions are modeled by their segment lines (an LP),
+    other functions by the disaggregated convex combination method
+    (which requires a binary variable for each segment).
+    '''
+    kind = 'Piecewise'
+
+    def __init__(self, index, y_var, x_var, f_rule=None, pw_pts=None,
+                 pw_constr_type='LB', pw_repn='DCC', name=None, **kwds):
+        if pw_constr_type != 'LB':
+            raise NotImplementedError(
+                'only lower bounding piecewise functions are implemented')
+        self._index = index
+        self._y = y_var
+        self._x = x_var
+        self._f_rule = f_rule
+        self._points = pw_pts
+        self.name = name
+
+    def construct(self, model):
+        self._rows = []
+        for key in self._index:
+            x_pts = self._points[key]
+            y_pts = [self._f_rule(model, key, x) for x in x_pts]
+            x, y = self._x[key], self._y[key]
+            if is_convex(x_pts, y_pts):
+                self._add_segments(model, x, y, x_pts, y_pts)
+            else:
+                self._add_dcc(model, key, x, y, x_pts, y_pts)
+        return self
+
+    def _add_row(self, model, relation):
+        self._rows.append(model._add_row(relation).row)
+
+    def _add_segments(self, model, x, y, x_pts, y_pts):
+        for i in range(len(x_pts) - 1):
+            slope = (y_pts[i + 1] - y_pts[i]) / float(x_pts[i + 1] - x_pts[i])
+            self._add_row(model, y - slope * x >= y_pts[i] - slope * x_pts[i])
+
+    def _add_dcc(self, model, key, x, y, x_pts, y_pts):
+        segments = range(len(x_pts) - 1)
+        name = (self.name, key)
+        selected = [model._add_column(name, 0, 1, Boolean) for p in segments]
+        weights = [(model._add_column(name, 0, None, Reals),
+                    model._add_column(name, 0, None, Reals)) for p in segments]
+        self._add_row(model, sum(selected) == 1)
+        for p in segments:
+            self._add_row(model, weights[p][0] + weights[p][1] == selected[p])
+        self._add_row(model, x == sum(
+            lo * x_pts[p] + hi * x_pts[p + 1]
+            for p, (lo, hi) in enumerate(weights)))
+        self._add_row(model, y >= sum(
+            lo * y_pts[p] + hi * y_pts[p + 1]
+            for p, (lo, hi) in enumerate(weights)))
+
+    def remove(self, model):
+        model._remove_rows(self._rows)
+
+
+def is_convex(x_pts, y_pts, tolerance=1e-9):
+    '''are the slopes of the piecewise points non-decreasing'''
+    slopes = np.diff(y_pts) / np.diff(np.asarray(x_pts, dtype=float))
+    return bool(np.all(np.diff(slopes) >= -tolerance))
+
+
+class ConcreteModel(object):
+    '''
+    A problem built from sparse coefficient rows.
+    Components are added (and removed) as attributes, as in pyomo.
+    '''
+    def __init__(self, name='unknown'):
+        object.__setattr__(self, '_components', OrderedDict())
+        self.name = name
+        # columns
+        self._column_names = []
+        self._values = []
+        self._fixed = []
+        self._lower = []
+        self._upper = []
+        self._domains = []
+        # rows (in coordinate form)
+        self._coo_rows = []
+        self._coo_cols = []
+        self._coo_vals = []
+        self._senses = []
+        self._rhs = []
+        self._active = []
+
+        self._objective = None
+        self._duals = {}
+        # changes when columns or rows are added or removed
+        self.structure_version = 0
+
+    def __setattr__(self, name, val):
+        if isinstance(val, _Component):
+            self.add_component(name, val)
+        else:
+            self._components.pop(name, None)
+            object.__setattr__(self, name, val)
+
+    def __delattr__(self, name):
+        component = self._components.pop(name, None)
+        if component is not None:
+            component.remove(self)
+        object.__delattr__(self, name)
+
+    def add_component(self, name, component):
+        if name in self._components:
+            raise RuntimeError('the model already has a component "{}"'.format(name))
+        component.name = name
+        obj = component.construct(self)
+        self._components[name] = obj
+        object.__setattr__(self, name, obj)
+
+    def active_components(self, kind):
+        '''the components of a kind (e.g. `Var` or `pyomo.Var`), by name'''
+        return dict((name, obj) for name, obj in self._components.items()
+                    if obj.kind == kind.__name__)
+
+    def _add_column(self, name, low, high, domain):
+        column = len(self._values)
+        if domain.discrete and domain.bounds != (None, None):
+            low = domain.bounds[0] if low is None else max(low, domain.bounds[0])
+            high = domain.bounds[1] if high is None else min(high, domain.bounds[1])
+        self._column_names.append(name)
+        self._values.append(None)
+        self._fixed.append(False)
+        self._lower.append(-np.inf if low is None else low)
+        self._upper.append(np.inf if high is None else high)
+        self._domains.append(domain)
+        self.structure_version += 1
+        return VarData(self, column, name, domain)
+
+    def _add_row(self, relation):
+        coefs, constant, variables = linear_terms(relation.expr)
+        row = len(self._rhs)
+        for col, coef in coefs.iteritems():
+            if coef != 0:
+                self._coo_rows.append(row)
+                self._coo_cols.append(col)
+                self._coo_vals.append(coef)
+        self._senses.append(relation.sense)
+        self._rhs.append(-constant)
+        self._active.append(True)
+        self.structure_version += 1
+        return ConstraintData(self, row)
+
+    def _remove_rows(self, rows):
+        for row in rows:
+            self._active[row] = False
+        self.structure_version += 1
+
+    def create(self):
+        return self
+
+    def preprocess(self):
+        return
+
+    def clone(self):
+        raise NotImplementedError('matrix models cannot be cloned')
+
+    def arrays(self, substitute_fixed=True):
+        '''
+        The problem in matrix form.
+        :param substitute_fixed: substitute the fixed variables out
+            of the rows and objective (otherwise they are only `fixed`)
+        :returns: a dict with the CSR constraint matrix `A` (active rows only),
+            the `rows` (original row numbers), `senses` and `rhs` of the rows,
+            the objective coefficients `c`, `constant` and `sense`,
+            the column bounds `lower` and `upper`,
+            and the `fixed`, `integer` and `binary` column masks
+        '''
+        n = len(self._values)
+        active = np.flatnonzero(self._active)
+        A = sparse.csr_matrix(
+            (self._coo_vals, (self._coo_rows, self._coo_cols)),
+            shape=(len(self._rhs), n))[active]
+
+        fixed = np.array(self._fixed, dtype=bool)
+        fixed_values = np.array(
+            [self._values[j] if fixed[j] else 0 for j in range(n)], dtype=float)
+        rhs = np.asarray(self._rhs, dtype=float)[active]
+
+        c = np.zeros(n)
+        constant = 0.0
+        sense = minimize
+        if self._objective is not None:
+            sense = self._objective.sense
+            coefs, constant, variables = linear_terms(self._objective.expr)
+            c[coefs.keys()] = coefs.values()
+
+        if substitute_fixed and fixed.any():
+            rhs = rhs - A.dot(fixed_values)
+            constant += c.dot(fixed_values)
+            c[fixed] = 0
+            A = A.dot(sparse.diags((~fixed).astype(float), 0)).tocsr()
+            A.eliminate_zeros()
+
+        integer = np.array([dom.discrete for dom in self._domains], dtype=bool)
+        binary = np.array([dom is Boolean for dom in self._domains], dtype=bool)
+        return dict(A=A,
+                    rows=active,
+                    senses=[self._senses[i] for i in active],
+                    rhs=rhs,
+                    c=c,
+                    constant=constant,
+                    sense=sense,
+                    lower=np.array(self._lower, dtype=float),
+                    upper=np.array(self._upper, dtype=float),
+                    fixed=fixed,
+                    integer=integer,
+                    binary=binary)
+
+    def write(self, filename, **kwds):
+        '''write the problem in CPLEX LP format'''
+        problem = self.arrays()
+        A, c = problem['A'], problem['c']
+        lower, upper = problem['lower'], problem['upper']
+        used = np.zeros(len(c), dtype=bool)
+        used[A.indices] = True
+        used[np.flatnonzero(c)] = True
+        used[problem['fixed']] = False
+
+        def terms(cols, coefs):
+            return '\n'.join('%+.12g x%d' % (coef, col)
+                             for col, coef in zip(cols, coefs))
+
+        out = open(filename, 'w')
+        out.write('\\* minpower matrix model *\\\n\n%s\nobjective:\n' % (
+            'min' if problem['sense'] == minimize else 'max'))
+        objective_cols = np.flatnonzero(c)
+        out.write(terms(objective_cols, c[objective_cols]) + '\n')
+        out.write('%+.12g ONE_VAR_CONSTANT\n\ns.t.\n\n' % problem['constant'])
+
+        for i, row in enumerate(problem['rows']):
+            start, end = A.indptr[i], A.indptr[i + 1]
+            if start == end:
+                # all variables in the row are fixed
+                continue
+            out.write('c%d:\n' % row)
+            out.write(terms(A.indices[start:end], A.data[start:end]))
+            out.write('\n%s %.12g\n\n' % (
+                _senses[problem['senses'][i]], problem['rhs'][i]))
+
+        out.write('bounds\n')
+        out.write(' 1 <= ONE_VAR_CONSTANT <= 1\n')
+        for j in np.flatnonzero(used):
+            out.write(' %s <= x%d <= %s\n' % (
+                _bound(lower[j]), j, _bound(upper[j])))
+
+        for section, mask in [('binary', problem['binary']),
+                              ('general', problem['integer'] & ~problem['binary'])]:
+            cols = np.flatnonzero(mask & used)
+            if len(cols):
+                out.write('%s\n' % section)
+                out.write('\n'.join(' x%d' % j for j in cols) + '\n')
+        out.write('end\n')
+        out.close()
+
+    def problem_file(self, directory=None):
+        '''write the problem to a new temporary file and return its name'''
+        handle, filename = tempfile.mkstemp(
+            suffix='.lp', prefix='minpower-', dir=directory)
+        os.close(handle)
+        self.write(filename)
+        return filename
+
+    def load(self, results, **kwds):
+        '''load the variable values (and duals) from a solver results object'''
+        if hasattr(results, 'column_values'):
+            # results from a solver session, as arrays
+            self._values = list(results.column_values)
+            self._duals = results.row_duals
+            return
+        solution = results.Solution
+        for j, fixed in enumerate(self._fixed):
+            if not fixed:
+                # unused variables (and zeros) may not be reported
+                self._values[j] = min(max(0, self._lower[j]), self._upper[j])
+        for name, data in solution.Variable.items():
+            col = _number(name, 'x')
+            if col is not None:
+                self._values[col] = data['Value']
+        self._duals = {}
+        for name, data in getattr(solution, 'Constraint', {}).items():
+            row = _number(name, 'c')
+            if row is not None and 'Dual' in data:
+                self._duals[row] = data['Dual']
+
+    def pprint(self, filename=None):
+        lines = ['{} columns, {} rows ({} active)'.format(
+            len(self._values), len(self._rhs), sum(self._active))]
+        lines.extend('{} : {}'.format(name, obj.kind)
+                     for name, obj in self._components.items())
+        if filename is None:
+            print '\n'.join(lines)
+        else:
+            with open(filename, 'w') as f:
+                f.write('\n'.join(lines))
+
+
+def _bound(x):
+    if np.isinf(x):
+        return '-inf' if x < 0 else '+inf'
+    return '%.12g' % x
+
+
+def _number(name, prefix):
+    match = re.match(r'^{}(\d+)$'.format(prefix), name)
+    return int(match.group(1)) if match else None
@@ -3,6 +3,7 @@ An optimization command library for Minpower.
 Basically a wrapper around Coopr's `pyomo.ConcreteModel` class.
 """
 import logging
+import os
 import time
 import weakref
 from commonscripts import (quiet, not_quiet, 
@@ -15,16 +16,25 @@ with quiet():
     import coopr.pyomo as pyomo
 
 from coopr.opt.base import solvers as cooprsolver
+import numpy as np
 import pandas as pd
+import matrixmodel
+import solversession
 
 # make pyomo recognize that True == 1
 pyomo.base.numvalue.KnownConstants[
     True] = pyomo.base.numvalue.NumericConstant(1.0)
 
+# variable domains (by name, as defined by both backends)
 variable_kinds = dict(
-    Continuous=pyomo.Reals,
-    Binary=pyomo.Boolean,
-    Boolean=pyomo.Boolean)
+    Continuous='Reals',
+    Binary='Boolean',
+    Boolean='Boolean',
+    Integer='Integers')
+
+backends = dict(
+    pyomo=pyomo,
+    matrix=matrixmodel)
 
 from config import user_config
 
@@ -106,23 +116,26 @@ class OptimizationObject(object):
         '''
         Create a new variable and add it to the object's variables and the model's variables.
         :param name: name of optimization variable.
-        :param kind: type of variable, specified by string. {Continuous or Binary/Boolean}
+        :param kind: type of variable, specified by string. {Continuous, Binary/Boolean or Integer}
         :param low: low limit of variable
         :param high: high limit of variable
         :param fixed_value: a fixed value for a variable (making it a parameter)
         :param time: a single time for a variable
         :param index: a :class:`pyomo.Set` over which a variable is created
         '''
+        backend = self._parent_problem()._backend
+
         def map_args(kind='Continuous', low=None, high=None):
-            return dict(bounds=(low, high), domain=variable_kinds[kind])
+            return dict(bounds=(low, high),
+                        domain=getattr(backend, variable_kinds[kind]))
         orig_name = name
         if index is None:
             name = self._t_id(name, time)
             if fixed_value is None:
-                var = pyomo.Var(name=name, **map_args(**kwargs))
+                var = backend.Var(name=name, **map_args(**kwargs))
                 self._parent_problem().add_component_to_problem(var)
             else:
-                var = pyomo.Param(name=name, default=fixed_value)
+                var = backend.Param(name=name, default=fixed_value)
                 # add var
                 self._parent_problem().add_component_to_problem(var)
                 # and set value
@@ -132,24 +145,33 @@ class OptimizationObject(object):
             name = self._id(name)
 
             if fixed_value is None:
-                var = pyomo.Var(index, name=name, **map_args(**kwargs))
+                var = backend.Var(index, name=name, **map_args(**kwargs))
                 self._parent_problem().add_component_to_problem(var)
             else:
-                var = pyomo.Param(index, name=name, default=fixed_value)
+                var = backend.Param(index, name=name, default=fixed_value)
                 self._parent_problem().add_component_to_problem(var)
                 var = self._parent_problem().get_component(name)
                 for i in index:
                     var[i] = fixed_value
 
     def add_parameter(self, name, index=None, values=None, mutable=True, default=None, **kwargs):
+        '''
+        Create a new parameter and add it to the model.
+        If `index` is None a single (scalar) parameter is created
+        and `values` is its value.
+        '''
         name = self._id(name)
+        args = [] if index is None else [index]
         self._parent_problem().add_component_to_problem(
-            pyomo.Param(index, name=name,
+            self._parent_problem()._backend.Param(*args, name=name,
                         default=default, mutable=mutable, **kwargs))
         if values is not None:
+            var = self._parent_problem().get_component(name)
+            if index is None:
+                var[None] = values
+                return
             if pd.Series(values).count() != len(values):
                 raise ValueError('a parameter value cannot be NaN')
-            var = self._parent_problem().get_component(name)
             for i in index:
                 var[i] = values[i]
 
@@ -157,20 +179,35 @@ class OptimizationObject(object):
         '''Create a new constraint and add it to the object's constraints and the model's constraints.'''
         cname = self._t_id(name, time)
         self._parent_problem().add_component_to_problem(
-            pyomo.Constraint(name=cname, rule=expression))
+            self._parent_problem()._backend.Constraint(
+                name=cname, rule=expression))
 
     def add_constraint_set(self, name, index, expression):
+        '''
+        Create an indexed constraint and add it to the model.
+        The `expression` rule is called with the model and each index item
+        and can return `pyomo.Constraint.Skip` to skip an item.
+        '''
         cname = self._id(name)
         self._parent_problem().add_component_to_problem(
-            pyomo.Constraint(index, name=cname, rule=expression))
+            self._parent_problem()._backend.Constraint(
+                index, name=cname, rule=expression))
     
-    def get_dual(self, cname, time=None):
+    def get_dual(self, cname, time=None, indexed=False):
         '''get the dual of a constraint of an LP problem''' 
         if user_config.duals:
             return self._parent_problem()._model.dual.getValue(
-                self.get_constraint(cname, time))
+                self.get_constraint(cname, time, indexed))
         else:
             return None
+
+    def get_duals(self, cname, keys):
+        '''the duals of an indexed constraint at the (time) keys, as an array'''
+        if not user_config.duals:
+            return None
+        problem = self._parent_problem()
+        return duals_array(problem._model.dual,
+            problem.get_component(self._id(cname)), keys)
     
     def get_variable(self, name, time=None, indexed=False, scenario=None):
         if indexed:
@@ -184,8 +221,11 @@ class OptimizationObject(object):
             var_name = self._t_id(name, time)
             return self._parent_problem().get_component(var_name, scenario)
 
-    def get_constraint(self, name, time):
-        return self._parent_problem().get_component(self._t_id(name, time))
+    def get_constraint(self, name, time, indexed=False):
+        if indexed:
+            return self._parent_problem().get_component(self._id(name))[time]
+        else:
+            return self._parent_problem().get_component(self._t_id(name, time))
 
     def get_parameter(self, name, time, indexed=False):
         if indexed:
@@ -252,7 +292,8 @@ class OptimizationObject(object):
         return 'opt_obj{ind}'.format(ind=self.index)
 
     def _remove_component(self, name, time=None):
-        key = self._t_id(name, time)
+        '''remove a component (a whole indexed component if time is None)'''
+        key = self._t_id(name, time) if time is not None else self._id(name)
         delattr(self._parent_problem()._model, key)
 
     def values(self, name, reindex=None):
@@ -269,13 +310,55 @@ class OptimizationProblem(OptimizationObject):
         self.init_optimization()
 
     def init_optimization(self):
-        self._model = pyomo.ConcreteModel('power system problem')
+        self.backend = self._choose_backend()
+        self._backend = backends[self.backend]
+        self._model = self._backend.ConcreteModel('power system problem')
+        self.use_session = self._choose_session()
+        self._session = None
         self.stochastic_formulation = False
         self.solved = False
+        self.has_template = False
+        self.has_start_values = False
+        self._warmstart_logged = False
         self.children = dict()
         self.variables = dict()
         self.constraints = dict()
 
+    def _choose_backend(self):
+        '''
+        The modeling backend set by the `backend` option:
+        `pyomo` or `matrix` (see :mod:`matrixmodel`).
+        Stochastic problems require pyomo.
+        '''
+        backend = user_config.backend
+        if backend not in backends:
+            raise ValueError('unknown optimization backend "{}"'.format(backend))
+        if backend == 'matrix' and getattr(self, 'is_stochastic', False):
+            logging.warning('stochastic problems use the pyomo backend')
+            backend = 'pyomo'
+        return backend
+
+    def _choose_session(self):
+        '''
+        Solve in a persistent solver session (see :mod:`solversession`),
+        if set by the `solver_session` option.
+        The session requires the matrix backend and swiglpk,
+        and is only used when the solver is glpk.
+        '''
+        if not user_config.solver_session:
+            return False
+        elif user_config.solver != 'glpk':
+            logging.warning('the solver session uses glpk, so it is not '
+                'used for the {} solver'.format(user_config.solver))
+            return False
+        elif self.backend != 'matrix':
+            logging.warning('the solver session requires the matrix backend')
+            return False
+        elif not solversession.available():
+            logging.warning('the solver session requires swiglpk')
+            return False
+        return True
+
     def add_children(self, objL, name):
         '''Add a child :class:`~optimization.OptimizationObject` to this object.'''
         self.children[name] = objL
@@ -291,29 +374,34 @@ class OptimizationProblem(OptimizationObject):
 
     def add_objective(self, expression, sense=pyomo.minimize):
         '''add an objective to the problem'''
-        self._model.objective = pyomo.Objective(
+        self._model.objective = self._backend.Objective(
             name='objective', rule=expression, sense=sense)
 
     def add_set(self, name, items, ordered=False):
         '''add a :class:`pyomo.Set` to the problem'''
         self._model.add_component(name,
-                                   pyomo.Set(initialize=items, name=name, ordered=ordered))
+                                   self._backend.Set(initialize=items, name=name, ordered=ordered))
 
     def add_variable(self, name, **kwargs):
         '''create a new variable and add it to the root problem'''
         def map_args(kind='Continuous', low=None, high=None):
-            return dict(bounds=(low, high), domain=variable_kinds[kind])
-        var = pyomo.Var(name=name, **map_args(**kwargs))
+            return dict(bounds=(low, high),
+                        domain=getattr(self._backend, variable_kinds[kind]))
+        var = self._backend.Var(name=name, **map_args(**kwargs))
         self._model.add_component(name, var)
 
     def add_constraint(self, name, expression, time=None):
         cname = self._t_id(name, time) if time is not None else name
         self._model.add_component(cname,
-                                   pyomo.Constraint(name=name, rule=expression))
+                                   self._backend.Constraint(name=name, rule=expression))
+
+    def add_constraint_set(self, name, index, expression):
+        self._model.add_component(name,
+            self._backend.Constraint(index, name=name, rule=expression))
 
     def add_suffix(self, name):
         self._model.add_component(name, 
-            pyomo.Suffix(direction=pyomo.Suffix.IMPORT))
+            self._backend.Suffix(direction=self._backend.Suffix.IMPORT))
 
 
     def get_component(self, name, scenario=None):
@@ -347,8 +435,16 @@ class OptimizationProblem(OptimizationObject):
         delattr(self._model, 'objective')
     
     def reset_model(self):
+        if self.backend == 'matrix':
+            self.solved = False
+            self.has_template = False
+            self.has_start_values = False
+            self._model = matrixmodel.ConcreteModel()
+            return
+
         instances = [self._model]
-        if self.stochastic_formulation:
+        if self.stochastic_formulation and \
+                self._stochastic_instance is not None:
             instances.append(self._stochastic_instance)
 
         for instance in instances:
@@ -399,15 +495,21 @@ class OptimizationProblem(OptimizationObject):
             self._scenario_tree._tree_nodes = None
             self._scenario_tree = None
 
-            self._stochastic_instance.components._component = {}
-            self._stochastic_instance.components._declarations = {}
+            if self._stochastic_instance is not None:
+                self._stochastic_instance.components._component = {}
+                self._stochastic_instance.components._declarations = {}
 
             self._stochastic_instance = None
 
         self.solved = False
+        self.has_template = False
+        self.has_start_values = False
         self._model = pyomo.ConcreteModel()
 
     def show_model(self):
+        if self.backend == 'matrix':
+            self._model.pprint()
+            return
         components = self._model.components._component
         items = [pyomo.Set, pyomo.Param, pyomo.Var,
                  pyomo.Objective, pyomo.Constraint]
@@ -428,18 +530,21 @@ class OptimizationProblem(OptimizationObject):
                 setattr(self._model, name, value(var))
             except ValueError:
                 # for boolean sets this sometimes doesn't work due to rounding
-                if var.domain == pyomo.Boolean:
+                if var.domain == self._backend.Boolean:
                     setattr(self._model, name, round(value(var)))
                 else:
                     raise
 
-    def solve(self):
+    def solve(self, get_duals=None):
         '''
         Send the optimization problem off to the solver.
+        :param get_duals: resolve the problem as an LP to get the duals
+            (the default is set by the `duals` option)
         '''
 
         solver = user_config.solver
-        get_duals = user_config.duals
+        if get_duals is None:
+            get_duals = user_config.duals
 
         logging.info('Solving with {s}'.format(s=solver))
 
@@ -466,21 +571,14 @@ class OptimizationProblem(OptimizationObject):
             raise OptimizationError('problem not solved')
 
         instance.load(results, allow_consistent_values_for_fixed_vars=True)
+        self.has_start_values = True
         logging.debug('... solution loaded')
 
         if get_duals:
-            # resolve with fixed variables
-            logging.info('resolving fixed-integer LP for duals')
-            _fix_binary_variables(instance)
-
-            results, elapsed = self._solve_instance(
-                instance, get_duals=get_duals)
-            self.solution_time += elapsed
+            results = self.solve_duals(instance)
 
-            instance.load(results)
-            logging.debug('... LP problem solved')
-
-        if self.stochastic_formulation:
+        if self.stochastic_formulation and \
+                not getattr(self, 'native_ef', False):
             self._scenario_tree.snapshotSolutionFromInstances(
                 self._scenario_instances)
 
@@ -491,6 +589,18 @@ class OptimizationProblem(OptimizationObject):
         # self.variables =   instance.active_components(pyomo.Var)
         return instance
 
+    def solve_duals(self, instance):
+        '''resolve a solved problem as an LP, with fixed variables'''
+        logging.info('resolving fixed-integer LP for duals')
+        _fix_binary_variables(instance)
+
+        results, elapsed = self._solve_instance(instance, get_duals=True)
+        self.solution_time += elapsed
+
+        instance.load(results)
+        logging.debug('... LP problem solved')
+        return results
+
     def __str__(self):
         return 'system'
 
@@ -500,6 +610,9 @@ class OptimizationProblem(OptimizationObject):
         keepfiles=False,
         ):
         
+        if self.use_session:
+            return self._solve_in_session(instance, get_duals)
+
         if user_config.keep_lp_files: 
             keepfiles = True
         
@@ -534,13 +647,27 @@ class OptimizationProblem(OptimizationObject):
         start = time.time()
          
         quiet_fn = not_quiet if keepfiles or show_solver_output else quiet
+
+        kwds = {}
+        if self._use_warmstart():
+            # start from the current variable values
+            kwds['warmstart'] = True
         
+        if self.backend == 'matrix':
+            # the solver reads the problem from an LP file
+            problem = instance.problem_file(
+                user_config.directory if keepfiles else None)
+        else:
+            problem = instance
+
         with quiet_fn():
-            results = self._opt_solver.solve(instance, 
+            results = self._opt_solver.solve(problem, 
                 suffixes=suffixes, 
                 keepfiles=keepfiles, 
                 tee=show_solver_output,
-                )
+                **kwds)
+        if self.backend == 'matrix' and not keepfiles:
+            os.remove(problem)
         try:
             self._opt_solver._symbol_map = None  # this should mimic the memory leak bugfix at: software.sandia.gov/trac/coopr/changeset/5449
         except AttributeError:
@@ -557,6 +684,47 @@ class OptimizationProblem(OptimizationObject):
 
         return results, elapsed
 
+    def _solve_in_session(self, instance, get_duals=False):
+        '''solve with the persistent solver session, which is kept for all stages'''
+        if self._session is None:
+            self._session = solversession.GLPKSession(
+                mipgap=user_config.mipgap,
+                time_limit=user_config.solver_time_limit)
+        # the session starts from its last basis, not the warm start
+        self._use_warmstart()
+        start = time.time()
+        results = self._session.solve(instance, get_duals=get_duals)
+        elapsed = (time.time() - start)
+        self.solved = detect_status(results, 'glpk')
+        if self.solved and not get_duals:
+            self.mipgap = results.Solution[0]['Gap']
+            logging.debug('solution gap={}'.format(self.mipgap))
+        return results, elapsed
+
+    def _use_warmstart(self):
+        '''
+        Pass the variable values to the solver as a MIP start
+        (for solvers which can use one, with the pyomo backend).
+        The first time the values can't be used, say why.
+        '''
+        if not (user_config.warmstart and self.has_start_values):
+            return False
+        if self.stochastic_formulation:
+            unused = 'stochastic problems'
+        elif self.use_session:
+            unused = 'the solver session'
+        elif self.backend != 'pyomo':
+            unused = 'the {} backend'.format(self.backend)
+        else:
+            capable = getattr(self._opt_solver, 'warm_start_capable', None)
+            if capable is not None and capable():
+                return True
+            unused = 'the {} solver'.format(self._opt_solver.name)
+        if not self._warmstart_logged:
+            logging.warning('the warm start is not used with {}'.format(unused))
+            self._warmstart_logged = True
+        return False
+
     def fix_binary_variables(self, fix_offs=True):
         _fix_binary_variables(
             self._model,
@@ -577,8 +745,7 @@ def _fix_binary_variables(instance, is_stochastic=False, fix_offs=True):
     '''fix binary variables to their solved values to create an LP problem'''
     active_vars = instance.active_components(pyomo.Var)
     for var in active_vars.values():
-        if isinstance(var.domain, pyomo.base.IntegerSet) or \
-                isinstance(var.domain, pyomo.base.BooleanSet):
+        if _is_discrete(var.domain):
             if var.is_indexed():
                 for key, ind_var in var.iteritems():
                     if fix_offs or ind_var.value >= 1 - 1e-5:
@@ -599,6 +766,12 @@ def _fix_binary_variables(instance, is_stochastic=False, fix_offs=True):
     instance.preprocess()
 
 
+def _is_discrete(domain):
+    return isinstance(domain, pyomo.base.IntegerSet) or \
+        isinstance(domain, pyomo.base.BooleanSet) or \
+        getattr(domain, 'discrete', False)
+
+
 def _fix_variables(names, instance):
     active_vars = instance.active_components(pyomo.Var)
     for var in active_vars.values():
@@ -632,6 +805,26 @@ def value(variable):
         return variable  # just a number
 
 
+def values_array(component, keys):
+    '''
+    The values of an indexed variable (or parameter) at the keys,
+    read from the component in one pass, as a float array.
+    If passed a number, will return an array of that number.
+    '''
+    if not hasattr(component, '__getitem__'):
+        return np.repeat(float(value(component)), len(keys))
+    return np.array([value(component[key]) for key in keys], dtype=float)
+
+
+def duals_array(suffix, component, keys):
+    '''
+    The duals of an indexed constraint at the keys,
+    read from the dual suffix in one pass, as a float array.
+    '''
+    get = suffix.getValue
+    return np.array([get(component[key]) for key in keys], dtype=float)
+
+
 def detect_status(results, solver):
     '''decide between a solver success or failure'''
     status_text = str(results.solver[0]['Termination condition'])
@@ -12,14 +12,17 @@ import logging
 from commonscripts import (update_attributes, getattrL, flatten, set_trace)
 from config import user_config
 
-from optimization import (value, OptimizationObject,
+from optimization import (value, duals_array, OptimizationObject,
                           OptimizationProblem, OptimizationError)
 import stochastic
+import lagrangian
 
 
 from coopr import pyomo
 import numpy as np
 import pandas as pd
+import scipy.sparse as sparse
+from scipy.sparse.linalg import splu
 
 
 class Load(OptimizationObject):
@@ -41,19 +44,34 @@ class Load(OptimizationObject):
             self.cost_shedding = user_config.cost_load_shedding
         self.init_optimization()
         self.shedding_mode = False
+        self.schedule_parameter = False
+        self.elastic = False
 
     def power(self, time, scenario=None, evaluate=False):
-        if self.shedding_mode:
+        if self.shedding_mode or self.elastic:
             power = self.get_variable('power', time, 
                 scenario=scenario, indexed=True)
-            if evaluate:
-                power = value(power)
-            return power
+        else:
+            power = self.scheduled_power(time)
+        if evaluate:
+            power = value(power)
+        return power
+
+    def scheduled_power(self, time):
+        '''
+        the scheduled power at time - a parameter when
+        the model is reused for multiple stages
+        '''
+        if self.schedule_parameter:
+            return self.get_parameter('scheduled_power', time, indexed=True)
         else:
             return self.get_scheduled_output(time)
 
     def shed(self, time, scenario=None, evaluate=False):
-        return self.get_scheduled_output(time) - self.power(time, scenario, evaluate)
+        scheduled = self.scheduled_power(time)
+        if evaluate:
+            scheduled = value(scheduled)
+        return scheduled - self.power(time, scenario, evaluate)
 
     def cost(self, time, scenario=None):
         return self.cost_shedding * self.shed(time, scenario)
@@ -65,14 +83,45 @@ class Load(OptimizationObject):
         return sum(self.cost(time) for time in times)
 
     def create_variables(self, times):
-        if self.shedding_mode:
-            self.add_variable('power', index=times.set, low=0)
+        self.elastic = self._parent_problem().elastic_shedding
+        if self.shedding_mode or self.elastic:
+            self.create_variables_shedding(times)
+        self.schedule_parameter = self._parent_problem().reuse_model
+        if self.schedule_parameter:
+            self.add_parameter('scheduled_power', index=times.set,
+                values=self._schedule_values(times))
+
+    def create_variables_shedding(self, times):
+        self.add_variable('power', index=times.set, low=0)
 
     def create_constraints(self, times):
-        if self.shedding_mode:
-            for time in times:
-                self.add_constraint('max_load_power', time,
-                                    self.power(time) <= self.get_scheduled_output(time))
+        if self.shedding_mode or self.elastic:
+            def max_load_power(model, t):
+                return self.power(t) <= self.scheduled_power(t)
+            self.add_constraint_set('max_load_power', times.set, max_load_power)
+
+    def set_shedding_bounds(self, times):
+        '''
+        for elastic shedding, fix the power to the scheduled power
+        (no shedding), unless the load is in shedding mode
+        '''
+        for t in times:
+            power = self.get_variable('power', t, indexed=True)
+            if self.shedding_mode:
+                power.fixed = False
+            else:
+                power.value = value(self.scheduled_power(t))
+                power.fixed = True
+
+    def update_stage(self, times):
+        '''set the scheduled power parameter for a new stage'''
+        power = self.get_parameter('scheduled_power', None, indexed=True)
+        for t, val in self._schedule_values(times).iteritems():
+            power[t] = val
+
+    def _schedule_values(self, times):
+        return dict([(t, self.get_scheduled_output(times.schedule_label(t)))
+            for t in times])
 
     def create_objective(self, times):
         return sum([self.cost(time) for time in times])
@@ -102,26 +151,83 @@ class Line(OptimizationObject):
 
     def price(self, time):
         '''congestion price on line'''
-        return self.get_dual('line flow', time)
+        return self.get_dual('line flow', time, indexed=True)
 
     def create_variables(self, times):
         self.add_variable('power', index=times.set)
+        # the times with limit constraints (for lazy line limits)
+        self.limit_times = set()
+        # the post-contingency limits, {(outaged line, time): factor}
+        self.contingencies = dict()
 
     def create_constraints(self, times, buses):
-        '''create the constraints for a line over all times'''
-        busNames = getattrL(buses, 'name')
-        iFrom, iTo = busNames.index(self.frombus), busNames.index(self.tobus)
-        for t in times:
-            line_flow_ij = self.power(t) == \
-                1 / self.reactance * (buses[iFrom].angle(t) -
-                                      buses[iTo].angle(t))
-            self.add_constraint('line flow', t, line_flow_ij)
-            self.add_constraint(
-                'line limit high', t, self.power(t) <= self.pmax)
-            self.add_constraint(
-                'line limit low', t, self.pmin <= self.power(t))
+        '''
+        create the constraints for a line over all times
+        :param buses: a dict of the :class:`~powersystems.Bus` objects, by name
+        '''
+        self.create_flow_constraint(times, buses)
+
+        for (outage, t), factor in self.contingencies.items():
+            if t in times.set:
+                self.create_contingency_constraints(outage, factor, t)
+
+        if self._parent_problem().lazy_line_limits:
+            # only the limits which have been violated
+            for t in times.set:
+                if t in self.limit_times:
+                    self.create_limit_constraints(t)
+            return
+
+        def line_limit_high(model, t):
+            return self.power(t) <= self.pmax
+
+        def line_limit_low(model, t):
+            return self.pmin <= self.power(t)
+
+        self.add_constraint_set('line limit high', times.set, line_limit_high)
+        self.add_constraint_set('line limit low', times.set, line_limit_low)
         return
 
+    def create_limit_constraints(self, time):
+        '''create the flow limits for a single time'''
+        self.limit_times.add(time)
+        self.add_constraint('line limit high', time,
+            self.power(time) <= self.pmax)
+        self.add_constraint('line limit low', time,
+            self.pmin <= self.power(time))
+
+    def create_contingency_constraints(self, outage, factor, time):
+        '''
+        create the flow limits for a single time, after the outage
+        of another line (with line outage distribution `factor`)
+        '''
+        self.contingencies[(outage, time)] = factor
+        post_flow = self.power(time) + factor * outage.power(time)
+        name = 'contingency {}'.format(outage)
+        self.add_constraint(name + ' high', time, post_flow <= self.pmax)
+        self.add_constraint(name + ' low', time, self.pmin <= post_flow)
+
+    def create_flow_constraint(self, times, buses):
+        '''
+        the line flow, from the bus angles or (for the PTDF formulation)
+        from the bus injections
+        '''
+        system = self._parent_problem()
+        if system.ptdf_mode:
+            factors = system.ptdf_factors(self)
+
+            def line_flow(model, t):
+                return self.power(t) == sum(
+                    factor * bus.Pinj(t) for bus, factor in factors)
+        else:
+            busFrom, busTo = buses[self.frombus], buses[self.tobus]
+
+            def line_flow(model, t):
+                return self.power(t) == \
+                    1 / self.reactance * (busFrom.angle(t) - busTo.angle(t))
+
+        self.add_constraint_set('line flow', times.set, line_flow)
+
     def __str__(self):
         return 'k{ind}'.format(ind=self.index)
 
@@ -146,7 +252,10 @@ class Bus(OptimizationObject):
         return self.get_variable('angle', time, indexed=True)
 
     def price(self, time):
-        return self.get_dual('power balance', time)
+        system = self._parent_problem()
+        if system.ptdf_mode:
+            return system.ptdf_price(self, time)
+        return self.get_dual('power balance', time, indexed=True)
 
     def Pgen(self, t, evaluate=False):
         if evaluate:
@@ -160,11 +269,20 @@ class Bus(OptimizationObject):
         else:
             return sum(ld.power(t) for ld in self.loads)
 
+    def Pinj(self, t):
+        '''net power injection at the bus'''
+        return self.Pgen(t) - self.Pload(t)
+
     def power_balance(self, t, Bmatrix, allBuses):
         if len(allBuses) == 1:
             lineFlowsFromBus = 0
         else:
-            lineFlowsFromBus = sum([Bmatrix[self.index][otherBus.index] * otherBus.angle(t) for otherBus in allBuses])  # P_{ij}=sum_{i} B_{ij}*theta_j ???
+            # P_i = sum_j B_ij * theta_j
+            # only this bus and its neighbors have nonzero elements in
+            # the (sparse) row of the admittance matrix
+            row = slice(Bmatrix.indptr[self.index], Bmatrix.indptr[self.index + 1])
+            lineFlowsFromBus = sum(B_ij * allBuses[j].angle(t) for j, B_ij in
+                zip(Bmatrix.indices[row], Bmatrix.data[row]))
         return sum([-lineFlowsFromBus, -self.Pload(t), self.Pgen(t)])
 
     def create_variables(self, times):
@@ -187,7 +305,8 @@ class Bus(OptimizationObject):
         for load in self.loads:
             load.create_variables(times)
         logging.debug('created load variables')
-        self.add_variable('angle', index=times.set)
+        if not self._parent_problem().ptdf_mode:
+            self.add_variable('angle', index=times.set)
         logging.debug('created bus variables ... returning')
         return
 
@@ -208,13 +327,22 @@ class Bus(OptimizationObject):
                 gen.create_constraints(times)
             for load in self.loads:
                 load.create_constraints(times)
+        if self._parent_problem().ptdf_mode:
+            # the power balance is a single system constraint
+            return
         nBus = len(buses)
-        for time in times:
-            self.add_constraint('power balance', time, self.power_balance(
-                time, Bmatrix, buses) == 0)  # power balance must be zero
-            if nBus > 1 and self.isSwing:
-                self.add_constraint('swing bus', time, self.angle(
-                    time) == 0)  # swing bus has angle=0
+
+        def power_balance(model, t):
+            # power balance must be zero
+            return self.power_balance(t, Bmatrix, buses) == 0
+
+        def swing_bus(model, t):
+            # swing bus has angle=0
+            return self.angle(t) == 0
+
+        self.add_constraint_set('power balance', times.set, power_balance)
+        if nBus > 1 and self.isSwing:
+            self.add_constraint_set('swing bus', times.set, swing_bus)
         return
     # def clear_constraints(self):
     #     self.constraints={}
@@ -249,14 +377,28 @@ class PowerSystem(OptimizationProblem):
 
         buses = self.make_buses_list(loads, generators)
         self.create_admittance_matrix(buses, lines)
+        # the optimization backend depends on the problem being stochastic
+        self.is_stochastic = len(
+            filter(lambda gen: gen.is_stochastic, generators)) > 0
         self.init_optimization()
 
         self.add_children(buses, 'buses')
         self.add_children(lines, 'lines')
 
-        self.is_stochastic = len(
-            filter(lambda gen: gen.is_stochastic, generators)) > 0
         self.shedding_mode = False
+        self.reuse_model = False
+        self.ptdf_mode = False
+        self.elastic_shedding = False
+        self.lazy_line_limits = False
+        self.contingency_screening = False
+        self.feasibility_screen = False
+        self.lagrangian = False
+        self.progressive_hedging = False
+        self.native_ef = False
+        self._ptdf = None
+        self._lodf = None
+        self._warmstart = {}
+        self._ptdf_rows = None
 
     def make_buses_list(self, loads, generators):
         """
@@ -278,24 +420,25 @@ class PowerSystem(OptimizationProblem):
             busNameL = [None]
 
         buses = []
-        swingHasBeenSet = False
-
+        busLookup = {}
         for b, busNm in enumerate(busNameL):
             newBus = Bus(name=busNm, index=b)
-            for gen in generators:
-                if gen.bus == newBus.name:
-                    newBus.generators.append(gen)
-                if not swingHasBeenSet:
-                    newBus.isSwing = swingHasBeenSet = True
-            for ld in loads:
-                if ld.bus == newBus.name:
-                    newBus.loads.append(ld)
+            busLookup[busNm] = newBus
             buses.append(newBus)
+
+        if len(generators) > 0:
+            buses[0].isSwing = True
+        for gen in generators:
+            if gen.bus in busLookup:
+                busLookup[gen.bus].generators.append(gen)
+        for ld in loads:
+            if ld.bus in busLookup:
+                busLookup[ld.bus].loads.append(ld)
         return buses
 
     def create_admittance_matrix(self, buses, lines):
         """
-        Creates the admittance matrix (B),
+        Creates the (sparse) admittance matrix (B),
         with elements = total admittance of line from bus i to j.
         Used in calculating the power balance for OPF problems.
 
@@ -303,15 +446,81 @@ class PowerSystem(OptimizationProblem):
         :param lines: list of :class:`~powersystems.Bus` objects
         """
         nB = len(buses)
-        self.Bmatrix = np.zeros((nB, nB))
-        namesL = [bus.name for bus in buses]
+        self.buses_by_name = dict((bus.name, bus) for bus in buses)
+        rows, cols, admittances = [], [], []
         for line in lines:
-            busFrom = buses[namesL.index(line.frombus)]
-            busTo = buses[namesL.index(line.tobus)]
-            self.Bmatrix[busFrom.index, busTo.index] += -1 / line.reactance
-            self.Bmatrix[busTo.index, busFrom.index] += -1 / line.reactance
-        for i in range(0, nB):
-            self.Bmatrix[i, i] = -1 * sum(self.Bmatrix[i, :])
+            iFrom = self.buses_by_name[line.frombus].index
+            iTo = self.buses_by_name[line.tobus].index
+            rows.extend([iFrom, iTo])
+            cols.extend([iTo, iFrom])
+            admittances.extend([-1 / line.reactance] * 2)
+        # duplicate (parallel line) entries are summed
+        B = sparse.coo_matrix((admittances, (rows, cols)), shape=(nB, nB))
+        diagonal = -1 * np.asarray(B.sum(axis=1)).ravel()
+        self.Bmatrix = (B + sparse.diags(diagonal, 0)).tocsr()
+
+    def ptdf(self):
+        '''
+        The power transfer distribution factors (lines by buses).
+        The network does not change between stages,
+        so the factors are only calculated once.
+        '''
+        if self._ptdf is None:
+            swing = [bus.index for bus in self.buses if bus.isSwing]
+            self._ptdf = ptdf_matrix(self.Bmatrix, self.lines,
+                self.buses_by_name, swing[0] if swing else 0)
+        return self._ptdf
+
+    def lodf(self):
+        '''
+        The line outage distribution factors (lines by outaged lines).
+        Like the PTDF, they are only calculated once.
+        '''
+        if self._lodf is None:
+            self._lodf = lodf_matrix(self.ptdf(), self.lines, self.buses_by_name)
+        return self._lodf
+
+    def ptdf_factors(self, line):
+        '''the (nonzero) distribution factors for a line, by bus'''
+        if self._ptdf_rows is None:
+            self._ptdf_rows = dict(
+                (id(ln), k) for k, ln in enumerate(self.lines))
+        factors = self.ptdf()[self._ptdf_rows[id(line)]]
+        return [(bus, factors[bus.index]) for bus in self.buses
+            if abs(factors[bus.index]) > 1e-10]
+
+    def ptdf_price(self, bus, time):
+        '''the bus LMP: the system price less the line congestion costs'''
+        if not user_config.duals:
+            return None
+        price = self._model.dual.getValue(
+            self.get_component('system_power_balance')[time])
+        factors = self.ptdf()[:, bus.index]
+        return price - sum(factors[k] * line.price(time)
+            for k, line in enumerate(self.lines) if abs(factors[k]) > 1e-10)
+
+    def prices(self, keys):
+        '''
+        The bus LMPs and the line congestion prices at the (time) keys,
+        read from the duals in one pass.
+        :returns: (time by bus) and (time by line) arrays,
+            or None if the duals were not requested
+        '''
+        if not user_config.duals:
+            return None, None
+        line_prices = np.zeros((len(keys), len(self.lines)))
+        for k, line in enumerate(self.lines):
+            line_prices[:, k] = line.get_duals('line flow', keys)
+        if self.ptdf_mode:
+            price = duals_array(self._model.dual,
+                self.get_component('system_power_balance'), keys)
+            lmps = np.outer(price, np.ones(len(self.buses)))
+            if len(self.lines):
+                lmps = lmps - line_prices.dot(self.ptdf())
+        else:
+            lmps = np.column_stack([bus.get_duals('power balance', keys)
+                for bus in self.buses])
+        return lmps, line_prices
 
     def loads(self):
         return flatten(bus.loads for bus in self.buses)
@@ -320,6 +529,17 @@ class PowerSystem(OptimizationProblem):
         return flatten(bus.generators for bus in self.buses)
 
     def create_variables(self, times):
+        self.ptdf_mode = user_config.ptdf and len(self.buses) > 1
+        self.elastic_shedding = user_config.elastic_shedding and \
+            not self.is_stochastic
+        self.lazy_line_limits = user_config.lazy_line_limits and \
+            len(self.lines) > 0
+        self.contingency_screening = user_config.contingency_screening and \
+            len(self.lines) > 1
+        self.feasibility_screen = user_config.feasibility_screen and \
+            not self.is_stochastic
+        self.lagrangian = user_config.lagrangian and \
+            not self.is_stochastic and len(times) > 1
         self.add_variable('cost_first_stage')
         self.add_variable('cost_second_stage')
         self.add_set('times', times._set, ordered=True)
@@ -328,6 +548,7 @@ class PowerSystem(OptimizationProblem):
             bus.create_variables(times)
         for line in self.lines:
             line.create_variables(times)
+        self.set_shedding_bounds(times, preprocess=False)
         logging.debug('... created power system vars... returning')
 
     def cost_first_stage(self, scenario=None):
@@ -346,17 +567,27 @@ class PowerSystem(OptimizationProblem):
             for bus in self.buses:
                 bus.create_constraints(times, self.Bmatrix, self.buses)
             for line in self.lines:
-                line.create_constraints(times, self.buses)
+                line.create_constraints(times, self.buses_by_name)
+
+        if self.ptdf_mode:
+            def power_balance(model, time):
+                return sum(bus.Pinj(time) for bus in self.buses) == 0
+            self.add_constraint_set('system_power_balance', times.set,
+                power_balance)
         
         # system reserve constraint
         self._has_reserve = not self.shedding_mode and \
             (self.reserve_fixed > 0 or self.reserve_load_fraction > 0)
         if self._has_reserve:
-            for time in times:
-                required_generation_availability = self.reserve_fixed + (1.0 + self.reserve_load_fraction) * sum(load.power(time) for load in self.loads())
+            loads = self.loads()
+            generators = self.generators()
+
+            def reserve(model, time):
+                required_generation_availability = self.reserve_fixed + (1.0 + self.reserve_load_fraction) * sum(load.power(time) for load in loads)
                 generation_availability = sum(
-                    gen.power_available(time) for gen in self.generators())
-                self.add_constraint('reserve', generation_availability >= required_generation_availability, time=time)
+                    gen.power_available(time) for gen in generators)
+                return generation_availability >= required_generation_availability
+            self.add_constraint_set('reserve', times.set, reserve)
 
         self.add_constraint('system_cost_first_stage', 
             self.cost_first_stage() == \
@@ -402,6 +633,38 @@ class PowerSystem(OptimizationProblem):
     def get_generator_with_observed(self):
         return filter(lambda gen: getattr(gen, 'observed_values', None) is not None, self.generators())[0]
 
+    def store_warmstart(self, times):
+        '''
+        store the solved generator statuses and outputs (by time),
+        to start the solve of the next stage
+        '''
+        self._warmstart = {}
+        for gen in self.get_generators_controllable():
+            self._warmstart[str(gen)] = pd.DataFrame(dict(
+                status=[value(gen.status(t)) for t in times],
+                power=[value(gen.power(t)) for t in times]),
+                index=times.times)
+
+    def set_warmstart(self, times):
+        '''
+        Set the generator variable values from the previous stage's solution.
+        The overlapping times use the stored values and later times
+        extend the last stored values.
+        '''
+        if not self._warmstart or self.is_stochastic:
+            return
+        for gen in self.get_generators_controllable():
+            stored = self._warmstart.get(str(gen))
+            if stored is None:
+                continue
+            start = stored.reindex(times.times, method='ffill')
+            for dt, t in times.strings.iteritems():
+                if start.status.isnull()[dt]:
+                    continue
+                _set_start_value(gen.status(t), start.status[dt])
+                _set_start_value(gen.power(t), start.power[dt])
+        self.has_start_values = True
+
     def get_finalconditions(self, sln):
         times = sln.times
 
@@ -412,7 +675,7 @@ class PowerSystem(OptimizationProblem):
 
         for gen in self.generators():
             g = str(gen)
-            stat = status[g]
+            stat = gen.solution_status(status)
             if sln.is_stochastic:
                 gen.finalstatus = dict(
                     power=sln.generators_power[g][tEnd],
@@ -424,6 +687,42 @@ class PowerSystem(OptimizationProblem):
                                                 times.non_overlap(), stat)
         return
 
+    def can_reuse_model(self, times):
+        '''can the current model be used as a template for the stage times'''
+        return self.has_template and len(times) == len(self._model.times)
+
+    def update_stage(self, times):
+        '''
+        Reuse the model built for a previous stage (of the same length)
+        by updating the schedule and initial condition parameters,
+        instead of recreating all of the variables and constraints.
+        '''
+        times.set = self._model.times
+        self._unfix_variables()
+        for gen in self.generators():
+            gen.update_stage(times)
+        for load in self.loads():
+            load.update_stage(times)
+        self.set_shedding_bounds(times, preprocess=False)
+        self._model.preprocess()
+        self.solved = False
+
+    def set_shedding_bounds(self, times, preprocess=True):
+        '''
+        For elastic shedding, the shedding variables always exist.
+        Fix them to no shedding, except for the loads
+        and generators which are in shedding mode.
+        '''
+        if not self.elastic_shedding:
+            return
+        for load in self.loads():
+            load.set_shedding_bounds(times)
+        for gen in self.get_generators_noncontrollable():
+            if gen.elastic:
+                gen.set_shedding_bounds(times)
+        if preprocess:
+            self._model.preprocess()
+
     def set_initialconditions(self, initTime):
         for gen in self.generators():
             finalstatus = getattr(gen, 'finalstatus', {})
@@ -433,23 +732,171 @@ class PowerSystem(OptimizationProblem):
         return
 
     def solve_problem(self, times):
+        if self.feasibility_screen:
+            infeasible = self.screen_feasibility(times)
+            if len(infeasible):
+                # skip the MIP attempt, which can't succeed
+                logging.critical('stage infeasible at {}, solve with shedding.'
+                    .format(', '.join(map(str, infeasible.index))))
+                logging.info('infeasible times\n{}'.format(infeasible))
+                self.allow_shedding(times)
+        if self.lagrangian:
+            # commit by Lagrangian relaxation, then solve the dispatch
+            lagrangian.fix_commitment(self, times)
         try:
-            instance = self.solve()
+            instance = self.solve_network(times)
                             
         except OptimizationError:
+            if self.shedding_mode:
+                scheduled, committed = self.debug_infeasible(times)
+                raise OptimizationError('failed to solve with shedding.')
             # re-do stage, with load shedding allowed
             logging.critical('stage infeasible, re-run with shedding.')
             self.allow_shedding(times)
             try:
-                instance = self.solve()
+                instance = self.solve_network(times)
             except OptimizationError:
                 scheduled, committed = self.debug_infeasible(times)
                 raise OptimizationError('failed to solve with shedding.')
         return instance
 
+    def screen_feasibility(self, times, tolerance=1e-5):
+        '''
+        Check (before solving) whether the stage can be feasible
+        without shedding. The net load at each time is compared to
+        the bounds on the controllable generation (see
+        :meth:`~generators.Generator.power_bounds`) and, if there
+        is a reserve requirement, to the available generation.
+        :returns: a DataFrame of the times which are infeasible
+            (empty if none are found)
+        '''
+        load = np.array([sum(value(load.scheduled_power(time))
+            for load in self.loads()) for time in times])
+        noncontrollable = self.get_generators_noncontrollable()
+        available = np.array([sum(value(gen.power_available(time))
+            for gen in noncontrollable) for time in times])
+        # sheddable generation can always be turned down
+        unsheddable = np.array([sum(value(gen.power_available(time))
+            for gen in noncontrollable if not gen.shedding_mode)
+            for time in times])
+
+        bounds = [gen.power_bounds(times)
+            for gen in self.get_generators_controllable()]
+        low = sum(b[0] for b in bounds) + np.zeros(len(times))
+        high = sum(b[1] for b in bounds) + np.zeros(len(times))
+
+        screen = pd.DataFrame(dict(
+            net_load=load - available,
+            min_generation=low,
+            max_generation=high,
+            ), index=times.times)
+        infeasible = (high < load - available - tolerance) | \
+            (low > load - unsheddable + tolerance)
+        if self.reserve_required:
+            screen['reserve_required'] = self.reserve_fixed + \
+                (1.0 + self.reserve_load_fraction) * load - available
+            infeasible |= high < screen.reserve_required.values - tolerance
+        return screen[infeasible]
+
+    def solve(self, get_duals=None):
+        if self.stochastic_formulation and self.progressive_hedging:
+            # the scenarios are solved separately
+            return stochastic.solve_progressive_hedging(self)
+        return super(PowerSystem, self).solve(get_duals)
+
+    def solve_network(self, times):
+        '''
+        Solve the problem. With lazy line limits or contingency screening,
+        the limits of any overloaded lines (before or after an outage)
+        are added and the problem is re-solved, until no lines are overloaded.
+        '''
+        if not (self.lazy_line_limits or self.contingency_screening):
+            return self.solve()
+
+        instance = self.solve(get_duals=False)
+        while self.add_violated_constraints():
+            instance = self.solve(get_duals=False)
+        if user_config.duals:
+            self.solve_duals(instance)
+        return instance
+
+    def add_violated_constraints(self):
+        '''
+        Check the solved line flows and add the violated constraints.
+        :returns: the number of constraints added
+        '''
+        flows = pd.DataFrame(dict(
+            (k, line.values('power')) for k, line in enumerate(self.lines)))
+        added = 0
+        if self.lazy_line_limits:
+            added += self.add_violated_line_limits(flows)
+        if self.contingency_screening:
+            added += self.add_violated_contingencies(flows)
+        return added
+
+    def add_violated_line_limits(self, flows, tolerance=1e-5):
+        '''
+        Add limit constraints for the lines and times where the
+        solved flow is outside of the line limits.
+        :param flows: a DataFrame of the solved line flows (times by lines)
+        :returns: the number of (line, time) limits added
+        '''
+        pmax = np.array(getattrL(self.lines, 'pmax'), dtype=float)
+        pmin = np.array(getattrL(self.lines, 'pmin'), dtype=float)
+        overloaded = (flows.values > pmax + tolerance) | \
+            (flows.values < pmin - tolerance)
+
+        added = 0
+        for i, k in zip(*np.nonzero(overloaded)):
+            line, t = self.lines[flows.columns[k]], flows.index[i]
+            if t not in line.limit_times:
+                line.create_limit_constraints(t)
+                added += 1
+        if added:
+            logging.info('added {} violated line limits'.format(added))
+        return added
+
+    def add_violated_contingencies(self, flows, tolerance=1e-5):
+        '''
+        Screen the post-contingency flows for all single line outages
+        and add limit constraints for the overloaded
+        (outage, line, time) combinations.
+        :param flows: a DataFrame of the solved line flows (times by lines)
+        :returns: the number of contingency constraints added
+        '''
+        lodf = self.lodf()
+        screened = ~np.isnan(lodf)
+        lodf = np.nan_to_num(lodf)
+        pmax = np.array(getattrL(self.lines, 'pmax'), dtype=float)[:, None]
+        pmin = np.array(getattrL(self.lines, 'pmin'), dtype=float)[:, None]
+
+        added = 0
+        for i, t in enumerate(flows.index):
+            pre = flows.values[i]
+            # post[l, m] is the flow on line l after the outage of line m
+            post = pre[:, None] + lodf * pre[None, :]
+            overloaded = screened & (
+                (post > pmax + tolerance) | (post < pmin - tolerance))
+            for l, m in zip(*np.nonzero(overloaded)):
+                line, outage = self.lines[l], self.lines[m]
+                if (outage, t) not in line.contingencies:
+                    line.create_contingency_constraints(outage, lodf[l, m], t)
+                    added += 1
+        if added:
+            logging.info('added {} contingency constraints'.format(added))
+        return added
+
     def resolve_stochastic_with_observed(self, instance, sln):
+        # the resolve changes the solved values
+        sln.detach()
         s = sln.scenarios[0]
-        self._model = instance.active_components(pyomo.Block)[s]
+        if self.progressive_hedging:
+            self._model = self._scenario_instances[s]
+        else:
+            self._model = instance.active_components(pyomo.Block)[s]
+        if self.native_ef:
+            # the commitment is shared, outside of the scenario's block
+            stochastic.fix_shared_commitment(instance)
         self.is_stochastic = False
         self.stochastic_formulation = False
 
@@ -473,6 +920,7 @@ class PowerSystem(OptimizationProblem):
         sln.expected_load_shed = float(sln.load_shed)
 
         # resolve the problem
+        sln.detach()
         self._resolve_problem(sln)
 
         # re-calc the generator outputs and costs
@@ -498,18 +946,29 @@ class PowerSystem(OptimizationProblem):
 
     def allow_shedding(self, times, resolve=False):
         self.shedding_mode = True
+        if self.elastic_shedding:
+            self._allow_elastic_shedding(times, resolve)
+            return
+        # the model is modified, so it can't be reused for the next stage
+        self.has_template = False
         self._set_load_shedding(True)
         
         if not user_config.economic_wind_shed:
             logging.debug('allowing non-controllable generation shedding')
             self._set_gen_shedding(True)
 
-        const_times = times.non_overlap() if resolve else times
+        const_times = times
+        if resolve:
+            # the model's times are the non-overlap times
+            # (copied, as non_overlap returns the times themselves
+            # when there is no overlap)
+            const_times = times.non_overlap().copy()
+            const_times.set = self._model.times
 
         # make load power into a variable instead of a param
         for load in self.loads():
             try: 
-                load.create_variables(times)  # need all for the .set attrib
+                load.create_variables_shedding(times)  # need all for the .set attrib
                 load.create_constraints(const_times)
             except RuntimeError:
                 # load already has a power variable and shedding constraint
@@ -523,11 +982,19 @@ class PowerSystem(OptimizationProblem):
                 gen.create_constraints(const_times)
 
         # recalc the power balance constraint
-        for bus in self.buses:
-            for time in const_times:
-                bus._remove_component('power balance', time)
-            bus.create_constraints(const_times,
-                self.Bmatrix, self.buses, include_children=False)
+        if self.ptdf_mode:
+            # the line flows depend on the load power
+            for line in self.lines:
+                line._remove_component('line flow')
+                line.create_flow_constraint(const_times, self.buses_by_name)
+            self._remove_component('system_power_balance')
+        else:
+            for bus in self.buses:
+                bus._remove_component('power balance')
+                if len(self.buses) > 1 and bus.isSwing:
+                    bus._remove_component('swing bus')
+                bus.create_constraints(const_times,
+                    self.Bmatrix, self.buses, include_children=False)
 
         # reset objective
         self.reset_objective()
@@ -549,6 +1016,18 @@ class PowerSystem(OptimizationProblem):
             stochastic.create_problem_with_scenarios(self, times)
             
 
+    def _allow_elastic_shedding(self, times, resolve=False):
+        '''allow shedding by unfixing the shedding variables'''
+        self._set_load_shedding(True)
+        if not user_config.economic_wind_shed:
+            self._set_gen_shedding(True)
+        self.set_shedding_bounds(times.non_overlap() if resolve else times)
+        if getattr(self, '_has_reserve', False):
+            # there is no reserve requirement when shedding
+            self._remove_component('reserve')
+            self._has_reserve = False
+            self.has_template = False
+
     def disallow_shedding(self):
         # change shedding allowed flags for the next stage
         self.shedding_mode = False
@@ -571,6 +1050,8 @@ class PowerSystem(OptimizationProblem):
         # set wind to observed power
         gen = self.get_generator_with_observed()
         gen.set_power_to_observed(times)
+        # the elastic shedding variables are fixed to the power
+        self.set_shedding_bounds(times)
 
         # reset objective to only the non-overlap times
         self.reset_objective()
@@ -588,7 +1069,7 @@ class PowerSystem(OptimizationProblem):
 
         logging.info('resolving with observed values')
         try:
-            self.solve()
+            self.solve_network(times)
         except OptimizationError:
             faststarts = map(lambda gen: str(gen), filter(lambda gen: gen.faststart, self.generators()))
             # at least one faststarting unit must be available (off)
@@ -618,7 +1099,10 @@ class PowerSystem(OptimizationProblem):
 
     def _resolve_with_faststarts(self, sln):
         '''allow faststart units to be started up to meet the load'''
+        times = sln.times_non_overlap
         self._unfix_variables()
+        # unfixing also frees the elastic shedding variables
+        self.set_shedding_bounds(times, preprocess=False)
         self._fix_non_faststarts(sln.times)
         logging.warning('allowing fast-starting units')
         
@@ -626,6 +1110,7 @@ class PowerSystem(OptimizationProblem):
             self.solve()
         except OptimizationError:
             self._unfix_variables()
+            self.set_shedding_bounds(times, preprocess=False)
             self._fix_non_faststarts(sln.times, fix_power=False)
             logging.warning(
                 'allowing non fast-starters to change power output')
@@ -670,7 +1155,9 @@ class PowerSystem(OptimizationProblem):
                 scheduled.expected_wind - scheduled.observed_wind
         else:
             scheduled = pd.DataFrame({
-                'load': self.total_scheduled_load().ix[times.strings.values]})
+                'load': self.total_scheduled_load().ix[
+                    times.schedule_strings.values].values},
+                index=times.strings.values)
 
             if self.is_stochastic:
                 gen = self.get_generator_with_scenarios()
@@ -690,7 +1177,8 @@ class PowerSystem(OptimizationProblem):
                 
             else:                    
                 if any([hasattr(gen, 'schedule') for gen in self.generators()]):
-                    scheduled['generation'] = self.total_scheduled_generation().ix[times.strings.values]
+                    scheduled['generation'] = self.total_scheduled_generation().ix[
+                        times.schedule_strings.values].values
                 else:
                     scheduled['generation'] = 0
                     
@@ -739,3 +1227,52 @@ class PowerSystem(OptimizationProblem):
             print pd.Series([gen.initial_status for gen in self.generators()])
         
         return scheduled, committed
+
+
+def _set_start_value(var, start):
+    # numbers (e.g. the status of a non-commitment problem)
+    # and fixed variables keep their value
+    if getattr(var, 'fixed', True):
+        return
+    var.value = start
+
+
+def ptdf_matrix(Bmatrix, lines, buses_by_name, swing=0):
+    '''
+    Calculate the power transfer distribution factors:
+    the flow on each line (rows) for a unit injection at each bus (columns),
+    withdrawn at the swing bus.
+    '''
+    nB = Bmatrix.shape[0]
+    keep = [i for i in range(nB) if i != swing]
+    # line flows as a function of the bus angles
+    flows = np.zeros((len(lines), nB))
+    for k, line in enumerate(lines):
+        flows[k, buses_by_name[line.frombus].index] = 1.0 / line.reactance
+        flows[k, buses_by_name[line.tobus].index] = -1.0 / line.reactance
+    factors = np.zeros((len(lines), nB))
+    if len(lines) and len(keep):
+        B_reduced = Bmatrix[keep][:, keep].tocsc()
+        factors[:, keep] = splu(B_reduced).solve(
+            np.ascontiguousarray(flows[:, keep].T)).T
+    return factors
+
+
+def lodf_matrix(ptdf, lines, buses_by_name):
+    '''
+    Calculate the line outage distribution factors: the change in flow
+    on each line (rows) per unit of pre-outage flow on the outaged line
+    (columns). Outages which would island part of the network
+    and the outaged line itself are NaN.
+    '''
+    iFrom = [buses_by_name[line.frombus].index for line in lines]
+    iTo = [buses_by_name[line.tobus].index for line in lines]
+    # flows for a unit transfer between the ends of each line
+    transfer = ptdf[:, iFrom] - ptdf[:, iTo]
+    denominator = 1 - np.diag(transfer)
+    islanding = np.abs(denominator) < 1e-8
+    denominator[islanding] = 1
+    lodf = transfer / denominator
+    lodf[:, islanding] = np.nan
+    np.fill_diagonal(lodf, np.nan)
+    return lodf
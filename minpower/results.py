@@ -5,6 +5,7 @@
 """
 import logging
 import os
+import json
 import pandas as pd
 import numpy as np
 
@@ -20,6 +21,9 @@ from schedule import TimeIndex
 from optimization import value
 from config import user_config
 
+# the generator quantities which are read in bulk (see :meth:`Generator.bulk_values`)
+bulk_methods = ['power', 'status', 'cost', 'operatingcost', 'shed']
+
 def prettify_plots(for_publication=True):
     plot.rc("xtick", direction="out")
     plot.rc("ytick", direction="out")
@@ -93,21 +97,147 @@ def make_multistage_solution(power_system, stage_times, stage_solutions):
     return klass(power_system, stage_times, stage_solutions)
 
 
+# the solution quantities which standalone runs store
+# (see :func:`standalone.store_state`)
+standalone_quantities = ['outputs', 'costs', 'shedding']
+
+
+def needed_quantities():
+    '''the solution quantities that the run needs'''
+    names = user_config.solution_quantities
+    if names == 'all':
+        if user_config.standalone:
+            return standalone_quantities
+        return Solution.quantities.keys()
+    names = [name.strip() for name in names.split(',')]
+    unknown = set(names).difference(Solution.quantities)
+    if unknown:
+        raise ValueError('unknown solution quantities: {}'.format(
+            ', '.join(sorted(unknown))))
+    return names
+
+
+def compact_array(values, dtype):
+    '''
+    The values as the compact `dtype` (e.g. int8 for statuses,
+    float32 for power), if the values are kept (to about 1e-6).
+    Otherwise the values are returned as floats.
+    '''
+    values = np.asarray(values, dtype=float)
+    compact = values.astype(dtype)
+    error = np.abs(compact.astype(float) - values)
+    if (error <= 1e-6 * np.maximum(1, np.abs(values))).all():
+        return compact
+    return values
+
+
+def json_values(values):
+    '''a list of floats (with None for missing values), for json'''
+    return [None if v is None or np.isnan(v) else float(v) for v in values]
+
+
+def read_results(filename='results.json'):
+    '''
+    Read the results saved by :meth:`Solution.saveNPZ`.
+    :param filename: the manifest filename
+    :returns: dict of the result tables (as pandas objects), the manifest
+    '''
+    with open(filename) as f:
+        manifest = json.load(f)
+    arrays = np.load(joindir(os.path.dirname(filename), manifest['arrays']))
+    tables = {}
+    for name, info in manifest['tables'].items():
+        index = arrays[name + '_index']
+        if info['datetime_index']:
+            index = pd.to_datetime(index)
+        if info['columns'] is None:
+            tables[name] = pd.Series(arrays[name], index=index)
+        else:
+            tables[name] = pd.DataFrame(arrays[name],
+                index=index, columns=info['columns'])
+    return tables, manifest
+
+
+def price_dataframe(prices, objects, keys):
+    '''
+    A (time by object) prices array as a DataFrame.
+    Without the duals (prices is None) the frame is all None.
+    '''
+    if prices is None:
+        prices = np.empty((len(keys), len(objects)), dtype=object)
+    return pd.DataFrame(prices, index=keys,
+                        columns=[str(obj) for obj in objects])
+
+
 class Solution(object):
     '''
     Solution information template for a power system over times.
     Each problem type has its own class for visualization and
     spreadsheet output, e.g. :class:`~solution.Solution_ED`.
     '''
+    # the quantities which are loaded (on first access) from the model:
+    # name: (loading method, attributes set)
+    quantities = dict(
+        outputs=('_get_outputs',
+            ['generators_power', 'generators_status', '_cluster_status']),
+        costs=('_get_generation_costs',
+            ['totalcost_generation', 'fuelcost']),
+        truecost=('_get_true_cost', ['fuelcost_true', 'costerror']),
+        incremental_cost=('_get_incremental_cost', ['incremental_cost']),
+        shedding=('_get_shedding', ['load_shed_timeseries',
+            'gen_shed_timeseries', 'load_shed', 'gen_shed']),
+        prices=('_get_prices', ['lmps', 'line_prices']),
+    )
+
     def __init__(self, power_system, times, datadir='.', is_stochastic=False):
         update_attributes(self, locals())
         self._resolved = False
         self._setup_powersystem()
 
         self._get_problem_info()
-        self._get_outputs()
-        self._get_costs()
-        self._get_prices()
+        self._setup_quantities()
+
+    def _setup_quantities(self):
+        self._loaded = set()
+        self._detached = False
+        self._quantity_of = dict((attr, name) for name, (method, attrs)
+            in self.quantities.items() for attr in attrs)
+
+    def __getattr__(self, name):
+        # only called for attributes which have not been set
+        quantity = self.__dict__.get('_quantity_of', {}).get(name)
+        if quantity is None or quantity in self._loaded:
+            raise AttributeError(name)
+        if self._detached:
+            raise AttributeError('{} was not loaded before the model changed'
+                ' (add "{}" to the solution_quantities option)'.format(
+                    name, quantity))
+        self.load([quantity])
+        return object.__getattribute__(self, name)
+
+    def load(self, names):
+        '''load the named quantities (that are not already loaded)'''
+        for name in names:
+            if name in self.quantities and name not in self._loaded:
+                try:
+                    getattr(self, self.quantities[name][0])()
+                except AttributeError as error:
+                    # from __getattr__ this would look like a missing
+                    # attribute (and be hidden by hasattr)
+                    raise RuntimeError(
+                        'loading the solution {} failed: {}'.format(
+                            name, error))
+                self._loaded.add(name)
+
+    def detach(self):
+        '''
+        Load the quantities that the run needs (set by the
+        `solution_quantities` option) before the model changes.
+        After this, no more quantities are loaded from the model.
+        '''
+        if not self._detached:
+            self.load(needed_quantities())
+            self._detached = True
 
     def _setup_powersystem(self):
         '''shortcuts for power system attributes'''
@@ -134,9 +264,31 @@ class Solution(object):
         times = self.times_non_overlap if non_overlap else self.times
         if generators is None:
             generators = self.generators
+        if method in bulk_methods and len(generators) > 0:
+            # read each generator's values in one pass
+            keys = [str(t) for t in times]
+            return gen_time_dataframe(generators, times, np.column_stack(
+                [gen.bulk_values(method, keys) for gen in generators]))
         return gen_time_dataframe(generators, times,
             [self.get_values(generators, method, t, evaluate) for t in times])
 
+    def _disaggregate(self, df, kind='total'):
+        '''
+        Replace the columns of any clustered generators with
+        columns for their units (see :meth:`~generators.Generator_Cluster.disaggregate`).
+        '''
+        if not any(gen.count > 1 for gen in self.generators):
+            return df
+        columns = []
+        for gen in self.generators:
+            g = str(gen)
+            if gen.count > 1:
+                columns.append(gen.disaggregate(
+                    df[g], self._cluster_status[g], kind))
+            else:
+                columns.append(df[[g]])
+        return pd.concat(columns, axis=1)
+
     def _get_problem_info(self):
         self.solve_time = self.power_system.solution_time
         self.objective = float(value(self.power_system.objective))
@@ -146,15 +298,34 @@ class Solution(object):
             self.mipgap = None
 
     def _get_outputs(self):
-        self.generators_power = self.gen_time_df('power')
-        self.generators_status = correct_status(self.gen_time_df('status'))
+        status = self.gen_time_df('status')
+        # the number of units on, for clustered generators
+        self._cluster_status = status.round()
+        self.generators_power = self._disaggregate(self.gen_time_df('power'))
+        self.generators_status = correct_status(
+            self._disaggregate(status, kind='status'))
 
     def _get_costs(self):
-        self.totalcost_generation = self.gen_time_df('cost', evaluate=True)
-        self.fuelcost = self.gen_time_df('operatingcost', evaluate=True)
+        self._get_generation_costs()
+        self._get_true_cost()
+        self._get_incremental_cost()
+        self._get_shedding()
+
+    def _get_generation_costs(self):
+        self.totalcost_generation = self._disaggregate(
+            self.gen_time_df('cost', evaluate=True))
+        self.fuelcost = self._disaggregate(
+            self.gen_time_df('operatingcost', evaluate=True))
+
+    def _get_true_cost(self):
         self.fuelcost_true = self.gen_time_df('truecost').sum().sum()
-        self.incremental_cost = self.gen_time_df('incrementalcost')
+        self._get_cost_error()
+
+    def _get_incremental_cost(self):
+        self.incremental_cost = self._disaggregate(
+            self.gen_time_df('incrementalcost'), kind='intensive')
 
+    def _get_shedding(self):
         times = self.times_non_overlap
         self.load_shed_timeseries = pd.Series(
             [sum(self.get_values(
@@ -171,7 +342,6 @@ class Solution(object):
             logging.debug('generation shed: {}MW'.format(self.gen_shed))
         if self.load_shed > 0.01:
             logging.debug('load shed: {}MW'.format(self.load_shed))
-        self._get_cost_error()
 
     def _get_cost_error(self):
         try:
@@ -181,11 +351,76 @@ class Solution(object):
             self.costerror = 0
 
     def _get_prices(self):
-        self.lmps = {}
-        self.line_prices = {}
-        for t in self.times:
-            self.lmps[str(t)] = [bus.price(t) for bus in self.buses]
-            self.line_prices[str(t)] = [line.price(t) for line in self.lines]
+        '''the bus LMPs and line prices, by time label and bus (or line)'''
+        keys = [str(t) for t in self.times]
+        lmps, line_prices = self.power_system.prices(keys)
+        self.lmps = price_dataframe(lmps, self.buses, keys)
+        self.line_prices = price_dataframe(line_prices, self.lines, keys)
+
+    # the tables saved by :meth:`saveNPZ`: (name, attribute, compact dtype)
+    npz_tables = [
+        ('power', 'generators_power', np.float32),
+        ('status', 'generators_status', np.int8),
+        ('cost', 'totalcost_generation', np.float32),
+        ('fuelcost', 'fuelcost', np.float32),
+        ('load_shed', 'load_shed_timeseries', np.float32),
+        ('gen_shed', 'gen_shed_timeseries', np.float32),
+    ]
+    # the tables which are saved only when they are available
+    # (e.g. the prices, which need the duals)
+    npz_optional_tables = [
+        ('lmps', 'lmps', np.float32),
+        ('line_prices', 'line_prices', np.float32),
+    ]
+
+    def _npz_tables(self):
+        '''the tables this solution saves, as (name, attr, dtype, optional)'''
+        return [table + (False,) for table in self.npz_tables] + \
+            [table + (True,) for table in self.npz_optional_tables]
+
+    def saveNPZ(self, filename='results'):
+        '''
+        Save the result tables as compact arrays in a compressed numpy
+        archive (`results.npz`), with a manifest (`results.json`)
+        describing the tables, the stages and the configuration.
+        Read them back with :func:`read_results`.
+        '''
+        arrays, tables = {}, OrderedDict()
+        for name, attr, dtype, optional in self._npz_tables():
+            table = getattr(self, attr, None)
+            if not isinstance(table, (pd.Series, pd.DataFrame)) or \
+                    table.values.dtype == object:
+                if not optional:
+                    logging.warning('the {} table ({}) is not available'
+                        ' and is not saved'.format(name, attr))
+                continue
+            values = compact_array(table.values, dtype)
+            arrays[name] = values
+            arrays[name + '_index'] = np.array([str(i) for i in table.index])
+            tables[name] = dict(
+                dtype=str(values.dtype),
+                shape=list(values.shape),
+                columns=[str(c) for c in table.columns]
+                    if isinstance(table, pd.DataFrame) else None,
+                datetime_index=isinstance(table.index, pd.DatetimeIndex),
+                )
+
+        archive = full_filename(filename + '.npz')
+        np.savez_compressed(archive, **arrays)
+        manifest = dict(
+            arrays=os.path.basename(archive),
+            tables=tables,
+            stages=self._stage_info(),
+            configuration=dict(user_config),
+            )
+        with open(full_filename(filename + '.json'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+    def _stage_info(self):
+        return dict(
+            solve_time=json_values([self.solve_time]),
+            mipgap=json_values([self.mipgap]),
+            objective=json_values([self.objective]))
 
     def savevisualization(self, filename=None):
         '''Save the visualization to a file'''
@@ -223,7 +458,7 @@ class Solution(object):
         return ['solved in {time:0.4f} sec'.format(time=self.solve_time)]
 
     def info_price(self, t):
-        return ['price={}'.format(self.lmps[str(t)])]
+        return ['price={}'.format(self.lmps.ix[str(t)].tolist())]
 
     def info_loads(self, t):
         out = ['load info:']
@@ -241,8 +476,9 @@ class Solution(object):
                                  bus.Pload(
                                      t, evaluate=True) for bus in buses]),
                'angle={}'.format(self.get_values(
-                                 buses, 'angle', t) if len(buses) > 1 else []),
-               'LMP={}'.format(self.lmps[str(t)])]
+                                 buses, 'angle', t) if len(buses) > 1 and
+                                 not self.power_system.ptdf_mode else []),
+               'LMP={}'.format(self.lmps.ix[str(t)].tolist())]
         return out
 
     def info_lines(self, t):
@@ -251,7 +487,7 @@ class Solution(object):
                 'connecting={}'.format(
                     zip(getattrL(lines, 'frombus'), getattrL(lines, 'tobus'))),
                 'Pk={}'.format(self.get_values(lines, 'power', t)),
-                'price={}'.format(self.line_prices[str(t)])]
+                'price={}'.format(self.line_prices.ix[str(t)].tolist())]
 
     def info_cost(self):
         return ['objective cost={}'.format(self.objective),
@@ -278,7 +514,7 @@ class Solution_ED(Solution):
         if not do_plotting:
             return
         t = self.times[0]
-        price = self.lmps[str(t)][0]
+        price = self.lmps.ix[str(t)].values[0]
         generators = self.generators
         loads = self.loads
 
@@ -462,7 +698,7 @@ class Solution_OPF(Solution):
         data.append(self.get_values(lines, 'power', t))
         fields.append(
             'congestion shadow price')
-        data.append(self.line_prices[str(t)])
+        data.append(self.line_prices.ix[str(t)].tolist())
 
         writeCSV(fields, transpose(
             data), filename=full_filename('powerflow-lines.csv'))
@@ -491,7 +727,7 @@ class Solution_UC(Solution):
         if not do_plotting:
             return
 
-        prices = [self.lmps[str(t)][0] for t in self.times]
+        prices = self.lmps[self.lmps.columns[0]].tolist()
         stack_plot_UC(
             self, self.power_system.generators(), self.times, prices, withPrices=withPrices)
         self.savevisualization(full_filename('commitment.png'))
@@ -524,6 +760,8 @@ class Solution_UC_multistage(Solution_UC):
         self.objective = self._sum_over('objective', stage_solutions)
         self.solve_time = self._sum_over('solve_time', stage_solutions)
         self.mipgaps = pd.Series([sln.mipgap for sln in stage_solutions])
+        self.solve_times = pd.Series(
+            [sln.solve_time for sln in stage_solutions])
 
         self._get_outputs(stage_solutions)
         self._get_costs(stage_solutions)
@@ -557,6 +795,32 @@ class Solution_UC_multistage(Solution_UC):
             self.observed_cost = self.totalcost_generation = \
                 self._concat('observed_totalcost', slns)
 
+    npz_tables = [
+        ('power', 'generators_power', np.float32),
+        ('status', 'generators_status', np.int8),
+        ('expected_cost', 'expected_cost', np.float32),
+        ('load_shed', 'load_shed_timeseries', np.float32),
+        ('gen_shed', 'gen_shed_timeseries', np.float32),
+    ]
+    # the tables of the solutions resolved with the observed values
+    npz_resolved_tables = [
+        ('expected_power', 'expected_power', np.float32),
+        ('expected_status', 'expected_status', np.int8),
+        ('observed_cost', 'observed_cost', np.float32),
+    ]
+    npz_optional_tables = [('lmps', 'lmps', np.float32)]
+
+    def _npz_tables(self):
+        tables = super(Solution_UC_multistage, self)._npz_tables()
+        if self._resolved:
+            tables += [table + (False,) for table in self.npz_resolved_tables]
+        return tables
+
+    def _stage_info(self):
+        return dict(
+            solve_time=json_values(self.solve_times),
+            mipgap=json_values(self.mipgaps))
+
     def info_cost(self):
         resolved = self._resolved
         expected = 'expected ' if resolved else ''
@@ -572,10 +836,18 @@ class Solution_UC_multistage(Solution_UC):
 
     def _get_prices(self, stage_solutions):
         self.lmps = {}
+        # stage times may be labeled relative to the stage start
+        # so key the prices by the multistage time labels
+        labels = self.times.strings
         try:
+            stage_lmps = []
             for stage in stage_solutions:
-                self.lmps.update(stage.lmps)
-        except:
+                stage_strings = stage.times_non_overlap.strings
+                lmps = stage.lmps.ix[stage_strings.values]
+                lmps.index = labels[stage_strings.index].values
+                stage_lmps.append(lmps)
+            self.lmps = pd.concat(stage_lmps)
+        except AttributeError:
             # no lmps in stochastic solutions right now
             pass
 
@@ -606,6 +878,10 @@ class Solution_UC_multistage(Solution_UC):
 
 
 class MultistageStandalone(Solution_UC_multistage):
+    npz_resolved_tables = [
+        ('observed_cost', 'observed_cost', np.float32)]
+    npz_optional_tables = []
+
     def __init__(self, power_system, stage_times, store):
         self.power_system = power_system
         self.is_stochastic = power_system.is_stochastic
@@ -631,9 +907,33 @@ class MultistageStandalone(Solution_UC_multistage):
         self.gen_shed = store['gen_shed'].sum()
 
         self.solve_time = store['solve_time'].sum()
+        self.solve_times = store['solve_time']
+        self.mipgaps = store['mipgap']
 
 
 class Solution_Stochastic(Solution):
+    quantities = dict(
+        outputs=('_get_outputs', ['generators_power_scenarios',
+            'generators_status_scenarios', 'expected_status',
+            'generators_status', 'expected_power', 'generators_power']),
+        costs=('_get_expected_costs',
+            ['expected_totalcost', 'expected_fuelcost']),
+        shedding=('_get_expected_shedding', [
+            'expected_gen_shed_timeseries', 'expected_gen_shed',
+            'expected_load_shed_timeseries', 'expected_load_shed']),
+    )
+    npz_tables = [
+        ('power', 'generators_power', np.float32),
+        ('status', 'generators_status', np.int8),
+        ('expected_power', 'expected_power', np.float32),
+        ('expected_status', 'expected_status', np.int8),
+        ('expected_cost', 'expected_totalcost', np.float32),
+        ('expected_fuelcost', 'expected_fuelcost', np.float32),
+        ('expected_load_shed', 'expected_load_shed_timeseries', np.float32),
+        ('expected_gen_shed', 'expected_gen_shed_timeseries', np.float32),
+    ]
+    npz_optional_tables = []
+
     def __init__(self, power_system, times, datadir='.', is_stochastic=True):
         update_attributes(self, locals())
         self._setup_powersystem()
@@ -651,29 +951,35 @@ class Solution_Stochastic(Solution):
         self.probability.index = self.scenarios
 
         self._get_problem_info()
-        self._get_outputs()
-        self._get_costs()
-        self._get_prices()
-
-    def stg_panel(self, method, 
-        generators=None,
-        no_overlap=True,
-        evaluate=False):
+        self._setup_quantities()
+
+    def stg_array(self, method, generators=None, no_overlap=True):
+        '''
+        The values of a generator (or load) quantity over all scenarios,
+        as an array with axes (scenario, time, generator).
+        The values for each scenario are read in bulk where possible.
+        '''
         if generators is None:
             generators = self.generators
-            
+
         times = self.times_non_overlap if no_overlap else self.times
-        if evaluate:
-            getval = lambda s, gen, t: value(
-                getattr(gen, method)(t, s, evaluate=True))
-        else:
-            getval = lambda s, gen, t: value(getattr(gen, method)(t, s))
-        return pd.Panel(
-            [[[getval(s, gen, t) for gen in generators]
-                for t in times] for s in self.scenarios],
-            items=[s for s in self.scenarios],
-            major_axis=times.strings.index,
-            minor_axis=[str(g) for g in generators])
+        keys = [str(t) for t in times]
+        out = np.zeros((len(self.scenarios), len(keys), len(generators)))
+        for i, s in enumerate(self.scenarios):
+            for g, gen in enumerate(generators):
+                if hasattr(gen, 'bulk_values'):
+                    out[i, :, g] = gen.bulk_values(method, keys, s)
+                else:
+                    out[i, :, g] = [value(getattr(gen, method)(
+                        t, s, evaluate=True)) for t in keys]
+        return out
+
+    def scenario_frame(self, values, scenario, generators=None):
+        '''one scenario of a (scenario, time, generator) array as a DataFrame'''
+        if generators is None:
+            generators = self.generators
+        return gen_time_dataframe(generators, self.times_non_overlap,
+            values[self.scenarios.index(scenario)])
 
     def gen_time_df(self, method, scenario, non_overlap=True, evaluate=False,
                     generators=None):
@@ -699,21 +1005,27 @@ class Solution_Stochastic(Solution):
             self.generators_status = self.gen_time_df('status', None)
 
         else:
-            self.generators_power_scenarios = self.stg_panel('power')
+            self.generators_power_scenarios = self.stg_array('power')
             self.generators_status_scenarios = \
-                correct_status(self.stg_panel('status'))
-            self.expected_status = \
-                self.generators_status_scenarios[self.scenarios[0]]
+                correct_status(self.stg_array('status'))
+            # the statuses are non-anticipative, so any scenario will do
+            self.expected_status = self.scenario_frame(
+                self.generators_status_scenarios, self.scenarios[0])
             self.generators_status = self.expected_status.copy()
             self.expected_power = self.generators_power = self._calc_expected(
                 self.generators_power_scenarios)
         return
 
-    def _calc_expected(self, panel):
-        out = panel.copy()
-        for s, pr in self.probability.iteritems():
-            out[s] *= pr
-        return out.sum(axis=0)
+    def _calc_expected(self, values, generators=None):
+        '''
+        the probability weighted sum over the scenario axis of a
+        (scenario, time, generator) array, as a DataFrame
+        '''
+        if generators is None:
+            generators = self.generators
+        expected = np.tensordot(
+            np.asarray(self.probability, dtype=float).ravel(), values, axes=1)
+        return gen_time_dataframe(generators, self.times_non_overlap, expected)
 
     def _calc_expected_cost(self, method):
         '''
@@ -721,7 +1033,7 @@ class Solution_Stochastic(Solution):
         multiplying each scenario cost by its probability,
         and summing over the scenarios
         '''
-        return self._calc_expected(self.stg_panel(method, evaluate=True))
+        return self._calc_expected(self.stg_array(method))
 
     def _get_costs(self, resolve=False):
         if resolve:
@@ -755,28 +1067,33 @@ class Solution_Stochastic(Solution):
                 logging.debug('load shed: {}MW'.format(self.load_shed))
 
         else:
-            # get expected cost of non_overlap times
-            self.expected_totalcost = self._calc_expected_cost('cost')
-            self.expected_fuelcost = self._calc_expected_cost('operatingcost')
-
-            # calculate expected load, gen shed
-            self.expected_gen_shed_timeseries = self._calc_expected(self.stg_panel('shed', evaluate=True, 
-                generators=self.power_system.get_generators_noncontrollable()))            
-            self.expected_gen_shed = self.expected_gen_shed_timeseries.sum().sum()
-                
-            self.expected_load_shed_timeseries = self._calc_expected(
-                self.stg_panel('shed', evaluate=True, 
-                    generators=self.power_system.loads()))
-            self.expected_load_shed = self.expected_load_shed_timeseries.sum()
-
-            if self.expected_gen_shed > 0.01:
-                logging.debug('expected generation shed: {}MW'.format(
-                    self.expected_gen_shed))
-            if self.expected_load_shed > 0.01:
-                logging.debug('expected load shed: {}MW'.format(
-                    self.expected_load_shed))
-            
-                
+            self._get_expected_costs()
+            self._get_expected_shedding()
+
+    def _get_expected_costs(self):
+        '''the expected cost of the non-overlap times'''
+        self.expected_totalcost = self._calc_expected_cost('cost')
+        self.expected_fuelcost = self._calc_expected_cost('operatingcost')
+
+    def _get_expected_shedding(self):
+        generators = self.power_system.get_generators_noncontrollable()
+        self.expected_gen_shed_timeseries = self._calc_expected(
+            self.stg_array('shed', generators=generators),
+            generators=generators).sum(axis=1)
+        self.expected_gen_shed = self.expected_gen_shed_timeseries.sum()
+
+        loads = self.power_system.loads()
+        self.expected_load_shed_timeseries = self._calc_expected(
+            self.stg_array('shed', generators=loads),
+            generators=loads).sum(axis=1)
+        self.expected_load_shed = self.expected_load_shed_timeseries.sum()
+
+        if self.expected_gen_shed > 0.01:
+            logging.debug('expected generation shed: {}MW'.format(
+                self.expected_gen_shed))
+        if self.expected_load_shed > 0.01:
+            logging.debug('expected load shed: {}MW'.format(
+                self.expected_load_shed))
 
     def _get_cost_error(self):
         pass
@@ -838,7 +1155,7 @@ def stack_plot_UC(solution, generators, times, prices,
     if convert_to_GW:
         power = power / 1e3
 
-    colors = _colormap(len(generators), colormapName='Blues')
+    colors = _colormap(len(power.columns), colormapName='Blues')
 
     power.plot(ax=ax, kind='bar', legend=True, stacked=True, color=colors, edgecolor='none')
     
@@ -0,0 +1,106 @@
+"""
+Scenario reduction: select a subset of scenarios which best
+represents the full set (in the Kantorovich distance, with the
+Euclidean distance between the scenario vectors) and redistribute
+the probability of the dropped scenarios to the nearest selected ones.
+See Heitsch and Romisch, "Scenario reduction algorithms in
+stochastic programming" (2003).
+"""
+import numpy as np
+
+methods = ['truncate', 'fast_forward', 'backward']
+
+
+def distances(values):
+    '''the Euclidean distances between each pair of scenarios (rows)'''
+    values = np.asarray(values, dtype=float)
+    diff = values[:, None, :] - values[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=2))
+
+
+def fast_forward(values, probability, num):
+    '''
+    Select scenarios one at a time, each time adding the scenario
+    which most reduces the distance to the full set.
+    :returns: the selected scenario indices and their probabilities
+    '''
+    probability = np.asarray(probability, dtype=float)
+    dist = distances(values)
+    cost = dist.copy()
+    n = len(probability)
+    selected = []
+    remaining = range(n)
+    for i in range(min(num, n)):
+        if selected:
+            last = selected[-1]
+            cost = np.minimum(cost, cost[:, [last]])
+        unselected = np.zeros(n, dtype=bool)
+        unselected[remaining] = True
+        # the distance of the unselected scenarios to each candidate
+        z = [(probability * cost[:, u] * unselected).sum() for u in remaining]
+        u = remaining[int(np.argmin(z))]
+        selected.append(u)
+        remaining.remove(u)
+    return redistribute(dist, probability, sorted(selected))
+
+
+def backward(values, probability, num):
+    '''
+    Drop scenarios one at a time, each time removing the scenario
+    whose removal least increases the distance to the full set.
+    :returns: the selected scenario indices and their probabilities
+    '''
+    probability = np.asarray(probability, dtype=float)
+    dist = distances(values)
+    n = len(probability)
+    deleted = []
+    remaining = range(n)
+    while len(remaining) > max(num, 1):
+        z = []
+        for l in remaining:
+            kept = [j for j in remaining if j != l]
+            dropped = deleted + [l]
+            z.append(sum(probability[k] * dist[k, kept].min()
+                for k in dropped))
+        l = remaining[int(np.argmin(z))]
+        deleted.append(l)
+        remaining.remove(l)
+    return redistribute(dist, probability, remaining)
+
+
+def redistribute(dist, probability, selected):
+    '''add the probability of each dropped scenario to the nearest selected'''
+    new_probability = np.zeros(len(selected))
+    nearest = dist[:, selected].argmin(axis=1)
+    for k, pr in enumerate(probability):
+        new_probability[nearest[k]] += pr
+    return selected, new_probability / new_probability.sum()
+
+
+def reduce_scenarios(data, num, method='fast_forward', hours=None):
+    '''
+    Reduce a day's scenarios.
+    :param data: DataFrame with a row for each scenario,
+        a probability column, and a column for each time
+    :param num: the number of scenarios to keep
+    :param method: one of :data:`methods`
+    :param hours: only use the first hours of each scenario
+        to measure the distances
+    :returns: the reduced DataFrame (with the index reset)
+    '''
+    if method not in methods:
+        raise ValueError('unknown scenario reduction method "{}"'.format(
+            method))
+    if method == 'truncate':
+        data = data[data.index < num]
+        data['probability'] = data['probability'] / sum(data['probability'])
+        return data
+
+    values = data[data.columns.drop('probability')].values
+    if hours is not None:
+        values = values[:, :hours]
+    reduction = fast_forward if method == 'fast_forward' else backward
+    selected, probability = reduction(values, data['probability'].values, num)
+    data = data.take(selected).reset_index(drop=True)
+    data['probability'] = probability
+    return data
@@ -27,12 +27,20 @@ def make_constant_schedule(times, power=0):
 
 class TimeIndex(object):
     '''a list of times (underlying model is pandas.Index)'''
-    def __init__(self, index, str_start=0):
+    def __init__(self, index, str_start=0, label_offset=0):
         strings = ['t%02d' % (i + str_start) for i in range(len(index))]
         self.times = index.copy()
         self.strings = Series(strings, index=self.times)
         self._set = self.strings.values.tolist()
 
+        # the labels used by the (full timeseries) schedules
+        # differ from the time labels only for relabeled stages
+        self.schedule_strings = Series(
+            ['t%02d' % (i + str_start + label_offset)
+                for i in range(len(index))], index=self.times)
+        self._schedule_labels = dict(
+            zip(self._set, self.schedule_strings.values))
+
         self.get_interval()
         self.Start = self.times[0]
         self.startdate = self.Start.date()
@@ -46,6 +54,7 @@ class TimeIndex(object):
         self._int_overlap = 0
         self._int_division = len(self)
         self._str_start = str_start
+        self._label_offset = label_offset
 
     def set_initial(self, initialTime=None):
         if initialTime:
@@ -54,6 +63,8 @@ class TimeIndex(object):
             self.initialTime = pd.Timestamp(self.Start - self.interval)
             self.initialTime.index = 'Init'
         self.initialTimestr = 'tInit'
+        # map of each time to the previous time
+        self._previous = dict(zip(self._set, [self.initialTime] + self._set[:-1]))
 
     def get_interval(self):
         freq = self.strings.index.freq
@@ -83,6 +94,14 @@ class TimeIndex(object):
         else:
             return self.strings[i]
 
+    def prev(self, time):
+        '''the time before `time` (the initial time for the first time)'''
+        return self._previous[time]
+
+    def schedule_label(self, time):
+        '''the label of a time within the schedules'''
+        return self._schedule_labels[time]
+
     def last(self):
         return self.__getitem__(-1, circular=True)
 
@@ -91,7 +110,8 @@ class TimeIndex(object):
 
     def non_overlap(self):
         if self._int_overlap > 0:
-            return TimeIndex(self.strings.index[:-1 - self._int_overlap + 1], self._str_start)
+            return TimeIndex(self.strings.index[:-1 - self._int_overlap + 1],
+                self._str_start, self._label_offset)
         else:
             return self
         return
@@ -99,7 +119,8 @@ class TimeIndex(object):
     def post_horizon(self):
         if len(self) > self._int_division + 1:
             str_start = int(self.strings.ix[self._int_division + 1].strip('t'))
-            return TimeIndex(self.strings.index[self._int_division + 1:], str_start)
+            return TimeIndex(self.strings.index[self._int_division + 1:],
+                str_start, self._label_offset)
         else:
             return Series()
         return
@@ -125,6 +146,27 @@ class TimeIndex(object):
             subsets[-1]._int_overlap = 0
         return subsets
 
+    def relabel(self):
+        '''
+        Copy the times, with stage relative labels (starting at t00).
+        Schedule lookups use the original labels
+        (see :meth:`~TimeIndex.schedule_label`).
+        '''
+        relabeled = TimeIndex(self.times, 0,
+            label_offset=self._str_start + self._label_offset)
+        relabeled._int_overlap = self._int_overlap
+        relabeled._int_division = self._int_division
+        relabeled.set_initial(self.initialTime)
+        return relabeled
+
+    def copy(self):
+        '''Copy the times (the copy's set can be changed independently).'''
+        copied = TimeIndex(self.times, self._str_start, self._label_offset)
+        copied._int_overlap = self._int_overlap
+        copied._int_division = self._int_division
+        copied.set_initial(self.initialTime)
+        return copied
+
 
 def is_init(time):
     return getattr(time, 'index', None) == 'Init'
@@ -10,11 +10,15 @@ import sys, os, logging, subprocess
 import time as timer
 import argparse
 import pdb
+import multiprocessing
+import resource
 
 from config import user_config, parse_command_line_config
 from commonscripts import joindir, StreamToLogger, set_trace
 import powersystems, get_data, stochastic, results
-from standalone import store_times, init_store, get_storage, repack_storage
+from optimization import value
+from standalone import (store_times, init_store, get_storage,
+    committed_stages, collect_stages, stored_initial_conditions, store_state)
 
 def _set_store_filename(pid=None):
     fnm = 'stage-store.hd5'
@@ -32,38 +36,134 @@ def solve_multistage_standalone(power_system, times, scenario_tree, data):
     has_pid = user_config.output_prefix or user_config.pid
 
     if user_config.standalone_restart:
-        # get the last stage in storage
+        # start after the last committed stage
         storage = get_storage()
-        stg_start = len(storage['solve_time'].dropna())
+        stg_start = committed_stages()
         logging.info('Restarting on stage {}'.format(stg_start))
         stage_times_remaining = stage_times[stg_start:]
     else:
         storage = init_store(power_system, stage_times, data)
         stage_times_remaining = stage_times
         stg_start = 0
-    
-    for stg, t_stage in enumerate(stage_times_remaining):
-        logging.info('Stage starting at {}'.format(t_stage.Start.date()))
-        # store current stage times
-        storage = store_times(t_stage, storage)
+
+    if user_config.standalone_fork:
         storage.close()
-        storage = None
-        command = 'standalone_minpower {dir} {stg} {pid} {db}'.format(
-                dir=user_config.directory, stg=stg + stg_start,
-                pid='--pid {}'.format(pid) if has_pid else '',
-                db='--debugger' if user_config.debugger else '')
-        try: subprocess.check_call(command, shell=True, stdout=sys.stdout)
-        except AttributeError:
-            # HACK - avoid error when nose hijacks sys.stdout
-            subprocess.check_call(command, shell=True)
-
-    repack_storage()
+        solve_stages_forked(power_system, stage_times, scenario_tree, stg_start)
+    else:
+        for stg, t_stage in enumerate(stage_times_remaining):
+            logging.info('Stage starting at {}'.format(t_stage.Start.date()))
+            # store current stage times
+            storage = store_times(t_stage, storage)
+            storage.close()
+            storage = None
+            command = 'standalone_minpower {dir} {stg} {pid} {db}'.format(
+                    dir=user_config.directory, stg=stg + stg_start,
+                    pid='--pid {}'.format(pid) if has_pid else '',
+                    db='--debugger' if user_config.debugger else '')
+            try: subprocess.check_call(command, shell=True, stdout=sys.stdout)
+            except AttributeError:
+                # HACK - avoid error when nose hijacks sys.stdout
+                subprocess.check_call(command, shell=True)
+
+    collect_stages()
     storage = get_storage()
     return storage, stage_times
 
+def solve_stages_forked(power_system, stage_times, scenario_tree, stg_start=0):
+    '''
+    Solve the standalone stages in worker processes, forked from this
+    process (which has already imported everything and parsed the data).
+    A worker solves stages until it is recycled, after the
+    `standalone_worker_stages` limit or when its memory use passes
+    `standalone_worker_memory` (MB). The initial conditions for each
+    stage are sent to the worker over a pipe.
+    '''
+    if stg_start >= len(stage_times):
+        return
+    storage = get_storage()
+    initial = stored_initial_conditions(
+        storage, stg_start, stage_times[stg_start].initialTime)
+    storage.close()
+
+    worker = None
+    try:
+        for stg in range(stg_start, len(stage_times)):
+            if worker is None:
+                worker, connection = _start_stage_worker(
+                    power_system, stage_times, scenario_tree)
+                worker_stages = 0
+            logging.info('Stage starting at {}'.format(
+                stage_times[stg].Start.date()))
+            connection.send((stg, initial))
+            try:
+                result = connection.recv()
+            except EOFError:
+                raise RuntimeError('the worker for stage {} died'.format(stg))
+            if result[0] == 'error':
+                raise RuntimeError('stage {} failed:\n{}'.format(stg, result[1]))
+            __, initial, memory = result
+
+            worker_stages += 1
+            memory_limit = user_config.standalone_worker_memory
+            if worker_stages >= user_config.standalone_worker_stages or \
+                    (memory_limit and memory > memory_limit):
+                logging.debug('recycling the worker (used {:.0f}MB)'.format(
+                    memory))
+                _stop_stage_worker(worker, connection)
+                worker = None
+    finally:
+        if worker is not None:
+            _stop_stage_worker(worker, connection)
+
+def _start_stage_worker(power_system, stage_times, scenario_tree):
+    connection, worker_connection = multiprocessing.Pipe()
+    worker = multiprocessing.Process(target=_stage_worker,
+        args=(worker_connection, power_system, stage_times, scenario_tree))
+    worker.daemon = True
+    worker.start()
+    worker_connection.close()
+    return worker, connection
+
+def _stop_stage_worker(worker, connection):
+    try:
+        connection.send(None)
+    except IOError:
+        # the worker has already exited
+        pass
+    connection.close()
+    worker.join()
+
+def _stage_worker(connection, power_system, stage_times, scenario_tree):
+    '''
+    Solve the stages sent over the connection and store their results.
+    Send back the final conditions (the next stage's initial conditions)
+    and the peak memory use (MB).
+    '''
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        stg, initial = task
+        try:
+            t_stage = stage_times[stg]
+            for gen in power_system.generators():
+                gen.set_initial_condition(**initial[str(gen)])
+            sln = create_solve_problem(
+                power_system, t_stage, scenario_tree, stage_number=stg)
+            store_state(power_system, t_stage, sln)
+            final = dict((str(gen), dict((key, value(val))
+                for key, val in gen.finalstatus.items()))
+                for gen in power_system.generators())
+            power_system.reset_model()
+        except:
+            connection.send(('error', traceback.format_exc()))
+            return
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+        connection.send(('done', final, memory))
+
 def standaloneUC():
     '''the hook for the ``standalone_minpower`` script'''
-    from standalone import store_state, load_state
+    from standalone import load_state
 
     parser = argparse.ArgumentParser()
     parser.add_argument('directory', type=str, help='the problem direcory')
@@ -81,7 +181,7 @@ def standaloneUC():
     try:          
         _set_store_filename(args.pid)    
         # load stage data
-        power_system, times, scenario_tree = load_state()
+        power_system, times, scenario_tree = load_state(stg)
 
         # override the stored config with the current command line config
         user_config.directory = args.directory
@@ -91,8 +191,7 @@ def standaloneUC():
       
         sln = create_solve_problem(power_system, times, scenario_tree, stage_number=stg)
 
-        store = store_state(power_system, times, sln)
-        store.close()
+        store_state(power_system, times, sln)
     except:
         if user_config.debugger or args.debugger:
             __, __, tb = sys.exc_info()
@@ -157,7 +256,8 @@ def solve_problem(datadir='.',
             solution.show()
             sys.stdout = stdout
         solution.show()
-    if csv and not user_config.standalone: solution.saveCSV()
+    if csv and user_config.output_format == 'npz': solution.saveNPZ()
+    elif csv and not user_config.standalone: solution.saveCSV()
     if user_config.visualization: solution.visualization()
     logging.info('total time: {}s'.format(timer.time()-start_time))
 
@@ -173,17 +273,31 @@ def solve_multistage(power_system, times, scenario_tree=None, data=None):
 
     stage_solutions = []
 
+    # the model for a stage can be reused for the following stages,
+    # unless the stage is resolved with observed values
+    power_system.reuse_model = user_config.reuse_model and \
+        not power_system.is_stochastic and \
+        power_system.backend == 'pyomo' and \
+        not (user_config.deterministic_solve or user_config.perfect_solve)
+    if power_system.reuse_model:
+        # label all stages the same way, to match the model's times
+        stage_times = [t_stage.relabel() for t_stage in stage_times]
+
     for stg, t_stage in enumerate(stage_times):
         logging.info('Stage starting at {}'.format(t_stage.Start.date()))
         # solve
         solution = create_solve_problem(
             power_system, t_stage, scenario_tree, stg)
         # add to stage solutions
+        # (loading the results before the model changes)
+        solution.detach()
         stage_solutions.append(solution)
+        is_last = (stg == len(stage_times) - 1)
         # reset model
-        power_system.reset_model()
+        if is_last or not power_system.can_reuse_model(stage_times[stg+1]):
+            power_system.reset_model()
         # set inital state for next stage
-        if stg < len(stage_times)-1:
+        if not is_last:
             power_system.set_initialconditions(stage_times[stg+1].initialTime)
 
     return stage_solutions, stage_times
@@ -195,12 +309,20 @@ def create_solve_problem(power_system, times, scenario_tree=None,
     
     create_problem(power_system, times, scenario_tree,
         stage_number, rerun)
+    if user_config.warmstart:
+        # start from the previous stage's solution
+        power_system.set_warmstart(times)
     
     instance = power_system.solve_problem(times)
+    if user_config.warmstart and len(times) > 1:
+        power_system.store_warmstart(times)
 
     logging.debug('solved... get results')
 
     sln = results.make_solution(power_system, times)
+    if power_system.shedding_mode:
+        # the shedding flags change how the results are read
+        sln.detach()
     
     power_system.disallow_shedding()
 
@@ -222,6 +344,11 @@ def create_problem(power_system, times, scenario_tree=None,
     stage_number=None, rerun=False):
     """Create an optimization problem."""
 
+    if power_system.can_reuse_model(times):
+        power_system.update_stage(times)
+        logging.debug('updated the model parameters for the stage')
+        return
+
     logging.debug('initialized problem')
     power_system.create_variables(times)
     logging.debug('created variables')
@@ -230,6 +357,11 @@ def create_problem(power_system, times, scenario_tree=None,
     power_system.create_constraints(times)
     logging.debug('created constraints')
 
+    if power_system.reuse_model:
+        # set the initial statuses and keep the model for the next stages
+        power_system.update_stage(times)
+        power_system.has_template = True
+
     if scenario_tree is not None and sum(scenario_tree.shape) > 0 and not rerun:
         stochastic.construct_simple_scenario_tree(
             power_system, times, time_stage=stage_number)
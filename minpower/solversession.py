@@ -0,0 +1,236 @@
+"""
+A persistent, in-process GLPK solver session for the `matrix` backend
+(see :mod:`matrixmodel`). The problem stays loaded in the solver
+between solves. When only the variable bounds, fixed values,
+objective or right hand sides change (e.g. for the duals LP),
+just those are updated. This also holds across models: the next
+stage's model is solved in the loaded problem (from its last basis)
+if its constraint matrix is the same. The matrix is re-loaded only
+when it has changed.
+
+The reported MIP gap is measured from the root LP relaxation's
+objective, so it is an upper bound on the gap of the solution
+(GLPK only gives its best bound inside the branch and bound).
+
+Requires the `swiglpk` GLPK bindings.
+"""
+import logging
+import numpy as np
+from matrixmodel import minimize
+
+try:
+    import swiglpk as glpk
+except ImportError:
+    glpk = None
+
+
+def available():
+    return glpk is not None
+
+
+class SessionResults(object):
+    '''
+    The solution of a session solve, in the parts of the Coopr results
+    layout that minpower uses. The values are stored as arrays.
+    '''
+    def __init__(self, status, objective=None,
+                 column_values=None, row_duals=None, gap=None):
+        self.solver = [{'Termination condition': status}]
+        self.column_values = column_values
+        self.row_duals = row_duals if row_duals is not None else {}
+        self.Solution = _Solution(self, objective, gap)
+
+
+class _Solution(object):
+    def __init__(self, results, objective, gap):
+        self._results = results
+        self.objective = {'objective': {'Value': objective}}
+        self.gap = gap
+
+    def __getitem__(self, i):
+        return {'Gap': self.gap}
+
+    @property
+    def Variable(self):
+        values = self._results.column_values
+        if values is None:
+            return {}
+        return dict(('x%d' % j, {'Value': v}) for j, v in enumerate(values))
+
+
+class GLPKSession(object):
+    '''an in-process GLPK problem, kept between solves'''
+    def __init__(self, mipgap=None, time_limit=None):
+        if glpk is None:
+            raise ImportError('the solver session requires swiglpk')
+        self.mipgap = mipgap
+        self.time_limit = time_limit
+        self._lp = None
+        self._loaded = None
+        self._loaded_model = None
+        self._matrix = None
+
+    def solve(self, model, get_duals=False):
+        '''
+        Solve a :class:`~matrixmodel.ConcreteModel`.
+        The MIP is solved unless all of the integer variables are fixed
+        or `get_duals` is set (then the LP is solved, for its duals).
+        :returns: a :class:`SessionResults`
+        '''
+        problem = model.arrays(substitute_fixed=False)
+        # the model is kept (not just its id, which can be reused)
+        if self._loaded_model is not model or \
+                self._loaded != model.structure_version:
+            if not self._same_matrix(problem['A']):
+                self._load_matrix(problem)
+            self._loaded_model = model
+            self._loaded = model.structure_version
+        self._update(problem, model._values)
+
+        free_integer = problem['integer'] & ~problem['fixed']
+        is_mip = free_integer.any() and not get_duals
+        self._set_kinds(problem['integer'] if is_mip else None)
+
+        status = self._simplex()
+        if status == 'optimal' and is_mip:
+            bound = glpk.glp_get_obj_val(self._lp)
+            status = self._intopt()
+        if status not in ('optimal', 'maxTimeLimit'):
+            return SessionResults(status)
+
+        n = len(problem['c'])
+        get_col = glpk.glp_mip_col_val if is_mip else glpk.glp_get_col_prim
+        values = np.array([get_col(self._lp, j + 1) for j in range(n)])
+        objective = glpk.glp_mip_obj_val(self._lp) if is_mip \
+            else glpk.glp_get_obj_val(self._lp)
+        duals = {}
+        gap = None
+        if is_mip:
+            gap = self._gap(objective, bound, status)
+        else:
+            for i, row in enumerate(problem['rows']):
+                duals[row] = glpk.glp_get_row_dual(self._lp, i + 1)
+        return SessionResults(status, objective, values, duals, gap)
+
+    def _gap(self, objective, bound, status):
+        '''
+        the relative gap between the MIP objective and the LP bound
+        (in GLPK's form). An optimal solution is within the mipgap.
+        '''
+        gap = abs(objective - bound) / (abs(objective) + np.finfo(float).eps)
+        if status == 'optimal':
+            gap = min(gap, self.mipgap or 0.0)
+        return gap
+
+    def _same_matrix(self, A):
+        '''is the (CSR) matrix the same as the one loaded'''
+        loaded = self._matrix
+        return loaded is not None and loaded.shape == A.shape and \
+            np.array_equal(loaded.indptr, A.indptr) and \
+            np.array_equal(loaded.indices, A.indices) and \
+            np.array_equal(loaded.data, A.data)
+
+    def _load_matrix(self, problem):
+        logging.debug('loading the problem into the solver session')
+        if self._lp is not None:
+            glpk.glp_delete_prob(self._lp)
+        A = problem['A'].tocoo()
+        m, n = A.shape
+        lp = glpk.glp_create_prob()
+        if m:
+            glpk.glp_add_rows(lp, m)
+        if n:
+            glpk.glp_add_cols(lp, n)
+        # glpk arrays are indexed from one
+        ia = glpk.intArray(A.nnz + 1)
+        ja = glpk.intArray(A.nnz + 1)
+        ar = glpk.doubleArray(A.nnz + 1)
+        for k, (i, j, v) in enumerate(zip(A.row, A.col, A.data)):
+            ia[k + 1], ja[k + 1], ar[k + 1] = int(i) + 1, int(j) + 1, float(v)
+        glpk.glp_load_matrix(lp, A.nnz, ia, ja, ar)
+        self._lp = lp
+        self._matrix = problem['A']
+        self._kinds = None
+
+    def _update(self, problem, values):
+        lp = self._lp
+        for i, (sense, rhs) in enumerate(zip(problem['senses'], problem['rhs'])):
+            kind = {'<=': glpk.GLP_UP, '>=': glpk.GLP_LO, '==': glpk.GLP_FX}[sense]
+            glpk.glp_set_row_bnds(lp, i + 1, kind, float(rhs), float(rhs))
+
+        glpk.glp_set_obj_dir(lp,
+            glpk.GLP_MIN if problem['sense'] == minimize else glpk.GLP_MAX)
+        glpk.glp_set_obj_coef(lp, 0, float(problem['constant']))
+        for j, coef in enumerate(problem['c']):
+            glpk.glp_set_obj_coef(lp, j + 1, float(coef))
+
+        for j, (low, high, fixed) in enumerate(zip(
+                problem['lower'], problem['upper'], problem['fixed'])):
+            if fixed:
+                low = high = values[j]
+            glpk.glp_set_col_bnds(lp, j + 1, *_bounds(low, high))
+
+    def _set_kinds(self, integer):
+        '''set the integer variable kinds (or make all variables continuous)'''
+        kinds = None if integer is None else integer.tostring()
+        if kinds == self._kinds:
+            return
+        n = glpk.glp_get_num_cols(self._lp)
+        for j in range(n):
+            is_integer = integer is not None and integer[j]
+            glpk.glp_set_col_kind(self._lp, j + 1,
+                glpk.GLP_IV if is_integer else glpk.GLP_CV)
+        self._kinds = kinds
+
+    def _simplex(self):
+        parm = glpk.glp_smcp()
+        glpk.glp_init_smcp(parm)
+        parm.msg_lev = glpk.GLP_MSG_OFF
+        # the basis from the last solve is reused
+        if glpk.glp_simplex(self._lp, parm) != 0:
+            glpk.glp_adv_basis(self._lp, 0)
+            if glpk.glp_simplex(self._lp, parm) != 0:
+                return 'unknown'
+        return {glpk.GLP_OPT: 'optimal',
+                glpk.GLP_NOFEAS: 'infeasible',
+                glpk.GLP_UNBND: 'unbounded'}.get(
+                    glpk.glp_get_status(self._lp), 'unknown')
+
+    def _intopt(self):
+        parm = glpk.glp_iocp()
+        glpk.glp_init_iocp(parm)
+        parm.msg_lev = glpk.GLP_MSG_OFF
+        if self.mipgap:
+            parm.mip_gap = self.mipgap
+        if self.time_limit:
+            parm.tm_lim = int(self.time_limit * 1000)
+        result = glpk.glp_intopt(self._lp, parm)
+        status = glpk.glp_mip_status(self._lp)
+        if status == glpk.GLP_OPT:
+            return 'optimal'
+        elif status == glpk.GLP_FEAS and result == glpk.GLP_ETMLIM:
+            return 'maxTimeLimit'
+        elif status == glpk.GLP_NOFEAS:
+            return 'infeasible'
+        return 'unknown'
+
+    def close(self):
+        if self._lp is not None:
+            glpk.glp_delete_prob(self._lp)
+            self._lp = None
+            self._loaded = None
+            self._loaded_model = None
+            self._matrix = None
+
+
+def _bounds(low, high):
+    '''the glpk bound type and values'''
+    if np.isinf(low) and np.isinf(high):
+        return glpk.GLP_FR, 0.0, 0.0
+    elif np.isinf(high):
+        return glpk.GLP_LO, float(low), 0.0
+    elif np.isinf(low):
+        return glpk.GLP_UP, 0.0, float(high)
+    elif low == high:
+        return glpk.GLP_FX, float(low), float(high)
+    return glpk.GLP_DB, float(low), float(high)
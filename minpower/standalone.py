@@ -2,9 +2,17 @@
 A module to workaround a memory leak in coopr by saving the results
 of each day of a rolling unit commitment to disk (in HDF format)
 and reloading them to run the next day as a memory independent subprocess.
+
+The problem data and the initial state are kept in the store.
+The results of each stage are written to their own segment file
+(in the `<store>.stages` directory), which is renamed into place
+only once it is complete. So a crash never leaves a partial stage
+and the committed stages are just the segment files.
+After the last stage the segments are collected into the store.
 """
 
 import os
+import shutil
 import logging
 import sys
 import pandas as pd
@@ -23,12 +31,21 @@ except ImportError:
     logging.debug('could not load pytables - cannot use standalone mode.')
 
 
+# the results tables written for each stage
+stage_tables = ['power', 'status', 'hrsinstatus', 'load_shed', 'gen_shed',
+    'expected_cost', 'observed_cost', 'expected_status', 'expected_power',
+    'expected_fuelcost', 'observed_fuelcost']
+# the results with one value per stage
+stage_values = ['solve_time', 'mipgap']
+
+
 def wipe_storage():
     try:
         os.remove(user_config.store_filename)
         logging.debug('wipe storage')
     except OSError:
         pass
+    shutil.rmtree(_stages_directory(), ignore_errors=True)
 
 
 def get_storage():
@@ -57,37 +74,17 @@ def init_store(power_system, times, data):
         key = 'data_' + key
         storage[key] = df
 
-    stages = len(times)  # stage_times
-    est_Nt = len(data['timeseries'])
     t = [times[0].initialTime]
 
     # store first stage initial state
-    storage.append('power', 
-        gen_time_dataframe(generators, t,
-            values=[[gen.initial_power for gen in generators]]),
-        expectedrows=est_Nt)
-        
-    storage.append('status',
-        gen_time_dataframe(generators, t,
-            values=[[gen.initial_status for gen in generators]]),
-        expectedrows=est_Nt)
-        
-    storage['hrsinstatus'] = gen_time_dataframe(generators, t,
+    storage['initial_power'] = gen_time_dataframe(generators, t,
+        values=[[gen.initial_power for gen in generators]])
+    storage['initial_status'] = gen_time_dataframe(generators, t,
+        values=[[gen.initial_status for gen in generators]])
+    storage['initial_hrsinstatus'] = gen_time_dataframe(generators, t,
         values=[[gen.initial_status_hours for gen in generators]])
 
-    # setup empty containers for variables
-    storage['load_shed'] = Series()
-    storage['gen_shed'] = Series()
-    storage['expected_cost'] = DataFrame()
-    storage['observed_cost'] = DataFrame()
-    storage['expected_status'] = DataFrame()
-    storage['expected_power'] = DataFrame()
-    storage['expected_fuelcost'] = DataFrame()
-    storage['observed_fuelcost'] = DataFrame()
-
-    # setup one-per-stage results
-    storage['solve_time'] = Series(index=range(stages))
-    storage['mipgap'] = Series(index=range(stages))
+    os.makedirs(_stages_directory())
 
     # store configuration
     storage['configuration'] = Series(user_config)
@@ -112,62 +109,104 @@ def _get_problem_version():
 
 
 def store_state(power_system, times, sln=None):
-    storage = get_storage()
+    '''commit the stage results to a new segment'''
     generators = power_system.generators()
 
-    stg = sln.stage_number
-    table_append(storage, 'power', sln.generators_power)
-    table_append(storage, 'status', sln.generators_status)
-    table_append(storage, 'load_shed', sln.load_shed_timeseries)
-    table_append(storage, 'gen_shed', sln.gen_shed_timeseries)
-
     tEnd = times.last_non_overlap()
-    storage['hrsinstatus'] = gen_time_dataframe(generators, [tEnd],
-                                                values=[
-                                                [gen.finalstatus['hoursinstatus'] for gen in generators]
-                                                ])
-
-    _add_tbl_val(storage, 'solve_time', stg, sln.solve_time)
-    _add_tbl_val(storage, 'mipgap', stg, sln.mipgap)
+    tables = dict(
+        power=sln.generators_power,
+        status=sln.generators_status,
+        load_shed=sln.load_shed_timeseries,
+        gen_shed=sln.gen_shed_timeseries,
+        hrsinstatus=gen_time_dataframe(generators, [tEnd], values=[
+            [gen.finalstatus['hoursinstatus'] for gen in generators]]),
+        )
 
     if sln._resolved:
-        table_append(storage, 'observed_cost', sln.observed_totalcost)
-        table_append(storage, 'observed_fuelcost', sln.observed_fuelcost)
-        table_append(storage, 'expected_cost', sln.expected_totalcost)
-        table_append(storage, 'expected_fuelcost', sln.expected_fuelcost)
-        table_append(storage, 'expected_power', sln.expected_power)
-        table_append(storage, 'expected_status', sln.expected_status)
+        tables.update(
+            observed_cost=sln.observed_totalcost,
+            observed_fuelcost=sln.observed_fuelcost,
+            expected_cost=sln.expected_totalcost,
+            expected_fuelcost=sln.expected_fuelcost,
+            expected_power=sln.expected_power,
+            expected_status=sln.expected_status)
     else:
-        table_append(storage, 'expected_cost', sln.totalcost_generation)
-        table_append(storage, 'expected_fuelcost', sln.fuelcost)
-
-#    # DEBUGGING
-#    from pandas.util.testing import assert_frame_equal
-#    try: 
-#        gens = storage['data_generators'].copy()
-#        gens.index = ['g{}'.format(g) for g in gens.index]
-#        status = storage['status'].ix[1:]
-#        power = storage['power'][status.columns].ix[status.index]
-#        cost = storage['observed_cost'][status.columns].ix[status.index]
-#        fuelcost = storage['observed_fuelcost'][status.columns].ix[status.index]
-#        stcost = cost - fuelcost
-
-#        
-#        pcheck = (power * status)
-#        ccheck = (cost * status)
-#        stcheck = (stcost * status)
-#        assert_frame_equal(pcheck, power)
-#        assert_frame_equal(ccheck, cost)
-#        assert_frame_equal(stcheck, stcost)
-#        assert(((stcost < gens.startupcost - 1e-5) & (stcost > 1e-5) ).sum().sum() == 0)
-#        
-#    except AssertionError:
-#        raise
-        
-    return storage
+        tables.update(
+            expected_cost=sln.totalcost_generation,
+            expected_fuelcost=sln.fuelcost)
+
+    commit_stage(sln.stage_number, tables,
+        dict(solve_time=sln.solve_time, mipgap=sln.mipgap))
+
+
+def commit_stage(stage, tables, values):
+    '''
+    Write a stage's results tables and values to a segment file.
+    The file is written under a temporary name and renamed when
+    complete, so the stage is either committed entirely or not at all.
+    The segment is synced to disk before the rename (and the directory
+    before and after it), so after a power loss a committed segment
+    is never a truncated one.
+    '''
+    filename = _stage_filename(stage)
+    partial = filename + '.partial'
+    if os.path.exists(partial):
+        # left by a crash
+        os.remove(partial)
+    segment = pd.HDFStore(partial, mode='w')
+    try:
+        for name, table in tables.iteritems():
+            segment[name] = table
+        segment['values'] = Series(values, dtype=float)
+    finally:
+        segment.close()
+    directory = os.path.dirname(filename)
+    _fsync(partial)
+    _fsync_directory(directory)
+    os.rename(partial, filename)
+    _fsync_directory(directory)
+
+
+def _fsync(path):
+    '''flush a file to disk'''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
-def load_state():
+def _fsync_directory(path):
+    '''flush a directory's entries to disk (where the platform can)'''
+    try:
+        _fsync(path)
+    except OSError:
+        # e.g. directories can't be opened on windows
+        pass
+
+
+def committed_stages():
+    '''the number of consecutive stages (from the first) that are committed'''
+    stage = 0
+    while os.path.exists(_stage_filename(stage)):
+        stage += 1
+    return stage
+
+
+def read_stage(stage, names):
+    '''read tables (and the `values` Series) from a stage's segment'''
+    segment = pd.HDFStore(_stage_filename(stage), mode='r')
+    try:
+        return dict((name, segment[name]) for name in names if name in segment)
+    finally:
+        segment.close()
+
+
+def load_state(stage=None):
+    '''
+    Set up the stage's problem, with the initial state from the end of
+    the previous stage (the last committed stage, by default).
+    '''
     storage = get_storage()
     user_config.update(storage['configuration'].to_dict())
 
@@ -187,32 +226,63 @@ def load_state():
     generators = power_system.generators()
 
     # set up initial state
-    t = times.initialTime
-    status = correct_status(storage['status']).ix[t]
+    if stage is None:
+        stage = committed_stages()
+    initial = stored_initial_conditions(storage, stage, times.initialTime)
+    storage.close()
     for gen in generators:
-        g = str(gen)
-        gen.set_initial_condition(
-            power=storage['power'][g][t],
-            status=status[g],
-            hoursinstatus=storage['hrsinstatus'][g][t])
+        gen.set_initial_condition(**initial[str(gen)])
 
     return power_system, times, scenario_tree
 
 
-def repack_storage():
-    '''compress that ballooning storage'''
-    # http://stackoverflow.com/questions/13089359/mystery-when-storing-a
-    # -dataframe-containing-strings-in-hdf-with-pandas
-    os.system('ptrepack {f} {f}.copy; mv {f}.copy {f};'.format(
-        f=user_config.store_filename))
+def stored_initial_conditions(storage, stage, t):
+    '''
+    The generators' initial conditions for a stage (starting at time `t`),
+    from the end of the previous stage (or the initial state, for the first).
+    :returns: dict of initial condition kwargs, keyed by generator name
+    '''
+    names = ['power', 'status', 'hrsinstatus']
+    if stage == 0:
+        state = dict((name, storage['initial_' + name]) for name in names)
+    else:
+        state = read_stage(stage - 1, names)
 
+    status = correct_status(state['status']).ix[t]
+    return dict((g, dict(
+        power=state['power'][g][t],
+        status=status[g],
+        hoursinstatus=state['hrsinstatus'][g][t]))
+        for g in status.index)
 
-def _add_tbl_val(storage, tablename, index, value):
-    tbl = storage[tablename]
-    tbl[index] = value
-    storage[tablename] = tbl
 
+def collect_stages():
+    '''
+    Collect the results of all of the committed stages into the store
+    (each table is written once).
+    '''
+    stages = committed_stages()
+    segments = [read_stage(stage, stage_tables + ['values'])
+        for stage in range(stages)]
 
-def table_append(store, name, newvals):
-    store[name] = store[name].append(newvals)
-    return
+    storage = get_storage()
+    for name in stage_tables:
+        parts = [segment[name] for segment in segments if name in segment]
+        if name in ['power', 'status']:
+            parts.insert(0, storage['initial_' + name])
+        if parts:
+            storage[name] = pd.concat(parts)
+        else:
+            storage[name] = Series() if name.endswith('shed') else DataFrame()
+    for name in stage_values:
+        storage[name] = Series([segment['values'][name]
+            for segment in segments], index=range(stages))
+    storage.close()
+
+
+def _stages_directory():
+    return user_config.store_filename + '.stages'
+
+
+def _stage_filename(stage):
+    return os.path.join(_stages_directory(), 'stage-{:05d}.hd5'.format(stage))
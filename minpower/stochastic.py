@@ -1,12 +1,19 @@
 """
 Stochastic scenario models for schedules.
 """
-from coopr.pyomo import AbstractModel, Set, Param, Boolean, Var
+from coopr.pyomo import (AbstractModel, ConcreteModel, Set, Param, Boolean,
+    Var, Objective, minimize)
 from coopr.pysp.scenariotree import ScenarioTree
 from coopr.pysp.ef import create_ef_instance
+from coopr.opt.base import solvers as cooprsolver
 from config import user_config
+from optimization import OptimizationError, detect_status
+from lagrangian import unit_subproblem, solve_unit
 import gc
 import logging
+import multiprocessing
+import numpy as np
+import time as timer
 
 def construct_simple_scenario_tree(power_system, times, time_stage=None):
     '''Construct a simple scenario tree instance'''
@@ -101,6 +108,18 @@ def create_problem_with_scenarios(power_system, times):
             print s, scenario
         raise ValueError('not a valid scenario tree')
 
+    power_system.progressive_hedging = user_config.progressive_hedging
+    power_system.native_ef = user_config.native_ef and \
+        not power_system.progressive_hedging
+    if power_system.native_ef and user_config.cvar_weight > 0:
+        logging.warning('the native extensive form does not support CVaR')
+        power_system.native_ef = False
+
+    shared = {}
+    if power_system.native_ef:
+        full_problem_instance, shared = create_shared_commitment(
+            power_system, times)
+
     gen = power_system.get_generator_with_scenarios()
 
     scenario_instances = {}
@@ -109,7 +128,11 @@ def create_problem_with_scenarios(power_system, times):
     logging.debug('constructing scenario instances')
     gc.disable()
     for s, scenario in enumerate(scenario_tree._scenarios):
-        scenario_instance = power_system._model.clone()
+        if power_system.native_ef:
+            scenario_instance = create_native_scenario_instance(
+                power_system, times, s, shared)
+        else:
+            scenario_instance = power_system._model.clone()
 
         power = getattr(scenario_instance, 'power_{}'.format(str(gen)))
         # set the values of the parameter for this scenario
@@ -124,7 +147,130 @@ def create_problem_with_scenarios(power_system, times):
 
     gc.enable()
     scenario_tree.defineVariableIndexSets(power_system._model)
-        
+
+    if power_system.progressive_hedging:
+        # the scenarios are solved separately
+        # (see :func:`solve_progressive_hedging`)
+        full_problem_instance = None
+        power_system._nonanticipative = nonanticipative_variables(
+            power_system, times)
+        power_system._nonanticipative_units = nonanticipative_units(
+            power_system, times)
+    elif power_system.native_ef:
+        create_native_extensive_form(
+            full_problem_instance, scenario_tree, scenario_instances)
+    else:
+        full_problem_instance = create_extensive_form(
+            power_system, times, scenario_tree, scenario_instances)
+
+    power_system.stochastic_formulation = True
+    power_system._stochastic_instance = full_problem_instance
+    power_system._scenario_tree = scenario_tree
+    power_system._scenario_instances = scenario_instances
+    return
+
+
+def create_native_scenario_instance(power_system, times, s, shared):
+    '''
+    Construct scenario `s`'s instance for the native extensive form
+    from the power system's components, wiring in the shared status
+    variables (see :func:`create_shared_commitment`) before the
+    constraints (which reference them) are created.
+    '''
+    base_model, base_set = power_system._model, times.set
+    power_system._model = power_system._backend.ConcreteModel(
+        'scenario {}'.format(s))
+    try:
+        power_system.create_variables(times)
+        for var_name, (shared_var, horizon) in shared.items():
+            own_var = getattr(power_system._model, var_name)
+            setattr(power_system._model, var_name,
+                SharedStatus(shared_var, own_var, horizon))
+        power_system.create_objective(times)
+        power_system.create_constraints(times)
+        scenario_instance = power_system._model
+    finally:
+        power_system._model = base_model
+        times.set = base_set
+    return scenario_instance
+
+
+class SharedStatus(object):
+    '''
+    A status variable in the native extensive form. The times
+    in the commitment horizon index the status variable shared by
+    all scenarios. The later times index the scenario's own variable.
+    '''
+    def __init__(self, shared, own, horizon):
+        self.shared = shared
+        self.own = own
+        self.horizon = horizon
+        self.name = own.name
+
+    def __getitem__(self, index):
+        if index in self.horizon:
+            return self.shared[index]
+        return self.own[index]
+
+    def __str__(self):
+        return str(self.own)
+
+
+def create_shared_commitment(power_system, times):
+    '''
+    Create the native extensive form model, with one status variable
+    for each generator over the commitment horizon (shared by all
+    of the scenarios, so no nonanticipativity constraints are needed).
+    :returns: the model and a dict of the shared variables
+        and horizon times, by status variable name
+    '''
+    master = ConcreteModel('extensive form')
+    nonanticipative = nonanticipative_variables(power_system, times)
+    labels = nonanticipative.values()[0] if nonanticipative else []
+    master.add_component('horizon',
+        Set(initialize=labels, name='horizon', ordered=True))
+    horizon = frozenset(labels)
+    shared = {}
+    for var_name in nonanticipative:
+        base_var = getattr(power_system._model, var_name)
+        master.add_component(var_name,
+            Var(master.horizon, within=base_var.domain, name=var_name))
+        shared[var_name] = (getattr(master, var_name), horizon)
+    return master, shared
+
+
+def create_native_extensive_form(master, scenario_tree, scenario_instances):
+    '''
+    Add the scenario instances to the native extensive form model
+    and create its expected cost objective.
+    '''
+    probability = dict((scenario._name, scenario._probability)
+        for scenario in scenario_tree._scenarios)
+    for name in sorted(scenario_instances.keys()):
+        instance = scenario_instances[name]
+        for objective in instance.active_components(Objective).values():
+            objective.deactivate()
+        master.add_component(name, instance)
+    master.add_component('MASTER', Objective(name='MASTER',
+        rule=sum(probability[name] *
+            (instance.cost_first_stage + instance.cost_second_stage)
+            for name, instance in scenario_instances.items()),
+        sense=minimize))
+    master.preprocess()
+    return master
+
+
+def fix_shared_commitment(master):
+    '''fix the shared status variables to their solved values'''
+    for var in master.active_components(Var).values():
+        for key, ind_var in var.iteritems():
+            ind_var.value = round(ind_var.value)
+            ind_var.fixed = True
+    master.preprocess()
+
+
+def create_extensive_form(power_system, times, scenario_tree, scenario_instances):
+    '''create the extensive form instance (all scenarios in one problem)'''
     cvar_params = {}
     if user_config.cvar_weight > 0:
         cvar_params = dict(
@@ -151,12 +297,237 @@ def create_problem_with_scenarios(power_system, times):
                 u = gen.status().name
                 delattr(full_problem_instance, 
                     '{s}_{u}_{t}'.format(s=scenario, u=u, t=str(time)))
+    return full_problem_instance
+
+
+def _commitment_generators(power_system):
+    '''
+    The generators with status variables. A mustrun unit's status
+    is a fixed parameter (see :meth:`~OptimizationObject.add_variable`),
+    so it has no values to agree on.
+    '''
+    return [gen for gen in power_system.get_generators_without_scenarios()
+        if gen.is_controllable and isinstance(
+            gen.get_variable('status', indexed=True, time=None), Var)]
+
+
+def nonanticipative_variables(power_system, times):
+    '''
+    The first stage (status) variable names and the times
+    (within the UC horizon) where they must be the same in all scenarios.
+    '''
+    post_horizon = set(str(time) for time in times.post_horizon())
+    labels = [str(time) for time in times if str(time) not in post_horizon]
+    return dict((str(gen.get_variable('status', indexed=True, time=None)),
+        labels) for gen in _commitment_generators(power_system))
+
+
+def nonanticipative_units(power_system, times):
+    '''
+    The min up/down time and initial status data of the single units,
+    by status variable name (see :func:`lagrangian.unit_subproblem`).
+    '''
+    return dict((str(gen.get_variable('status', indexed=True, time=None)),
+        unit_subproblem(gen, times))
+        for gen in _commitment_generators(power_system) if gen.count == 1)
+
+
+def repair_consensus(expected_status, nonanticipative, units):
+    '''
+    The commitment nearest to the expected statuses which keeps to
+    each unit's min up/down times and initial status. Each unit's
+    statuses are found by its single unit commitment program,
+    where being on costs the distance from the expected status.
+    Clustered units (without a unit program) are only rounded.
+    '''
+    commitment = {}
+    for var_name, labels in nonanticipative.items():
+        expected = np.array([expected_status[var_name][t] for t in labels])
+        status = np.round(expected)
+        if var_name in units:
+            # on costs 1 - x and off costs x, so on costs 1 - 2x more
+            unit = dict(units[var_name], points=np.ones(1),
+                costs=np.zeros(1), pmax=0, startupcost=0, shutdowncost=0)
+            repaired, power, objective = solve_unit(
+                (unit, 2 * expected - 1, np.zeros(len(labels))))
+            if np.isfinite(objective):
+                status = repaired
+        commitment[var_name] = dict(zip(labels, map(float, status)))
+    return commitment
+
+
+# the scenario instances, shared with the worker processes when they fork
+_scenario_problems = {}
+
+
+def solve_progressive_hedging(power_system):
+    '''
+    Solve the stochastic problem by progressive hedging.
+    Each scenario is solved separately, in a process pool.
+    The scenario objectives are penalized (by multipliers
+    and a proximal term) for differing from the expected statuses
+    until the statuses agree. The statuses are then fixed to the
+    consensus and each scenario is re-solved. If the statuses
+    did not agree, the consensus is repaired to keep to the units'
+    min up/down times (see :func:`repair_consensus`) first.
+    The solved values are loaded into the scenario instances.
+    :returns: the first scenario's instance
+    '''
+    instances = power_system._scenario_instances
+    nonanticipative = power_system._nonanticipative
+    probability = dict((scenario._name, scenario._probability)
+        for scenario in power_system._scenario_tree._scenarios)
+    names = sorted(instances.keys())
+    if user_config.cvar_weight > 0:
+        logging.warning('progressive hedging ignores the CVaR weight')
+
+    def expected(statuses):
+        return dict((var_name, dict((t, sum(probability[s] *
+            statuses[s][var_name][t] for s in names)) for t in labels))
+            for var_name, labels in nonanticipative.items())
+
+    def zeros():
+        return dict((var_name, dict((t, 0.0) for t in labels))
+            for var_name, labels in nonanticipative.items())
+
+    _scenario_problems.update(
+        instances=instances, nonanticipative=nonanticipative)
+    processes = min(multiprocessing.cpu_count(), len(names))
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    mapper = pool.map if pool is not None else map
+
+    start = timer.time()
+    weights = dict((s, zeros()) for s in names)
+    consensus = zeros()
+    rho = 0
+    try:
+        for k in range(user_config.ph_iterations):
+            solutions = dict(mapper(_solve_scenario,
+                [(s, weights[s], rho, consensus, False) for s in names]))
+            _check_solved(solutions)
+            statuses = dict((s, solutions[s][0]) for s in names)
+            consensus = expected(statuses)
+            if k == 0:
+                # the penalty is scaled to the expected cost
+                num = sum(len(labels) for labels in nonanticipative.values())
+                cost = sum(probability[s] * solutions[s][1] for s in names)
+                rho = user_config.ph_rho * abs(cost) / max(num, 1)
+
+            deviation = max([abs(statuses[s][var_name][t] - xbar)
+                for s in names
+                for var_name, values in consensus.items()
+                for t, xbar in values.items()] or [0])
+            logging.info('progressive hedging iteration {}: '
+                'max status deviation {}'.format(k, deviation))
+            if deviation < 1e-4:
+                break
+            for s in names:
+                for var_name, values in consensus.items():
+                    for t, xbar in values.items():
+                        weights[s][var_name][t] += \
+                            rho * (statuses[s][var_name][t] - xbar)
+        else:
+            logging.warning('progressive hedging did not converge '
+                '(max status deviation {})'.format(deviation))
+            consensus = repair_consensus(consensus, nonanticipative,
+                power_system._nonanticipative_units)
+
+        # fix the commitment to the (rounded) consensus
+        for values in consensus.values():
+            for t in values:
+                values[t] = round(values[t])
+        solutions = dict(mapper(_solve_scenario,
+            [(s, weights[s], 0, consensus, True) for s in names]))
+        _check_solved(solutions)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _scenario_problems.clear()
+
+    for s in names:
+        _load_values(instances[s], solutions[s][2])
+
+    power_system.solved = True
+    power_system.mipgap = None
+    power_system.solution_time = timer.time() - start
+    power_system.objective = sum(
+        probability[s] * solutions[s][1] for s in names)
+    logging.info('Problem solved in {}s.'.format(power_system.solution_time))
+    return instances[names[0]]
+
+
+def _solve_scenario(args):
+    '''
+    Solve a scenario's instance, with the progressive hedging penalty
+    (or with the statuses fixed to the consensus, if final).
+    :returns: the scenario name and a tuple of the status values,
+        the scenario cost, and all variable values (if final)
+    '''
+    name, weights, rho, consensus, final = args
+    instance = _scenario_problems['instances'][name]
+    nonanticipative = _scenario_problems['nonanticipative']
+
+    penalty = 0
+    for var_name, labels in nonanticipative.items():
+        var = getattr(instance, var_name)
+        for t in labels:
+            if final:
+                var[t].value = consensus[var_name][t]
+                var[t].fixed = True
+            else:
+                # the proximal term rho/2 (u - xbar)^2 is linear for binary u
+                penalty += (weights[var_name][t] +
+                    rho / 2.0 * (1 - 2 * consensus[var_name][t])) * var[t]
+    delattr(instance, 'objective')
+    instance.objective = Objective(name='objective',
+        rule=instance.cost_first_stage + instance.cost_second_stage + penalty,
+        sense=minimize)
+    instance.preprocess()
+
+    solver = cooprsolver.SolverFactory(user_config.solver)
+    solver.options.mipgap = user_config.mipgap
+    if user_config.solver_time_limit:
+        solver.options.timelimit = user_config.solver_time_limit
+    results = solver.solve(instance)
+    if not detect_status(results, solver.name):
+        return name, None
+    instance.load(results, allow_consistent_values_for_fixed_vars=True)
+
+    statuses = dict((var_name, dict((t, getattr(instance, var_name)[t].value)
+        for t in labels)) for var_name, labels in nonanticipative.items())
+    cost = instance.cost_first_stage.value + instance.cost_second_stage.value
+    values = _get_values(instance) if final else None
+    return name, (statuses, cost, values)
+
+
+def _check_solved(solutions):
+    failed = [s for s, sln in solutions.items() if sln is None]
+    if failed:
+        raise OptimizationError('scenarios {} not solved'.format(
+            ', '.join(sorted(failed))))
+
+
+def _get_values(instance):
+    '''the values of all of the variables in an instance'''
+    values = {}
+    for var_name, var in instance.active_components(Var).items():
+        if var.is_indexed():
+            values[var_name] = dict(
+                (idx, var_val.value) for idx, var_val in var.iteritems())
+        else:
+            values[var_name] = var.value
+    return values
 
-    power_system.stochastic_formulation = True
-    power_system._stochastic_instance = full_problem_instance
-    power_system._scenario_tree = scenario_tree
-    power_system._scenario_instances = scenario_instances
-    return
+
+def _load_values(instance, values):
+    for var_name, var_values in values.items():
+        var = getattr(instance, var_name)
+        if var.is_indexed():
+            for idx, val in var_values.items():
+                var[idx].value = val
+        else:
+            var.value = var_values
 
 
 def get_scenario_based_costs(scenario_tree, scenario_instances):
@@ -172,20 +543,6 @@ def get_scenario_based_costs(scenario_tree, scenario_instances):
     return costs
 
 
-def update_variables(power_system, times):
-    '''Convert all variables into dictionaries of their solved values, keyed by scenario'''
-    variable_names = power_system._model.active_components(Var).keys()
-    values = dict([(nm, {}) for nm in variable_names])
-    for s, scenario in power_system._scenario_instances.items():
-        for var_name, var in scenario.active_components(Var).items():
-            if var.is_indexed():
-                    values[var_name][s] = dict(
-                        [(idx, var_val.value) for idx, var_val in var.iteritems()])
-            else:
-                    values[var_name][s] = var.value
-    power_system._per_scenario_values = values
-
-
 def new_scenario_tree_model():
     # https://software.sandia.gov/trac/coopr/browser/coopr.pysp/trunk/coopr/pysp/util/scenariomodels.py
     scenario_tree_model = AbstractModel()
@@ -214,6 +214,48 @@ def min_down_time():
     assert limgen_status==[1,0,0,1] and expensive_status_t2==1
 
 
+@istest
+@with_setup(teardown=reset_config)
+def min_up_time_three_binary():
+    '''
+    Solve the min up time problem with the three binary formulation.
+    Ensure that the expensive generator is on at t1 and t2, then turns off.
+    '''
+    user_config.uc_formulation = 'three_binary'
+    generators=[
+        make_cheap_gen(pmax=100),
+        make_expensive_gen(minuptime=2,pmin=5)   ]
+    initial = [
+        dict(power=80, status=True),
+        dict(status=False)]
+    _,times=solve_problem(generators,gen_init=initial,**make_loads_times(Pdt=[85,120,80,80]))
+    limgen_status=[generators[1].status(t) for t in times]
+    assert limgen_status == [0,1,1,0] or limgen_status == [1,1,0,0]
+
+
+@istest
+@with_setup(teardown=reset_config)
+def min_down_time_three_binary():
+    '''
+    Solve the min down time problem with the three binary formulation.
+    Ensure that the mid generator is OFF at t1 and t2, then turns on again.
+    '''
+    user_config.uc_formulation = 'three_binary'
+    generators=[
+        make_cheap_gen(pmax=100),
+        make_mid_gen(mindowntime=2,pmin=40),
+        make_expensive_gen()]
+    initial = [
+        dict(power=100, status=True),
+        dict(power=40, status=True,hoursinstatus=0),
+        dict(status=False)]
+
+    _, times = solve_problem(generators,gen_init=initial,**make_loads_times(Pdt=[150,10,140,140]))
+    limgen_status = [generators[1].status(t) for t in times]
+    startups = [value(generators[1].startup(t)) for t in times]
+    assert limgen_status==[1,0,0,1] and startups==[0,0,0,1]
+
+
 @istest
 def start_up_cost():
     '''
@@ -84,6 +84,42 @@ def run_uc():
 def run_uc_rolling():
     run_case('uc-rolling')
 
+@istest
+@with_setup(teardown=reset_config)
+def run_uc_rolling_reuse_model():
+    '''reusing the stage model should not change the rolling UC solution'''
+    sln_rebuilt = run_case('uc-rolling')
+    sln_reused = run_case('uc-rolling', reuse_model=True)
+    assert round(sln_rebuilt.objective - sln_reused.objective, 3) == 0
+    assert_frame_equal(
+        sln_rebuilt.generators_status, sln_reused.generators_status)
+
+@istest
+@with_setup(teardown=reset_config)
+def run_uc_rolling_elastic_shedding():
+    '''elastic shedding should give the same solution as rebuilding the model'''
+    sln_rebuilt = run_case('uc-rolling-shedding')
+    sln_elastic = run_case('uc-rolling-shedding', elastic_shedding=True)
+    assert round(sln_rebuilt.objective - sln_elastic.objective, 3) == 0
+
+@istest
+@with_setup(teardown=reset_config)
+def run_uc_matrix_backend():
+    '''the matrix backend should give the same UC solution as pyomo'''
+    sln_pyomo = run_case('uc')
+    sln_matrix = run_case('uc', backend='matrix')
+    assert round(sln_pyomo.objective - sln_matrix.objective, 3) == 0
+    assert_frame_equal(
+        sln_pyomo.generators_status, sln_matrix.generators_status)
+
+@istest
+@with_setup(teardown=reset_config)
+def run_opf_matrix_backend():
+    '''the matrix backend should give the same OPF solution as pyomo'''
+    sln_pyomo = run_case('opf')
+    sln_matrix = run_case('opf', backend='matrix')
+    assert round(sln_pyomo.objective - sln_matrix.objective, 3) == 0
+
 @istest
 def run_ed():
     run_case('ed')
@@ -101,5 +101,106 @@ def three_buses():
     total_load = value(sum(b.Pload(times[0]) for b in power_system.buses))
     assert total_load==sum(Pd) and num_lmps>1
 
+def solve_three_buses():
+    '''solve the congested three bus system, return the line flows and LMPs'''
+    power_system, times = solve_three_bus_system()
+    flows = [round(value(line.power(times[0])), 4) for line in power_system.lines]
+    lmps = [round(b.price(times[0]), 4) for b in power_system.buses]
+    return flows, lmps
+
+def solve_three_bus_system():
+    generators=[
+        make_cheap_gen(bus='A'),
+        make_mid_gen(bus='B'),
+        make_expensive_gen(bus='C'),
+        ]
+    loads=[
+        powersystems.Load(schedule=Series(105,singletime), bus='A'),
+        powersystems.Load(schedule=Series(225,singletime), bus='B'),
+        powersystems.Load(schedule=Series(302,singletime), bus='C')
+        ]
+    lines=[
+        powersystems.Line(frombus='A', tobus='B'),
+        powersystems.Line(frombus='A', tobus='C', pmax=50),
+        powersystems.Line(frombus='B', tobus='C', pmax=50),
+        ]
+    return solve_problem(generators, do_reset_config=False,
+        times=singletime,loads=loads,lines=lines)
+
+@istest
+@with_setup(get_duals, reset_config)
+def three_buses_ptdf():
+    '''
+    Solve the three bus system with and without the PTDF formulation.
+    Ensure that the line flows and the lmps are the same.
+    '''
+    flows, lmps = solve_three_buses()
+    user_config.ptdf = True
+    flows_ptdf, lmps_ptdf = solve_three_buses()
+    assert flows == flows_ptdf and lmps == lmps_ptdf
+
+@istest
+@with_setup(get_duals, reset_config)
+def three_buses_bulk_prices():
+    '''
+    Solve the three bus system with and without the PTDF formulation.
+    Ensure that the prices read in bulk match the bus and line duals.
+    '''
+    for ptdf in [False, True]:
+        user_config.ptdf = ptdf
+        power_system, times = solve_three_bus_system()
+        lmps, line_prices = power_system.prices([str(times[0])])
+        assert [round(p, 4) for p in lmps[0]] == \
+            [round(b.price(times[0]), 4) for b in power_system.buses]
+        assert [round(p, 4) for p in line_prices[0]] == \
+            [round(ln.price(times[0]), 4) for ln in power_system.lines]
+
+@istest
+@with_setup(get_duals, reset_config)
+def three_buses_lazy_line_limits():
+    '''
+    Solve the three bus system, adding only the violated line limits.
+    Ensure that the line flows and the lmps are the same.
+    '''
+    flows, lmps = solve_three_buses()
+    user_config.lazy_line_limits = True
+    flows_lazy, lmps_lazy = solve_three_buses()
+    assert flows == flows_lazy and lmps == lmps_lazy
+
+@istest
+@with_setup(teardown=reset_config)
+def three_buses_contingencies():
+    '''
+    Solve the three bus system with N-1 contingency screening.
+    Ensure that the flows after any single line outage
+    are within the line limits.
+    '''
+    user_config.contingency_screening = True
+    generators=[
+        make_cheap_gen(bus='A'),
+        make_mid_gen(bus='B'),
+        make_expensive_gen(bus='C'),
+        ]
+    loads=[
+        powersystems.Load(schedule=Series(105,singletime), bus='A'),
+        powersystems.Load(schedule=Series(225,singletime), bus='B'),
+        powersystems.Load(schedule=Series(302,singletime), bus='C')
+        ]
+    lines=[
+        powersystems.Line(frombus='A', tobus='B', pmax=150),
+        powersystems.Line(frombus='A', tobus='C', pmax=50),
+        powersystems.Line(frombus='B', tobus='C', pmax=50),
+        ]
+    power_system,times=solve_problem(generators, do_reset_config=False,
+        times=singletime,loads=loads,lines=lines)
+    flows = [value(line.power(times[0])) for line in lines]
+    lodf = power_system.lodf()
+    for l, line in enumerate(lines):
+        for m in range(len(lines)):
+            if l == m:
+                continue
+            post = flows[l] + lodf[l, m] * flows[m]
+            assert line.pmin - 1e-4 <= post <= line.pmax + 1e-4
+
 def test_config_cleared():
     assert(user_config.duals == False)
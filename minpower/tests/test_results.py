@@ -1,5 +1,9 @@
+import os
+import tempfile
+import shutil
 from test_utils import *
-from minpower.results import make_solution
+from minpower.results import (make_solution, read_results,
+    needed_quantities)
 
 @istest
 @with_setup(teardown=reset_config)
@@ -26,3 +30,120 @@ def check_power_status():
         
     assert(sln.generators_status.ix[t0, 'g1'] == \
         value(generators[1].status(times[0])) )
+
+
+@istest
+@with_setup(teardown=reset_config)
+def bulk_values():
+    '''
+    Ensure that the values read in bulk from the variables
+    match the values evaluated at each time.
+    '''
+    generators=[
+        make_cheap_gen(pmax=100, startupcost=50),
+        make_mid_gen(pmax=20),
+        make_expensive_gen()
+    ]
+    power_system, times = solve_problem(generators,
+        **make_loads_times(Pdt=[80,110,130]))
+    sln = make_solution(power_system, times)
+    for method in ['power', 'status', 'cost', 'operatingcost']:
+        for t, time in enumerate(times):
+            bulk = sln.gen_time_df(method).ix[sln.generators_power.index[t]]
+            each = sln.get_values(generators, method, time,
+                evaluate=method in ['cost', 'operatingcost'])
+            for g, gen in enumerate(generators):
+                assert round(bulk[str(gen)] - value(each[g]), 5) == 0
+
+
+@istest
+@with_setup(teardown=reset_config)
+def lazy_quantities():
+    '''
+    Ensure that the solution quantities are only loaded when they are used
+    (or are needed by the run) and not after the solution is detached.
+    '''
+    generators=[make_cheap_gen(pmax=100), make_expensive_gen()]
+    power_system, times = solve_problem(generators,
+        **make_loads_times(Pdt=[80,110,130]))
+    sln = make_solution(power_system, times)
+    assert 'totalcost_generation' not in sln.__dict__
+    sln.totalcost_generation
+    assert 'costs' in sln._loaded and 'prices' not in sln._loaded
+
+    user_config.solution_quantities = 'shedding'
+    sln.detach()
+    assert 'shedding' in sln._loaded and 'prices' not in sln._loaded
+    try:
+        sln.lmps
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError('prices loaded after detaching')
+
+
+@istest
+@with_setup(teardown=reset_config)
+def lazy_quantity_loader_error():
+    '''
+    Ensure that an AttributeError in a quantity's loader is raised
+    as a RuntimeError (not taken for a missing attribute)
+    and that the quantity is not marked as loaded.
+    '''
+    generators=[make_cheap_gen(pmax=100), make_expensive_gen()]
+    power_system, times = solve_problem(generators,
+        **make_loads_times(Pdt=[80,110,130]))
+    sln = make_solution(power_system, times)
+
+    def broken_loader():
+        raise AttributeError('broken')
+    sln._get_generation_costs = broken_loader
+    try:
+        sln.totalcost_generation
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError('the loader error was not raised')
+    assert 'costs' not in sln._loaded
+
+    # the quantity loads once the loader works
+    del sln._get_generation_costs
+    assert sln.totalcost_generation is not None
+    assert 'costs' in sln._loaded
+
+
+@istest
+@with_setup(teardown=reset_config)
+def standalone_quantities():
+    '''
+    Ensure that standalone runs only need the stored quantities.
+    '''
+    user_config.standalone = True
+    assert sorted(needed_quantities()) == ['costs', 'outputs', 'shedding']
+
+
+@istest
+@with_setup(teardown=reset_config)
+def npz_round_trip():
+    '''
+    Ensure that the results saved in the npz format read back
+    as the solution tables (with compact statuses).
+    '''
+    generators=[make_cheap_gen(pmax=100), make_expensive_gen()]
+    power_system, times = solve_problem(generators,
+        **make_loads_times(Pdt=[80,110,130]))
+    sln = make_solution(power_system, times)
+    user_config.directory = tempfile.mkdtemp()
+    try:
+        sln.saveNPZ()
+        tables, manifest = read_results(
+            os.path.join(user_config.directory, 'results.json'))
+    finally:
+        shutil.rmtree(user_config.directory)
+
+    assert tables['status'].values.dtype == 'int8'
+    assert (tables['status'].values == sln.generators_status.values).all()
+    assert (tables['status'].index == sln.generators_status.index).all()
+    assert (abs(tables['power'] - sln.generators_power) < 1e-3).all().all()
+    assert 'lmps' not in tables
+    assert manifest['stages']['objective'] == [sln.objective]
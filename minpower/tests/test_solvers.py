@@ -1,6 +1,8 @@
 '''Test the all of the solver links'''
 
-from minpower import optimization, config
+import os
+import nose
+from minpower import optimization, config, solversession
 from test_utils import *
 from coopr import pyomo
 
@@ -67,3 +69,109 @@ def gurobi():
     '''Test the gurobi solver on a simple problem'''
     if 'gurobi' in config.available_solvers:
         assert run_one_solver('gurobi')        
+
+
+@istest
+@with_setup(teardown=reset_config)
+def glpk_session():
+    '''Test the in-process glpk session on a simple problem'''
+    if not solversession.available():
+        raise nose.SkipTest('the solver session requires swiglpk')
+    config.user_config.backend = 'matrix'
+    config.user_config.solver_session = True
+    prob = simple_problem()
+    prob.solve()
+    assert prob.solved and round(prob.objective, 4) == -8
+
+
+@istest
+def glpk_session_same_matrix():
+    '''
+    Ensure that a new model with the same constraint matrix
+    (like the next stage's) is solved without re-loading the problem.
+    '''
+    if not solversession.available():
+        raise nose.SkipTest('the solver session requires swiglpk')
+    from minpower import matrixmodel
+
+    def make_model(high):
+        model = matrixmodel.ConcreteModel()
+        model.x = matrixmodel.Var(name='x', bounds=(0, high))
+        model.y = matrixmodel.Var(name='y', bounds=(0, 1))
+        model.objective = matrixmodel.Objective(
+            rule=model.y - 4 * model.x)
+        model.ineq = matrixmodel.Constraint(rule=model.x + model.y <= 2)
+        return model
+
+    session = solversession.GLPKSession()
+    results = session.solve(make_model(3))
+    lp = session._lp
+    results_next = session.solve(make_model(1))
+    assert session._lp is lp
+    assert round(results.Solution.objective['objective']['Value'], 4) == -8
+    assert round(
+        results_next.Solution.objective['objective']['Value'], 4) == -4
+
+
+@istest
+@with_setup(teardown=reset_config)
+def glpk_session_other_solver():
+    '''Ensure that the glpk session is not used for another solver'''
+    config.user_config.backend = 'matrix'
+    config.user_config.solver_session = True
+    config.user_config.solver = 'cplex'
+    assert not simple_problem().use_session
+
+
+@istest
+def glpk_session_gap():
+    '''
+    Ensure that the session reports the MIP gap
+    (from the root LP bound, within the mipgap if optimal).
+    '''
+    if not solversession.available():
+        raise nose.SkipTest('the solver session requires swiglpk')
+    from minpower import matrixmodel
+
+    def make_model():
+        model = matrixmodel.ConcreteModel()
+        model.x = matrixmodel.Var(name='x', bounds=(0, 3),
+            domain=matrixmodel.Integers)
+        model.y = matrixmodel.Var(name='y', bounds=(0, 1))
+        model.objective = matrixmodel.Objective(
+            rule=model.y - 4 * model.x)
+        model.ineq = matrixmodel.Constraint(rule=model.x + model.y <= 2.5)
+        return model
+
+    # the LP bound is -10 and the MIP objective is -8
+    results = solversession.GLPKSession(mipgap=0.5).solve(make_model())
+    assert round(results.Solution[0]['Gap'], 4) == 0.25
+    results = solversession.GLPKSession().solve(make_model())
+    assert results.Solution[0]['Gap'] == 0
+
+
+@istest
+def matrix_maximize():
+    '''
+    Ensure that a maximized matrix model is written
+    (and solved in the session) as a maximization
+    '''
+    from minpower import matrixmodel
+    model = matrixmodel.ConcreteModel()
+    model.x = matrixmodel.Var(name='x', bounds=(0, 3))
+    model.y = matrixmodel.Var(name='y', bounds=(0, 1))
+    model.objective = matrixmodel.Objective(
+        rule=4 * model.x - model.y, sense=matrixmodel.maximize)
+    model.ineq = matrixmodel.Constraint(rule=model.x + model.y <= 2)
+
+    filename = model.problem_file()
+    try:
+        lines = open(filename).read().splitlines()
+    finally:
+        os.remove(filename)
+    assert 'max' in lines and 'min' not in lines
+
+    if not solversession.available():
+        raise nose.SkipTest('the solver session requires swiglpk')
+    results = solversession.GLPKSession().solve(model)
+    assert round(results.Solution.objective['objective']['Value'], 4) == 8
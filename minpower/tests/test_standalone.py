@@ -0,0 +1,150 @@
+'''Test the stage segments of the standalone mode'''
+import os
+import tempfile
+import shutil
+import pandas as pd
+from pandas import DataFrame
+from test_utils import *
+from minpower import standalone
+from minpower.tests.test_integration import run_case
+
+try:
+    import tables
+except ImportError:
+    tables = None
+
+tmpdir = None
+
+
+def make_store():
+    '''a temporary store (and stages directory)'''
+    global tmpdir
+    if tables is None:
+        raise nose.SkipTest('standalone mode requires pytables')
+    tmpdir = tempfile.mkdtemp()
+    user_config.store_filename = os.path.join(tmpdir, 'store.hd5')
+    os.makedirs(standalone._stages_directory())
+
+
+def remove_store():
+    global tmpdir
+    if tmpdir is not None:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        tmpdir = None
+    reset_config()
+
+
+def stage_frame(times, values):
+    return DataFrame(dict(g0=values), index=times)
+
+
+@istest
+@with_setup(setup=make_store, teardown=remove_store)
+def partial_segment():
+    '''
+    Ensure that a segment left partially written (by a crash)
+    is not counted as committed and is replaced by the next commit.
+    '''
+    filename = standalone._stage_filename(0)
+    with open(filename + '.partial', 'w') as f:
+        f.write('a crashed stage')
+    assert standalone.committed_stages() == 0
+
+    times = pd.date_range('2014-01-01 01:00', periods=2, freq='H')
+    standalone.commit_stage(0, dict(power=stage_frame(times, [10.0, 20.0])),
+        dict(solve_time=1.5, mipgap=0.01))
+
+    assert not os.path.exists(filename + '.partial')
+    assert standalone.committed_stages() == 1
+    segment = standalone.read_stage(0, ['power', 'values'])
+    assert segment['power'].g0.tolist() == [10.0, 20.0]
+    assert segment['values']['solve_time'] == 1.5
+
+
+@istest
+@with_setup(setup=make_store, teardown=remove_store)
+def collect_stages():
+    '''
+    Ensure that the collected power and status tables start with
+    the initial state row, followed by each stage's rows,
+    and that the solve times and mipgaps have one value per stage.
+    '''
+    times = pd.date_range('2014-01-01 00:00', periods=5, freq='H')
+    storage = standalone.get_storage()
+    storage['initial_power'] = stage_frame(times[:1], [0.0])
+    storage['initial_status'] = stage_frame(times[:1], [0.0])
+    storage.close()
+
+    for stage, (start, end) in enumerate([(1, 3), (3, 5)]):
+        standalone.commit_stage(stage, dict(
+            power=stage_frame(times[start:end], [50.0 * stage] * 2),
+            status=stage_frame(times[start:end], [stage] * 2)),
+            dict(solve_time=stage + 1.0, mipgap=0.001 * stage))
+
+    standalone.collect_stages()
+    storage = standalone.get_storage()
+    try:
+        assert (storage['power'].index == times).all()
+        assert storage['power'].g0.tolist() == [0, 0, 0, 50, 50]
+        assert storage['status'].g0.tolist() == [0, 0, 0, 1, 1]
+        assert storage['solve_time'].tolist() == [1.0, 2.0]
+        assert storage['mipgap'].tolist() == [0, 0.001]
+    finally:
+        storage.close()
+
+
+@istest
+@with_setup(teardown=remove_store)
+def restart():
+    '''
+    Ensure that a restarted standalone run resumes at the first stage
+    that was not committed (the committed stages are not re-solved)
+    and gives the same solution.
+    '''
+    if tables is None:
+        raise nose.SkipTest('standalone mode requires pytables')
+    slnA = run_case('stochastic_short_case', deterministic_solve=True,
+        standalone=True)
+    stages = standalone.committed_stages()
+    assert stages > 1
+
+    # lose the last stage (as if the run crashed during it)
+    os.remove(standalone._stage_filename(stages - 1))
+    kept = [os.path.getmtime(standalone._stage_filename(stage))
+        for stage in range(stages - 1)]
+
+    slnB = run_case('stochastic_short_case', deterministic_solve=True,
+        standalone=True, standalone_restart=True)
+
+    assert standalone.committed_stages() == stages
+    assert kept == [os.path.getmtime(standalone._stage_filename(stage))
+        for stage in range(stages - 1)]
+    assert slnA.observed_cost.sum().sum() == slnB.observed_cost.sum().sum()
+
+
+@istest
+@with_setup(setup=make_store, teardown=remove_store)
+def commit_syncs():
+    '''
+    Ensure that a segment is synced to disk before it is renamed
+    into place and that the stages directory is synced around the rename.
+    '''
+    filename = standalone._stage_filename(0)
+    directory = standalone._stages_directory()
+    synced = []
+
+    def record_sync(path):
+        synced.append((path, os.path.exists(filename)))
+
+    fsync = standalone._fsync
+    standalone._fsync = record_sync
+    try:
+        times = pd.date_range('2014-01-01 01:00', periods=2, freq='H')
+        standalone.commit_stage(0,
+            dict(power=stage_frame(times, [10.0, 20.0])),
+            dict(solve_time=1.0, mipgap=0.0))
+    finally:
+        standalone._fsync = fsync
+
+    assert synced == [(filename + '.partial', False),
+        (directory, False), (directory, True)]
@@ -1,10 +1,16 @@
 import logging
 logging.basicConfig(level=logging.ERROR)
 
+import os
+import tempfile
+import shutil
 import nose
 import numpy as np
 import pandas as pd
 from minpower.commonscripts import set_trace, debug_frame_unequal
+from minpower import scenarioreduction, stochastic
+from minpower.config import user_config
+from minpower.results import read_results
 from minpower.tests.test_utils import istest
 from minpower.tests.test_integration import (run_case, 
     assert_series_equal, assert_frame_equal)
@@ -41,6 +47,91 @@ def mock_stochastic():
     assert(diffpercent < mipgap)
 
 
+@istest
+def progressive_hedging():
+    '''
+    solving the mock stochastic problem by progressive hedging
+    should give the same cost as solving the extensive form
+    '''
+    slnEF = run_case('stochastic_mock_case',
+        scenarios_directory='scenarios/')
+    slnPH = run_case('stochastic_mock_case',
+        scenarios_directory='scenarios/', progressive_hedging=True)
+
+    costEF = slnEF.observed_cost.sum().sum()
+    costPH = slnPH.observed_cost.sum().sum()
+
+    diffpercent = np.abs((costPH - costEF) / costEF)
+    assert(diffpercent < mipgap)
+
+
+@istest
+def progressive_hedging_mustrun():
+    '''
+    a mustrun unit's status is a fixed parameter
+    (not one of the variables the scenarios agree on).
+    progressive hedging should solve a case with a mustrun unit,
+    keep that unit on and give the same cost as the extensive form
+    '''
+    slnEF = run_case('stochastic_mustrun_case')
+    slnPH = run_case('stochastic_mustrun_case', progressive_hedging=True)
+
+    costEF = slnEF.observed_cost.sum().sum()
+    costPH = slnPH.observed_cost.sum().sum()
+    assert(np.abs((costPH - costEF) / costEF) < mipgap)
+
+    # g1 is the mustrun unit
+    assert (slnPH.generators_status['g1'] == 1).all()
+
+
+@istest
+def progressive_hedging_repair():
+    '''
+    the repaired consensus should keep to the unit's min up time
+    (where rounding the expected statuses would not)
+    '''
+    labels = ['t{}'.format(t) for t in range(6)]
+    expected = {'status_g0': dict(zip(labels, [0.6, 0.4, 0.6, 0.4, 0, 0]))}
+    unit = dict(min_up=3, min_down=0, initial_status=False,
+        initial_remaining=0)
+    commitment = stochastic.repair_consensus(expected,
+        {'status_g0': labels}, {'status_g0': unit})
+    assert [commitment['status_g0'][t] for t in labels] == \
+        [1, 1, 1, 0, 0, 0]
+
+
+@istest
+def native_extensive_form():
+    '''
+    the native extensive form (shared status variables)
+    should give the same cost as the pysp extensive form
+    '''
+    sln = run_case('stochastic_mock_case',
+        scenarios_directory='scenarios/')
+    slnN = run_case('stochastic_mock_case',
+        scenarios_directory='scenarios/', native_ef=True)
+
+    cost = sln.observed_cost.sum().sum()
+    costN = slnN.observed_cost.sum().sum()
+    assert(np.abs((costN - cost) / cost) < mipgap)
+
+
+@istest
+def scenario_reduction():
+    '''
+    reducing two pairs of nearly identical scenarios to two scenarios
+    should keep one scenario from each pair, with the pair's probability
+    '''
+    values = [[0, 0], [0.1, 0], [10, 10], [10.2, 10]]
+    probability = [0.25, 0.25, 0.25, 0.25]
+    for reduction in [scenarioreduction.fast_forward,
+                      scenarioreduction.backward]:
+        selected, new_probability = reduction(values, probability, 2)
+        assert(len(selected) == 2)
+        assert(selected[0] in [0, 1] and selected[1] in [2, 3])
+        assert(np.allclose(new_probability, [0.5, 0.5]))
+
+
 @istest
 def standalone():
     try:
@@ -54,8 +145,46 @@ def standalone():
     assert(slnA.observed_cost.sum().sum() == slnB.observed_cost.sum().sum())
     
 
+@istest
+def standalone_fork():
+    '''forked standalone workers should give the same solution'''
+    try:
+        import tables
+    except ImportError:
+        raise nose.SkipTest('standalone mode requires pytables')
+
+    slnA = run_case('stochastic_short_case', deterministic_solve=True,
+        standalone=True)
+    # recycle the worker after every stage
+    slnB = run_case('stochastic_short_case', deterministic_solve=True,
+        standalone=True, standalone_fork=True, standalone_worker_stages=1)
+
+    assert(slnA.observed_cost.sum().sum() == slnB.observed_cost.sum().sum())
+
+
+@istest
+def multistage_npz_round_trip():
+    '''
+    the npz results of a resolved multistage solution
+    should include its expected and observed costs
+    '''
+    sln = run_case('stochastic_short_case', deterministic_solve=True)
+    user_config.directory = tempfile.mkdtemp()
+    try:
+        sln.saveNPZ()
+        tables, manifest = read_results(
+            os.path.join(user_config.directory, 'results.json'))
+    finally:
+        shutil.rmtree(user_config.directory)
+
+    for name, attr in [('expected_cost', 'expected_cost'),
+            ('observed_cost', 'observed_cost'),
+            ('expected_power', 'expected_power')]:
+        assert (abs(tables[name] - getattr(sln, attr)) < 1e-3).all().all()
+    assert tables['expected_status'].values.dtype == 'int8'
+    assert len(manifest['stages']['solve_time']) == len(sln.solve_times)
+
 
-    
 @istest
 def expected_cost_case():
     '''
@@ -97,8 +226,8 @@ def stochastic_load_shedding():
     epower = sln.generators_power_scenarios
     load_sched = sln.loads[0].schedule
     
-    assert((epower['s0'].sum(axis=1) < load_sched).all())
-    assert((epower['s1'].sum(axis=1) == load_sched).all())
+    assert((sln.scenario_frame(epower, 's0').sum(axis=1) < load_sched).all())
+    assert((sln.scenario_frame(epower, 's1').sum(axis=1) == load_sched).all())
     
 @istest
 def stochastic_gen_shedding():
@@ -111,21 +240,24 @@ def stochastic_gen_shedding():
     
     
     epower = sln.generators_power_scenarios
+    times = sln.times_non_overlap.strings.index
     load_sched = sln.loads[0].schedule
-    load_sched.index = epower.major_axis
     # check that generation meets the load for all scenarios
-    assert(epower.sum(axis=2).eq(load_sched, axis=0).all().all())
+    assert((epower.sum(axis=2) == load_sched.values[:len(times)]).all())
 
     # get wind power scenarios
     scenario_values = sln.generators[0].scenario_values.drop(
         'probability', axis=2)
     scenario_values = scenario_values[
-        scenario_values.items[0]].T.ix[:len(epower.major_axis) -1] \
-        .set_index(epower.major_axis) \
+        scenario_values.items[0]].T.ix[:len(times) -1] \
+        .set_index(times) \
         .rename(
             columns=dict(zip(range(len(sln.scenarios)), sln.scenarios)))
     # calculate wind shed per scenario
-    wind_shed = scenario_values - epower.minor_xs('g0')
+    wind_power = pd.DataFrame(
+        epower[:, :, [str(g) for g in sln.generators].index('g0')].T,
+        index=times, columns=sln.scenarios)
+    wind_shed = scenario_values - wind_power
     
     assert_series_equal(
         pd.Series(dict(s0=False, s1=True)), 
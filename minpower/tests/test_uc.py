@@ -1,6 +1,8 @@
 '''Test the higher level behavior of the unit commitment'''
 import random
 from minpower.generators import Generator
+from minpower import get_data, lagrangian
+import numpy as np
 import pandas as pd
 from pandas.util.testing import assert_frame_equal, assert_series_equal
 from test_utils import *
@@ -66,6 +68,222 @@ def load_shedding():
     assert price_t1 == user_config.cost_load_shedding
 
 
+@istest
+@with_setup(teardown=reset_config)
+def feasibility_screen():
+    '''
+    Create a single generator with a high limit.
+    Create a load that exceeds that limit at t1.
+    Ensure that:
+    * the screen finds that only t1 is infeasible
+    * the stage is solved with shedding
+    * Pshedt1 = Pdt1 - pmax
+    '''
+    user_config.feasibility_screen = True
+    pmax = 100
+    Pdt1 = 211
+    generators = [make_cheap_gen(pmax=pmax)]
+    generators[0].set_initial_condition()
+    loads_times = make_loads_times(Pdt=[90, Pdt1, 90])
+    times = loads_times['times']
+    power_system = powersystems.PowerSystem(generators, loads_times['loads'])
+    solve.create_problem(power_system, times)
+
+    infeasible = power_system.screen_feasibility(times)
+    assert infeasible.index.tolist() == [times.times[1]]
+
+    power_system.solve_problem(times)
+    assert power_system.shedding_mode
+    load = power_system.loads()[0]
+    assert load.shed(times[1], evaluate=True) == Pdt1 - pmax
+
+@istest
+@with_setup(teardown=reset_config)
+def clustered_generators():
+    '''
+    Create three identical generators and an expensive generator.
+    Solve with and without the identical generators clustered.
+    Ensure that:
+    * the objective is the same
+    * the cluster commits a whole number of units
+    '''
+    power_system, times = solve_identical_units(cluster=False)
+    objective = value(power_system.objective)
+    power_system, times = solve_identical_units(cluster=True)
+    cluster = power_system.generators()[0]
+    assert cluster.count == 3
+    assert round(objective - value(power_system.objective), 5) == 0
+    for t in times:
+        assert value(cluster.status(t)) in [0, 1, 2, 3]
+
+@istest
+@with_setup(teardown=reset_config)
+def clustered_generators_down_time():
+    '''
+    Create three identical generators with a min down time
+    and solve with the three binary formulation.
+    Ensure that the objective is the same with and without clustering
+    (more than one unit of the cluster can be on after a shutdown).
+    '''
+    kwds = dict(mindowntime=2, formulation='three_binary',
+        Pdt=[260, 120, 260, 260, 80, 260])
+    power_system, times = solve_identical_units(cluster=False, **kwds)
+    objective = value(power_system.objective)
+    power_system, times = solve_identical_units(cluster=True, **kwds)
+    assert power_system.generators()[0].count == 3
+    assert round(objective - value(power_system.objective), 5) == 0
+
+@istest
+@with_setup(teardown=reset_config)
+def clustered_unit_hours():
+    '''
+    Create a cluster of three units which have been on for 1hr
+    and a stage in which one unit is shut down at the last hour.
+    Ensure that the next stage keeps each unit's hours in status:
+    * the two units that stayed on have met their min up time
+    * the unit that was shut down must stay off for another hour
+    '''
+    units = [Generator(name='unit{}'.format(i),
+        pmin=20, pmax=100, costcurveequation='100+10P',
+        minuptime=3, mindowntime=2) for i in range(3)]
+    for unit in units:
+        unit.set_initial_condition(status=True, power=50, hoursinstatus=1)
+    times = schedule.make_times_basic(4)
+    cluster = get_data.cluster_generators(units, times)[0]
+    assert cluster.count == 3
+
+    stat = pd.Series([3, 3, 3, 2], index=times.strings.values)
+    hours = cluster.getunithours(times, stat)
+    assert hours == [5, 5, 1]
+
+    cluster.set_initial_condition(power=100, status=2,
+        hoursinstatus=cluster.gethrsinstatus(times, stat), unithours=hours)
+    assert cluster._initial_unit_intervals(times) == \
+        [(True, 0), (True, 0), (False, 1)]
+    assert cluster._initial_min_intervals(times) == (0, 1)
+
+@istest
+@with_setup(teardown=reset_config)
+def clustered_generators_standalone():
+    '''
+    Ensure that generators are not clustered in standalone mode
+    (the stored stage states are by unit).
+    '''
+    user_config.standalone = True
+    generators = [Generator(name='unit{}'.format(i),
+        pmin=20, pmax=100, costcurveequation='100+10P') for i in range(3)]
+    for gen in generators:
+        gen.set_initial_condition()
+    clustered = get_data.cluster_generators(
+        generators, schedule.make_times_basic(4))
+    assert clustered == generators
+
+def solve_identical_units(cluster, mindowntime=0, formulation='status',
+        Pdt=(80, 150, 260, 120)):
+    user_config.uc_formulation = formulation
+    generators = [Generator(name='unit{}'.format(i),
+        pmin=20, pmax=100, costcurveequation='100+10P',
+        startupcost=50, minuptime=2, mindowntime=mindowntime)
+        for i in range(3)]
+    generators.append(make_expensive_gen())
+    for gen in generators:
+        gen.set_initial_condition(status=False, power=0)
+    loads_times = make_loads_times(Pdt=list(Pdt))
+    if cluster:
+        generators = get_data.cluster_generators(
+            generators, loads_times['times'])
+    initial = [dict(status=0, power=0) for gen in generators]
+    return solve_problem(generators, gen_init=initial, **loads_times)
+
+@istest
+@with_setup(teardown=reset_config)
+def lagrangian_commitment():
+    '''
+    Create three generators with no fixed costs.
+    Solve the commitment by Lagrangian relaxation.
+    Ensure that:
+    * the load is met
+    * the objective is the same as the MIP's
+    '''
+    def solve_commitment():
+        generators = [make_cheap_gen(pmax=100), make_mid_gen(pmax=100),
+            make_expensive_gen()]
+        loads_times = make_loads_times(Pdt=[80, 150, 190])
+        times = loads_times['times']
+        for g, gen in enumerate(generators):
+            gen.index = g
+            gen.set_initial_condition()
+        power_system = powersystems.PowerSystem(
+            generators, loads_times['loads'], [])
+        solve.create_problem(power_system, times)
+        power_system.solve_problem(times)
+        power_system.update_variables()
+        return power_system, times
+
+    power_system, times = solve_commitment()
+    objective = value(power_system.objective)
+    user_config.lagrangian = True
+    power_system, times = solve_commitment()
+    assert power_system.lagrangian
+    assert round(objective - value(power_system.objective), 5) == 0
+    for t, load in zip(times, [80, 150, 190]):
+        total = sum(value(gen.power(t)) for gen in power_system.generators())
+        assert round(total - load, 5) == 0
+
+@istest
+def lagrangian_repair_min_up():
+    '''
+    Repair a commitment which is short of capacity at one time.
+    The cheaper unit can't start until later (initial down time),
+    so the other unit is started.
+    Ensure that the started unit stays on for its min up time.
+    '''
+    def make_unit(cost, initial_remaining=0):
+        return dict(points=np.array([10., 100.]),
+            costs=cost * np.array([10., 100.]), pmax=100.,
+            min_up=3, min_down=0, initial_status=False,
+            initial_remaining=initial_remaining,
+            startupcost=0, shutdowncost=0)
+    units = [make_unit(1, initial_remaining=4), make_unit(2)]
+    status = [np.zeros(6, dtype=int), np.zeros(6, dtype=int)]
+    required = np.array([0, 0, 50, 0, 0, 0])
+    repaired = lagrangian.repair_commitment(units, status, required)
+    assert repaired[0].tolist() == [0] * 6
+    assert repaired[1].tolist() == [0, 0, 1, 1, 1, 0]
+
+@istest
+@with_setup(teardown=reset_config)
+def warmstart_next_stage():
+    '''
+    Store the (set) solution of a stage with two hours of overlap.
+    Ensure that the next stage's status and power start values are
+    the stored overlap values, with the last value extended to
+    the later times.
+    '''
+    user_config.warmstart = True
+    generators = [make_cheap_gen(pmax=100)]
+    generators[0].set_initial_condition()
+    loads_times = make_loads_times(Pdt=[80, 90, 100, 110, 120, 130])
+    stage_times = loads_times['times'].subdivide(2, 2)
+    power_system = powersystems.PowerSystem(
+        generators, loads_times['loads'], [])
+
+    first, second = stage_times[0], stage_times[1]
+    solve.create_problem(power_system, first)
+    gen = power_system.generators()[0]
+    for t, (status, power) in zip(first,
+            [(1, 80), (1, 90), (0, 0), (1, 60)]):
+        gen.status(t).value = status
+        gen.power(t).value = power
+    power_system.store_warmstart(first)
+
+    power_system.reset_model()
+    solve.create_problem(power_system, second)
+    power_system.set_warmstart(second)
+    assert power_system.has_start_values
+    assert [gen.status(t).value for t in second] == [0, 1, 1, 1]
+    assert [gen.power(t).value for t in second] == [0, 60, 60, 60]
+
 @istest
 @with_setup(teardown=reset_config)
 def reserve_fixed_amount():
@@ -103,13 +103,13 @@ def solve_problem(generators, loads=None, times=None,
     solve.create_problem(power_system, times)
 
     try:
-        instance = power_system.solve()
+        instance = power_system.solve_network(times)
     except OptimizationError:
         # re-do stage, with load shedding allowed
         logging.critical('stage infeasible, re-running with load shedding.')
         power_system.allow_shedding(times)
         try:
-            instance = power_system.solve()
+            instance = power_system.solve_network(times)
         except OptimizationError:
             scheduled, committed = power_system.debug_infeasibe(times)
             power_system.write_model('infeasible.lp')
@@ -16,6 +16,7 @@ install_requires=[
     'Coopr>=3.3.7114',
     'numpy>=1.6.1',
     'pandas>=0.10',
+    'scipy>=0.11',
     ]
     
 if python_version[0] == 2 and python_version[1] < 7: